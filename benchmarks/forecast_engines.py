@@ -0,0 +1,118 @@
+""" This script compares the accuracy and the speed of the forecasting engines of Agros.
+For each engine, the 30-year forecasts of all countries are timed, and a rolling-origin
+backtest measures the errors of the forecasts of the years after each cutoff. The data is
+a synthetic panel, or the 'downloads' folder of a given folder with the real dataset.
+The ARIMA engine runs without a model store, so every order search is measured.
+
+Usage:
+    python benchmarks/forecast_engines.py --scale 1 --start 2005 --end 2014 --horizon 5
+    python benchmarks/forecast_engines.py --folder . --countries 20 --json engines.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+from synthetic import generate_panel
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python_files")
+)
+
+from agros_class import Agros  # pylint: disable=wrong-import-position
+from agros_forecast import FORECAST_ENGINES  # pylint: disable=wrong-import-position
+
+
+def compare_engines(agros: Agros, countries: list, args):
+    """Forecasts and backtests the countries with every engine and returns the results."""
+    results = {}
+    for engine in args.engine or list(FORECAST_ENGINES):
+        start = time.perf_counter()
+        forecast_df = agros.forecast(
+            countries, n_periods=30, workers=args.workers, engine=engine
+        )
+        forecast_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        metrics_df, _ = agros.backtest(
+            countries,
+            start=args.start,
+            end=args.end,
+            horizon=args.horizon,
+            workers=args.workers,
+            engine=engine,
+        )
+        backtest_seconds = time.perf_counter() - start
+
+        results[engine] = {
+            "countries": len(countries),
+            "forecasted": int(forecast_df["Entity"].nunique()),
+            "forecast_seconds": forecast_seconds,
+            "backtest_seconds": backtest_seconds,
+            "mae": float(metrics_df["mae"].median()),
+            "rmse": float(metrics_df["rmse"].median()),
+            "mape": float(metrics_df["mape"].median()),
+        }
+        print(
+            f"{engine:>10}: forecast {forecast_seconds:8.2f} s, "
+            f"backtest {backtest_seconds:8.2f} s, median mae {results[engine]['mae']:7.3f}, "
+            f"rmse {results[engine]['rmse']:7.3f}, mape {results[engine]['mape']:6.2f} %"
+        )
+    return results
+
+
+def main():
+    """Runs the comparison on a synthetic panel or on the data of a folder."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--folder",
+        help="folder with 'downloads/download.csv', a synthetic panel if None",
+    )
+    parser.add_argument("--scale", type=int, default=1, help="factor on the countries")
+    parser.add_argument(
+        "--countries", type=int, help="number of countries compared, all by default"
+    )
+    parser.add_argument(
+        "--engine",
+        action="append",
+        choices=list(FORECAST_ENGINES),
+        help="engine to compare, all engines by default",
+    )
+    parser.add_argument("--start", type=int, default=2005, help="first cutoff year")
+    parser.add_argument("--end", type=int, default=2014, help="last cutoff year")
+    parser.add_argument("--horizon", type=int, default=5, help="years per forecast")
+    parser.add_argument("--workers", type=int, help="worker processes of ARIMA")
+    parser.add_argument("--json", help="file to write the results to")
+    args = parser.parse_args()
+
+    json_path = None if args.json is None else os.path.abspath(args.json)
+    with tempfile.TemporaryDirectory(prefix="agros-engines-") as folder:
+        if args.folder is None:
+            os.makedirs(os.path.join(folder, "downloads"))
+            generate_panel(args.scale).to_csv(
+                os.path.join(folder, "downloads", "download.csv"), index=False
+            )
+        else:
+            folder = args.folder
+        os.chdir(folder)
+
+        agros = Agros()
+        agros.model_store = None
+        agros.download_data()
+        countries = agros.list_countries()[: args.countries]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            results = compare_engines(agros, countries, args)
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+""" This script benchmarks every method of the Agros class on synthetic panels.
+For each scale, a synthetic 'download.csv' is generated in a temporary folder and
+every method runs in a fresh Python process, which reports the wall time of the
+method, the time of loading the data before it and the peak memory of the process.
+The charts are rendered headless with Agros.render, so no display is needed and
+the timings include the drawing. The country polygons of the choropleth are cached
+once before the scales, from geopandas or Natural Earth, or as synthetic polygons
+when offline, so the choropleth measures rendering and not the download.
+The results are written as JSON and can be compared with the results of an
+earlier version to catch regressions.
+
+Usage:
+    python benchmarks/methods.py --scale 1 --scale 10 --json methods.json
+    python benchmarks/methods.py --compare methods.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from synthetic import COUNTRIES, generate_panel
+
+PYTHON_FILES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "python_files"
+)
+
+# the setup loads the cached data, the call is the measured statement
+METHODS = {
+    "download_data": ("", "agros.download_data(use_cache=False)"),
+    "download_data cached": ("", "agros.download_data()"),
+    "list_countries": ("agros.download_data()", "agros.list_countries()"),
+    "area_graph": (
+        "agros.download_data()",
+        "agros.render('area_graph', 'World', True)",
+    ),
+    "compare_output": (
+        "agros.download_data()",
+        "agros.render('compare_output', *agros.list_countries()[:3])",
+    ),
+    "gapminder": ("agros.download_data()", "agros.render('gapminder', 2000)"),
+    "choropleth": (
+        "agros.download_data()\nagros.geometry",
+        "agros.render('choropleth', 2000)",
+    ),
+    "correlate_quantity": (
+        "agros.download_data()",
+        "agros.render('correlate_quantity')",
+    ),
+    "predictor": (
+        "agros.download_data()",
+        "agros.render('predictor', agros.list_countries()[:3])",
+    ),
+}
+
+RUNNER = """
+import json, resource, sys, time
+sys.path.insert(0, {python_files!r})
+import agros_class
+agros = agros_class.Agros()
+agros.model_store = None
+start = time.perf_counter()
+{setup}
+loaded = time.perf_counter()
+{call}
+elapsed = time.perf_counter() - loaded
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+print(json.dumps({{"seconds": elapsed, "setup_seconds": loaded - start, "peak_mb": peak_mb}}))
+"""
+
+
+def run_method(name: str, folder: str):
+    """
+    Runs one method in a new Python process inside the folder of a panel.
+    Returns its measurements, or the error if the method failed.
+    """
+    setup, call = METHODS[name]
+    code = RUNNER.format(python_files=PYTHON_FILES, setup=setup, call=call)
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=False,
+        cwd=folder,
+        env={**os.environ, "MPLBACKEND": "Agg"},
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def seed_geometry(directory: str):
+    """
+    Caches the country polygons in a folder, from geopandas or Natural Earth.
+    Without both, e.g. offline, a grid of squares named like the countries of the
+    synthetic panels is cached instead, which is drawn in about the same time.
+    """
+    sys.path.insert(0, PYTHON_FILES)
+    # pylint: disable=import-outside-toplevel
+    import shapely
+    from agros_geometry import GeometryStore, load_geometry, write_geometry
+
+    try:
+        load_geometry(directory)
+    except OSError as error:
+        print(f"Polygons can't be loaded ({error}), using synthetic polygons")
+        corners = [
+            (-180 + 24 * (i % 15), -60 + 24 * (i // 15)) for i in range(len(COUNTRIES))
+        ]
+        boxes = [shapely.box(x, y, x + 20, y + 20) for x, y in corners]
+        store = GeometryStore(
+            COUNTRIES,
+            [x[:3].upper() for x in COUNTRIES],
+            ["World"] * len(COUNTRIES),
+            boxes,
+        )
+        write_geometry(store, directory, "synthetic")
+
+
+def benchmark_scale(
+    scale: int, year_scale: int, methods: list, repeat: int, geometry: str = None
+):
+    """Generates the panel of a scale and benchmarks the methods on it."""
+    with tempfile.TemporaryDirectory(prefix="agros-bench-") as folder:
+        os.makedirs(os.path.join(folder, "downloads"))
+        if geometry is not None:
+            shutil.copytree(geometry, os.path.join(folder, "downloads", "geometry"))
+        panel_df = generate_panel(scale, year_scale)
+        panel_df.to_csv(os.path.join(folder, "downloads", "download.csv"), index=False)
+        # build the binary cache once, so the setups load the cached data
+        run_method("download_data cached", folder)
+
+        results = {"rows": len(panel_df), "entities": panel_df["Entity"].nunique()}
+        for name in methods:
+            runs = [run_method(name, folder) for _ in range(repeat)]
+            errors = [run["error"] for run in runs if "error" in run]
+            if errors:
+                results[name] = {"error": errors[-1]}
+                print(f"{scale:>4}x {name:>20}: failed, {errors[-1]}")
+                continue
+
+            results[name] = {
+                "seconds": statistics.median(run["seconds"] for run in runs),
+                "setup_seconds": statistics.median(
+                    run["setup_seconds"] for run in runs
+                ),
+                "peak_mb": max(run["peak_mb"] for run in runs),
+            }
+            print(
+                f"{scale:>4}x {name:>20}: {results[name]['seconds']:8.3f} s "
+                f"{results[name]['peak_mb']:8.1f} MB"
+            )
+        return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    Prints the ratio of each time to the baseline and returns the regressions,
+    the methods that became slower than the baseline by more than the tolerance.
+    """
+    regressions = []
+    for scale, methods in results["scales"].items():
+        for name, result in methods.items():
+            old = baseline.get("scales", {}).get(scale, {}).get(name)
+            if not isinstance(result, dict) or not isinstance(old, dict):
+                continue
+            if "seconds" not in result or "seconds" not in old:
+                continue
+            ratio = result["seconds"] / max(old["seconds"], 1e-9)
+            flag = ""
+            # differences of a few milliseconds are noise, whatever the ratio
+            if ratio > 1 + tolerance and result["seconds"] - old["seconds"] > 0.005:
+                regressions.append(f"{scale}x {name}")
+                flag = "  <- regression"
+            print(f"{scale:>4}x {name:>20}: {ratio:6.2f} x baseline{flag}")
+    return regressions
+
+
+def main():
+    """Runs the benchmarks of all scales and writes or compares the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scale",
+        type=int,
+        action="append",
+        help="factor on the countries, 1, 10 and 100 by default",
+    )
+    parser.add_argument(
+        "--year-scale", type=int, default=1, help="factor on the years of every panel"
+    )
+    parser.add_argument(
+        "--method",
+        action="append",
+        choices=list(METHODS),
+        help="method to benchmark, all methods by default",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs per method")
+    parser.add_argument("--json", help="file to write the results to")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="relative slowdown reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "year_scale": args.year_scale,
+        "scales": {},
+    }
+    methods = args.method or list(METHODS)
+    with tempfile.TemporaryDirectory(prefix="agros-geometry-") as geometry:
+        if "choropleth" in methods:
+            seed_geometry(geometry)
+        for scale in args.scale or [1, 10, 100]:
+            results["scales"][str(scale)] = benchmark_scale(
+                scale, args.year_scale, methods, args.repeat, geometry
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+""" This script measures the startup cost of the Agros class.
+Every scenario runs in a fresh Python process, which reports its wall time and peak
+memory and which heavy dependencies it has imported. The scenarios range from a bare
+import, over loading and listing the data, to rendering a chart and fitting a forecast.
+The 'eager imports' scenario imports all heavy dependencies upfront, as the Agros module
+used to, for comparison.
+
+Usage (from the folder containing 'downloads/download.csv'):
+    python benchmarks/startup.py --repeat 5 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PYTHON_FILES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "python_files"
+)
+
+HEAVY_MODULES = [
+    "geopandas",
+    "seaborn",
+    "matplotlib",
+    "requests",
+    "pmdarima",
+    "statsmodels",
+    "sklearn",
+]
+
+SCENARIOS = {
+    "interpreter": "",
+    "import": "import agros_class",
+    "eager imports": (
+        "import agros_class\n"
+        "import geopandas, seaborn, matplotlib.pyplot, requests\n"
+        "from pmdarima.arima import auto_arima"
+    ),
+    "load data": (
+        "import agros_class\n"
+        "agros = agros_class.Agros()\n"
+        "agros.download_data()\n"
+        "agros.list_countries()"
+    ),
+    "plotting": (
+        "import agros_class\n"
+        "agros = agros_class.Agros()\n"
+        "agros.download_data()\n"
+        "agros.render('area_graph', 'World', False)"
+    ),
+    "forecasting": (
+        "import agros_class\n"
+        "agros = agros_class.Agros()\n"
+        "agros.download_data()\n"
+        "agros.model_store = None\n"
+        "agros.forecast(agros.list_countries()[:1], workers=1)"
+    ),
+}
+
+RUNNER = """
+import json, resource, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {python_files!r})
+{body}
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "peak_mb": peak_mb, "heavy": heavy}}))
+"""
+
+
+def run_scenario(body: str):
+    """Runs one scenario in a new Python process and returns its measurements."""
+    code = RUNNER.format(python_files=PYTHON_FILES, body=body, heavy=HEAVY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "MPLBACKEND": "Agg"},
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    """Runs all scenarios and prints a table of the median time and peak memory."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario")
+    parser.add_argument("--json", help="file to write the results to")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="scenario to run, all scenarios by default",
+    )
+    args = parser.parse_args()
+
+    has_data = os.path.isfile(os.path.join("downloads", "download.csv"))
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        if "download_data" in SCENARIOS[name] and not has_data:
+            print(f"{name:>15}: skipped, no downloads/download.csv in this folder")
+            continue
+        runs = [run_scenario(SCENARIOS[name]) for _ in range(args.repeat)]
+        results[name] = {
+            "seconds": statistics.median(run["seconds"] for run in runs),
+            "peak_mb": max(run["peak_mb"] for run in runs),
+            "heavy": runs[-1]["heavy"],
+        }
+        print(
+            f"{name:>15}: {results[name]['seconds']:7.3f} s "
+            f"{results[name]['peak_mb']:8.1f} MB  "
+            f"imports: {', '.join(results[name]['heavy']) or '-'}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
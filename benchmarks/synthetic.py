@@ -0,0 +1,183 @@
+""" This script generates synthetic agricultural panels for the benchmarks.
+The panels have the schema of 'downloads/download.csv': an Entity and a Year column,
+the total factor productivity and the quantity columns. At scale 1 the panel has
+about as many countries and years as the real dataset. Larger scales add copies of
+the countries and, with a year scale, extend the years past 2019. Some aggregate
+regions are included, so the cleaning of the data is measured too.
+
+Usage:
+    python benchmarks/synthetic.py panel.csv --scale 10
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# countries spelled like in the dataset and, where needed, mapped by merge_dict
+COUNTRIES = [
+    "Algeria",
+    "Argentina",
+    "Australia",
+    "Austria",
+    "Bangladesh",
+    "Belgium",
+    "Bolivia",
+    "Bosnia and Herzegovina",
+    "Brazil",
+    "Bulgaria",
+    "Canada",
+    "Central African Republic",
+    "Chile",
+    "China",
+    "Colombia",
+    "Cyprus",
+    "Democratic Republic of Congo",
+    "Denmark",
+    "Dominican Republic",
+    "Egypt",
+    "Equatorial Guinea",
+    "Eswatini",
+    "Ethiopia",
+    "Finland",
+    "France",
+    "Germany",
+    "Ghana",
+    "Greece",
+    "Hungary",
+    "India",
+    "Indonesia",
+    "Iran",
+    "Ireland",
+    "Italy",
+    "Japan",
+    "Kenya",
+    "Mexico",
+    "Morocco",
+    "Netherlands",
+    "New Zealand",
+    "Nigeria",
+    "Norway",
+    "Pakistan",
+    "Peru",
+    "Philippines",
+    "Poland",
+    "Portugal",
+    "Romania",
+    "Solomon Islands",
+    "Somalia",
+    "South Africa",
+    "South Sudan",
+    "Spain",
+    "Sweden",
+    "Thailand",
+    "Timor",
+    "Turkey",
+    "United Kingdom",
+    "United States",
+    "Vietnam",
+]
+
+# aggregate regions, which download_data drops
+AGGREGATES = ["World", "Asia", "High income", "Sub-Saharan Africa"]
+
+QUANTITY_COLUMNS = [
+    "ag_land_quantity",
+    "labor_quantity",
+    "capital_quantity",
+    "machinery_quantity",
+    "livestock_quantity",
+    "fertilizer_quantity",
+    "animal_feed_quantity",
+    "cropland_quantity",
+    "pasture_quantity",
+    "irrigation_quantity",
+]
+
+COLUMNS = [
+    "Entity",
+    "Year",
+    "tfp",
+    "output",
+    "output_quantity",
+    "crop_output_quantity",
+    "animal_output_quantity",
+    "fish_output_quantity",
+    *QUANTITY_COLUMNS,
+]
+
+
+def generate_panel(scale: int = 1, year_scale: int = 1, seed: int = 0):
+    """
+    Generates a synthetic panel with the columns of the agricultural dataset.
+
+    Parameters
+    ---------------
+    scale: int
+        factor on the number of countries, the real countries are copied with a suffix
+
+    year_scale: int
+        factor on the number of years, which start in 1961
+
+    seed: int
+        seed of the random numbers
+
+    Returns
+    ---------------
+    panel_df: Pandas DataFrame
+        one row per entity and year, sorted like the downloaded csv file
+    """
+    if scale < 1 or year_scale < 1:
+        raise ValueError("The scales must be at least 1.")
+
+    rng = np.random.default_rng(seed)
+    copies = [COUNTRIES] + [[f"{x} {i}" for x in COUNTRIES] for i in range(1, scale)]
+    entities = np.array(sorted([x for names in copies for x in names] + AGGREGATES))
+    years = np.arange(1961, 1961 + 59 * year_scale)
+    n_entities, n_years = len(entities), len(years)
+
+    # tfp is a random walk with drift around 100, the quantities grow log-linearly
+    tfp = 100 + np.cumsum(rng.normal(0.8, 2.0, (n_entities, n_years)), axis=1)
+    size = rng.lognormal(13, 1.5, (n_entities, 1))
+    growth = np.exp(np.cumsum(rng.normal(0.02, 0.03, (n_entities, n_years)), axis=1))
+
+    def quantity(share):
+        noise = rng.lognormal(0, 0.1, (n_entities, n_years))
+        return (size * share * growth * noise).ravel()
+
+    crop = quantity(0.5)
+    animal = quantity(0.4)
+    fish = quantity(0.1)
+    panel = {
+        "Entity": np.repeat(entities, n_years),
+        "Year": np.tile(years, n_entities),
+        "tfp": tfp.ravel(),
+        "output": quantity(1.2),
+        "output_quantity": crop + animal + fish,
+        "crop_output_quantity": crop,
+        "animal_output_quantity": animal,
+        "fish_output_quantity": fish,
+    }
+    for column in QUANTITY_COLUMNS:
+        panel[column] = quantity(rng.uniform(0.1, 2.0))
+    return pd.DataFrame(panel, columns=COLUMNS)
+
+
+def main():
+    """Writes a synthetic panel to a csv file."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="csv file to write")
+    parser.add_argument("--scale", type=int, default=1, help="factor on the countries")
+    parser.add_argument("--year-scale", type=int, default=1, help="factor on the years")
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the random numbers"
+    )
+    args = parser.parse_args()
+
+    generate_panel(args.scale, args.year_scale, args.seed).to_csv(
+        args.path, index=False
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+""" This module contains the animation export of the Agros class.
+The choropleth and the gapminder chart of a whole range of years are rendered
+as frames of one animation. The figure and its artists are built once per worker
+and only their data is updated from frame to frame. The frames are rendered
+across a process pool and saved as a GIF, an MP4 video or a sequence of PNG files.
+"""
+
+# matplotlib and Pillow are only imported once an animation is exported
+# pylint: disable=import-outside-toplevel
+
+import copy
+import io
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+SOURCE = "Source:Agricultural total factor productivity (USDA), Our World in Data 2021"
+
+
+class ChoroplethFrames:
+    """
+    The frames of an animated choropleth of the total factor productivity.
+
+    Attributes
+    ---------------
+    geometry_df: Geopandas df
+        the country polygons, one row per country
+
+    values: numpy array
+        the tfp of each country (rows) and year (columns)
+
+    years: list
+        the year of each frame
+
+    figsize: tuple
+        width and height of the figure in inches
+    """
+
+    def __init__(self, geometry_df, values: np.ndarray, years: list):
+        self.geometry_df = geometry_df.reset_index(drop=True)
+        self.values = values
+        self.years = years
+        self.figsize = (20, 10)
+        self._collection = None
+        self._title = None
+        self._parts = None
+
+    def setup(self, figure):
+        """Draws the polygons, the colorbar and the labels once."""
+        # plot single polygons only, so every path of the collection maps to one country
+        exploded_df = self.geometry_df.explode(index_parts=False)
+        self._parts = exploded_df.index.to_numpy()
+
+        from matplotlib import colormaps
+
+        cmap = colormaps["viridis"].copy()
+        # countries without a value in a year are not drawn, like in the choropleth
+        cmap.set_bad((0, 0, 0, 0))
+
+        axis = figure.add_subplot()
+        exploded_df.assign(tfp=0.0).plot(
+            column="tfp",
+            ax=axis,
+            cmap=cmap,
+            legend=True,
+            vmin=50,
+            vmax=250,
+            legend_kwds={"label": "Total Factor Productivity"},
+        )
+        self._collection = axis.collections[0]
+        self._title = axis.set_title("")
+        axis.text(0, -0.25, SOURCE, ha="left", fontsize=10, transform=axis.transAxes)
+
+    def update(self, frame: int):
+        """Colors the polygons with the tfp of one frame."""
+        values = self.values[self._parts, frame]
+        self._collection.set_array(np.ma.masked_invalid(values))
+        self._title.set_text(f"Total Factor Productivity in {self.years[frame]}")
+
+
+class GapminderFrames:
+    """
+    The frames of an animated gapminder chart.
+
+    Attributes
+    ---------------
+    fertilizer: numpy array
+        the fertilizer quantity of each country (rows) and year (columns)
+
+    output: numpy array
+        the output quantity of each country and year
+
+    labor: numpy array
+        the labor quantity of each country and year
+
+    years: list
+        the year of each frame
+
+    figsize: tuple
+        width and height of the figure in inches
+    """
+
+    def __init__(
+        self,
+        fertilizer: np.ndarray,
+        output: np.ndarray,
+        labor: np.ndarray,
+        years: list,
+    ):
+        self.fertilizer = fertilizer
+        self.output = output
+        self.labor = labor
+        self.years = years
+        self.figsize = (10, 6)
+        self._scatter = None
+        self._title = None
+
+    def _sizes(self, frame: int):
+        """Maps the labor quantity to dot areas between 100 and 700, like the gapminder."""
+        low, high = np.nanmin(self.labor), np.nanmax(self.labor)
+        scale = (self.labor[:, frame] - low) / (high - low if high > low else 1)
+        return 100 + 600 * np.nan_to_num(scale)
+
+    def setup(self, figure):
+        """Draws the axes, the dots and the labels once, with fixed axis limits."""
+        axis = figure.add_subplot()
+        axis.set(
+            xlabel="Fertilizer Quantity (in tons)",
+            ylabel="Output Quantity (in 1000$)",
+            xscale="log",
+            yscale="log",
+        )
+        x_values = self.fertilizer[self.fertilizer > 0]
+        y_values = self.output[self.output > 0]
+        if x_values.size > 0 and y_values.size > 0:
+            axis.set_xlim(x_values.min() / 1.5, x_values.max() * 1.5)
+            axis.set_ylim(y_values.min() / 1.5, y_values.max() * 1.5)
+        self._scatter = axis.scatter(
+            self.fertilizer[:, 0], self.output[:, 0], s=self._sizes(0), alpha=0.5
+        )
+        self._title = axis.set_title("")
+        axis.text(0, -0.15, SOURCE, ha="left", fontsize=10, transform=axis.transAxes)
+
+    def update(self, frame: int):
+        """Moves and resizes the dots to the data of one frame."""
+        self._scatter.set_offsets(
+            np.column_stack((self.fertilizer[:, frame], self.output[:, frame]))
+        )
+        self._scatter.set_sizes(self._sizes(frame))
+        self._title.set_text(
+            f"Fertilizer, Output and Labor Quantity in {self.years[frame]}"
+        )
+
+
+def render_frames(frames, indices: list, dpi: int = 100):
+    """
+    Renders some frames of an animation as PNG images.
+    The figure is set up once and only updated for each frame.
+
+    Parameters
+    ---------------
+    frames: ChoroplethFrames or GapminderFrames
+        the animation to render
+
+    indices: list
+        the positions of the frames to render
+
+    dpi: int
+        resolution of the images
+
+    Returns
+    ---------------
+    images: list
+        the PNG bytes of each frame
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # the artists are kept on a copy, so the animation itself stays picklable
+    frames = copy.copy(frames)
+    figure = Figure(figsize=frames.figsize)
+    FigureCanvasAgg(figure)
+    frames.setup(figure)
+    # keep the same layout in every frame, with room for the source below the axes
+    figure.subplots_adjust(bottom=0.2)
+
+    images = []
+    for frame in indices:
+        frames.update(frame)
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png", dpi=dpi)
+        images.append(buffer.getvalue())
+    return images
+
+
+def render_animation(frames, workers: int = None, dpi: int = 100):
+    """
+    Renders all frames of an animation across a process pool.
+    Each worker renders a contiguous block of frames on its own figure.
+
+    Parameters
+    ---------------
+    frames: ChoroplethFrames or GapminderFrames
+        the animation to render
+
+    workers: int
+        number of worker processes, defaults to the number of CPUs.
+        With one worker the frames are rendered in the current process
+
+    dpi: int
+        resolution of the images
+
+    Returns
+    ---------------
+    images: list
+        the PNG bytes of each frame, in order
+    """
+    n_frames = len(frames.years)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, n_frames))
+
+    blocks = [list(block) for block in np.array_split(np.arange(n_frames), workers)]
+    if workers == 1:
+        return render_frames(frames, blocks[0], dpi)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            render_frames, [frames] * workers, blocks, [dpi] * workers
+        )
+        return [image for images in results for image in images]
+
+
+def save_animation(images: list, path: str, fmt: str, years: list, fps: float = 4):
+    """
+    Saves rendered frames as a GIF, an MP4 video or a folder of PNG files.
+
+    Parameters
+    ---------------
+    images: list
+        the PNG bytes of each frame
+
+    path: str
+        the file to write, or the folder of the PNG files
+
+    fmt: str
+        one of 'gif', 'mp4' and 'png'
+
+    years: list
+        the year of each frame, used for the PNG file names
+
+    fps: float
+        frames per second of the GIF and the video
+    """
+    if len(images) == 0:
+        raise ValueError("An animation needs at least one frame.")
+
+    if fmt == "png":
+        os.makedirs(path, exist_ok=True)
+        for year, image in zip(years, images):
+            with open(os.path.join(path, f"frame_{year}.png"), "wb") as file:
+                file.write(image)
+
+    elif fmt == "gif":
+        from PIL import Image
+
+        pictures = [Image.open(io.BytesIO(image)) for image in images]
+        pictures[0].save(
+            path,
+            save_all=True,
+            append_images=pictures[1:],
+            duration=int(1000 / fps),
+            loop=0,
+        )
+
+    elif fmt == "mp4":
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError(
+                "ffmpeg is needed to save an MP4 video, but wasn't found"
+            )
+        command = [
+            ffmpeg,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "image2pipe",
+            "-framerate",
+            str(fps),
+            "-i",
+            "-",
+            # the h264 encoder needs even frame sizes
+            "-vf",
+            "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-pix_fmt",
+            "yuv420p",
+            path,
+        ]
+        subprocess.run(command, input=b"".join(images), check=True)
+
+    else:
+        raise ValueError("Variable 'fmt' must be one of gif, mp4 and png.")
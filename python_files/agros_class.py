@@ -9,15 +9,52 @@ Lastly, an ARIMA prediction for the total factor productivity is applied and the
 including the prediction is plotted.
 """
 
+# geopandas, seaborn and matplotlib are imported by the methods that need them,
+# so that loading and querying the data doesn't pay for their import
+# pylint: disable=import-outside-toplevel
+
 import warnings
 import os
-import requests
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import geopandas as gpd
 import numpy as np
-from pmdarima.arima import auto_arima
+from agros_animation import (
+    ChoroplethFrames,
+    GapminderFrames,
+    render_animation,
+    save_animation,
+)
+from agros_correlation import CorrelationEngine
+from agros_density import DENSITY_BINS, density_raster, draw_density
+from agros_data import (
+    PartitionedStore,
+    compact_frame,
+    read_frame,
+    source_signature,
+    write_frame,
+    write_partitions,
+)
+from agros_diagnostics import adf_test, kpss_test, rolling_statistics
+from agros_download import DATA_URL, fetch, make_session
+from agros_geometry import GEOMETRY_URL, GeometryStore, load_geometry
+from agros_forecast import (
+    FORECAST_ENGINES,
+    backtest_countries,
+    backtest_metrics,
+    fit_stored,
+    forecast_countries,
+    statespace_backtest,
+    statespace_countries,
+)
+from agros_instrument import Instrumentation
+from agros_panel import Panel
+from agros_regions import (
+    WORLD,
+    AggregateEngine,
+    aggregate_names,
+    read_membership,
+)
+from agros_render import RenderCache, freeze, render_figure
+from agros_report import ReportPipeline
 
 warnings.filterwarnings("ignore")
 
@@ -29,13 +66,53 @@ class Agros:
     Attributes
     ---------------
     data_df: Pandas Dataframe
-        dataframe where the downloaded agricultural data can be loaded into
+        dataframe where the downloaded agricultural data can be loaded into.
+        It stays empty when the data is loaded out of core into the store
+
+    store: PartitionedStore
+        on-disk store of the data when it is loaded in chunks, None otherwise
+
+    panel: Panel
+        compact float32 entity by year arrays of the metrics, built on first use
+
+    membership: Pandas DataFrame
+        the countries of every region and group of countries, read from 'regions.csv'
+        on first use. The groups are dropped from the downloaded data and aggregated
+        from their countries instead
 
     merge_dict: dict
-        a dictionary in order to change the spelling for some countries to allow merging
+        a dictionary in order to change the spelling for some countries to allow merging.
+        Other spellings, like abbreviations, are matched by the geometry store
+
+    geometry: GeometryStore
+        the country polygons with a spatial index and a name resolver, loaded on first use
+        from the cache in 'downloads/geometry'
 
     geopandas_df: Geopandas df
-        a geopandas dataframe where geo dataset with country-level polygons can be loaded into
+        a geopandas dataframe of the country-level polygons of the geometry store.
+        Setting it replaces the polygons of the geometry store
+
+    geometry_url: str
+        address of the zipped Natural Earth countries, downloaded when geopandas
+        doesn't bundle them
+
+    data_url: str
+        address of the agricultural dataset, can point to a mirror or a local server
+
+    session: requests.Session
+        pooled and retrying session used for the downloads, created on the first download
+
+    model_store: ModelStore
+        on-disk store of the fitted ARIMA models, None by default, so the full
+        order search always runs. Set it to ModelStore() to reuse the models
+        from 'downloads/models'
+
+    render_cache: RenderCache
+        least recently used cache of the images returned by render
+
+    instrumentation: Instrumentation
+        records the timings of the stages of the methods once it is enabled,
+        e.g. with agros.instrumentation.enable(print)
 
 
     Methods
@@ -47,6 +124,12 @@ class Agros:
     list_countries
         list all the available countries of the dataset
 
+    list_regions
+        lists the regions and groups of countries that can be used like countries
+
+    region_aggregates
+        returns the yearly output totals and output-weighted tfp of regions
+
     correlate_quantity
         provides a correlation heatmap of the quality columns
 
@@ -65,10 +148,53 @@ class Agros:
     predictor
         applies an ARIMA prediction for the total factor productivity and
         plots the data including the prediction
+
+    forecast
+        forecasts the total factor productivity of many countries in parallel
+        and returns the forecasts as a DataFrame
+
+    render
+        renders the chart of a plotting method without a display and returns
+        the image as PNG or SVG bytes
+
+    export_animation
+        renders the choropleth or the gapminder chart of a range of years
+        as an animation
+
+    report
+        runs a list of plotting and forecast steps into a folder, rendering again
+        only the steps whose data changed
     """
 
+    # plotting methods that can be rendered, with the method drawing their chart
+    _RENDERERS = {
+        "area_graph": "_draw_area_graph",
+        "compare_output": "_draw_compare_output",
+        "gapminder": "_draw_gapminder",
+        "choropleth": "_draw_choropleth",
+        "correlate_quantity": "_draw_correlate_quantity",
+        "predictor": "_draw_predictor",
+    }
+
+    # output columns of the area graph, shown as shares of output_quantity when normalized
+    _OUTPUT_COLUMNS = [
+        "crop_output_quantity",
+        "animal_output_quantity",
+        "fish_output_quantity",
+    ]
+
+    # number of points above which gapminder and compare_output draw density rasters
+    _DENSITY_POINTS = 5000
+
+    # figure sizes of the plotting methods, the matplotlib default otherwise
+    _FIGSIZES = {"gapminder": (10, 6), "choropleth": (20, 10), "predictor": (15, 7)}
+
     def __init__(self):
-        self.data_df = pd.DataFrame
+        self.data_df = pd.DataFrame()
+        self.store = None
+        self._chunksize = None
+        self._panel = None
+        self._panel_source = None
         self.merge_dict = {
             "United States of America": "United States",
             "Dem. Rep. Congo": "Democratic Republic of Congo",
@@ -83,71 +209,461 @@ class Agros:
             "S. Sudan": "South Sudan",
             "Central African Rep.": "Central African Republic",
         }
-        self.geopandas_df = gpd.GeoDataFrame
-
-    def download_data(self):
+        self._geometry = None
+        self.geometry_url = GEOMETRY_URL
+        self.data_url = DATA_URL
+        self.session = None
+        self.model_store = None
+        self._indexed_df = None
+        self._entity_slices = {}
+        self._country_list = []
+        self._country_set = frozenset()
+        self._outputs_source = None
+        self._output_df = None
+        self._share_df = None
+        self._group_slices = {}
+        self._membership = None
+        self._aggregate_engine = None
+        self._correlation_source = None
+        self._correlation_engines = {}
+        self.render_cache = RenderCache()
+        self.instrumentation = Instrumentation()
+        self._rendered_df = None
+        self._geometry_source = None
+        self._geometry_df = None
+        self._geometry_rows = np.empty(0, dtype=int)
+        self._simplified_geometry = {}
+
+    def download_data(
+        self, use_cache: bool = True, refresh: bool = False, chunksize: int = None
+    ):
         """
         Creates a 'downloads' folder, if it doesn't exist.
         Downloads agricultural data from Github repository and saves it to this folder,
         in case it is not already downloaded.
+        The data is streamed to a partial file and renamed into place once complete,
+        so an interrupted download is resumed instead of leaving a corrupt file.
+        With refresh, an existing download is revalidated with its ETag and
+        Last-Modified date and only downloaded again if it changed upstream.
         It also creates Pandas Dataframe from the downloaded csv file.
         It also cleans the data so that aggregated rows (like Asia) are excluded.
+        The cleaned data is cached in 'downloads/cache' as memory-mapped NumPy arrays
+        with compact dtypes, so later loads skip parsing the csv file until it changes.
+        With a chunksize, the csv file is read, cleaned and compacted in chunks into
+        a partitioned store in 'downloads/store' instead, which all methods query lazily,
+        so the memory needed doesn't grow with the size of the data.
+
+        Parameters
+        ---------------
+        use_cache: boolean
+            whether the binary cache should be read and written
+
+        refresh: boolean
+            whether an existing download should be checked for updates
+
+        chunksize: int
+            number of csv rows per chunk and partition, loads the data into memory if None
         """
         if not os.path.exists("downloads"):
             os.makedirs("downloads")
 
-        exists = os.path.isfile("downloads/download.csv")
+        needs_request = refresh or not os.path.isfile("downloads/download.csv")
+        if needs_request and self.session is None:
+            self.session = make_session()
+        with self.instrumentation.stage("download_data", "fetch") as stage:
+            stage.info = {
+                "changed": fetch(
+                    self.data_url,
+                    "downloads/download.csv",
+                    session=self.session,
+                    refresh=refresh,
+                )
+            }
+
+        signature = source_signature("downloads/download.csv")
+        if chunksize is not None:
+            self._load_store(signature, chunksize)
+            return
+
+        data_df = None
+        if use_cache:
+            with self.instrumentation.stage("download_data", "read cache") as stage:
+                data_df = read_frame("downloads/cache", signature)
+                stage.rows = None if data_df is None else len(data_df)
+
+        if data_df is None:
+            with self.instrumentation.stage("download_data", "parse csv") as stage:
+                data_df = pd.read_csv("downloads/download.csv")
+                stage.rows = len(data_df)
+            with self.instrumentation.stage("download_data", "clean") as stage:
+                data_df = self._clean_data(data_df)
+                stage.rows = len(data_df)
+            if use_cache:
+                with self.instrumentation.stage("download_data", "write cache"):
+                    write_frame(compact_frame(data_df), "downloads/cache", signature)
+                    data_df = read_frame("downloads/cache", signature)
+        self.data_df = data_df
+        self.store = None
+        self._chunksize = None
+        with self.instrumentation.stage("download_data", "index", rows=len(data_df)):
+            self._build_index()
+            self._build_outputs()
 
-        if not exists:
-            response = requests.get(
-                "https://raw.githubusercontent.com/owid/owid-datasets/master/datasets/"
-                "Agricultural%20total%20factor%20productivity%20(USDA)"
-                "/Agricultural%20total%20factor%20productivity%20(USDA).csv"
+    def _load_store(self, signature: str, chunksize: int):
+        """
+        Opens the partitioned store of the downloaded csv file, writing it first if needed.
+        Each chunk is cleaned and compacted on its own, so only one chunk is in memory.
+        """
+        if not isinstance(chunksize, int) or chunksize < 1:
+            raise ValueError("Variable 'chunksize' must be a positive integer.")
+
+        store = PartitionedStore.open("downloads/store", signature)
+        if store is None:
+            chunks = (
+                compact_frame(self._drop_aggregates(chunk))
+                for chunk in pd.read_csv("downloads/download.csv", chunksize=chunksize)
             )
-            with open("downloads/download.csv", "wb") as file:
-                file.write(response.content)
-
-        data_df = pd.read_csv("downloads/download.csv")
-        countries_to_drop = [
-            "Asia",
-            "Caribbean",
-            "Central Africa",
-            "Central America",
-            "Central Asia",
-            "Central Europe",
-            "Developed Asia",
-            "Developed countries",
-            "East Africa",
-            "Eastern Europe",
-            "Former Soviet Union",
-            "High income",
-            "Horn of Africa",
-            "Latin America and the Caribbean",
-            "Least developed countries",
-            "Lower-middle income",
-            "North Africa",
-            "North America",
-            "Northeast Asia",
-            "Northern Europe",
-            "Oceania",
-            "Pacific",
-            "Sahel",
-            "South Asia",
-            "Southeast Asia",
-            "Southern Africa",
-            "Southern Europe",
-            "Sub-Saharan Africa",
-            "Upper-middle income",
-            "West Africa",
-            "West Asia",
-            "Western Europe",
-            "World",
-            "Low income",
+            with self.instrumentation.stage("download_data", "write store"):
+                write_partitions(chunks, "downloads/store", signature)
+            store = PartitionedStore.open("downloads/store", signature)
+
+        self.store = store
+        self._chunksize = chunksize
+        self.data_df = pd.DataFrame(columns=store.columns)
+        with self.instrumentation.stage("download_data", "index"):
+            self._build_index()
+            self._build_outputs()
+
+    def _source(self):
+        """Returns the store or data_df, whichever holds the current data."""
+        return self.data_df if self.store is None else self.store
+
+    @property
+    def panel(self):
+        """
+        The metrics as a Panel of float32 entity by year matrices, built on first use
+        and rebuilt when the data is replaced. Series of a country and cross-sections
+        of a year are views of the panel. With a store, the partitions are read
+        one at a time.
+        """
+        if self._panel_source is not self._source():
+            if self.store is None:
+                self._panel = Panel.from_frame(self.data_df)
+            else:
+                self._panel = Panel.from_frames(
+                    self.store.iter_frames(),
+                    self.store.entities,
+                    self.store.years(),
+                    self.store.metrics,
+                )
+            self._panel_source = self._source()
+        return self._panel
+
+    @property
+    def geometry(self):
+        """
+        The store of the country polygons, read from the cache on first use.
+        The polygons are read from their source and cached once, if needed.
+        """
+        if self._geometry is None:
+            with self.instrumentation.stage("choropleth", "load geometry") as stage:
+                self._geometry = load_geometry(
+                    os.path.join("downloads", "geometry"),
+                    self.geometry_url,
+                    session=self.session,
+                    aliases=self.merge_dict,
+                )
+                stage.rows = len(self._geometry.names)
+        return self._geometry
+
+    @geometry.setter
+    def geometry(self, geometry: GeometryStore):
+        self._geometry = geometry
+
+    @property
+    def geopandas_df(self):
+        """The country polygons of the geometry store, as a geopandas frame."""
+        return self.geometry.to_frame()
+
+    @geopandas_df.setter
+    def geopandas_df(self, geopandas_df):
+        self._geometry = GeometryStore.from_frame(geopandas_df, self.merge_dict)
+
+    def _clean_data(self, data_df: pd.DataFrame):
+        """
+        Excludes the aggregated rows (like Asia) from the downloaded data
+        and sorts the rows by country and year.
+        """
+        data_df = self._drop_aggregates(data_df)
+        return data_df.sort_values(["Entity", "Year"], kind="stable")
+
+    @property
+    def membership(self):
+        """The countries of every region and group of countries, read on first use."""
+        if self._membership is None:
+            self._membership = read_membership()
+        return self._membership
+
+    @membership.setter
+    def membership(self, membership_df: pd.DataFrame):
+        self._membership = membership_df
+        self._aggregate_engine = None
+        self._outputs_source = None
+
+    def _drop_aggregates(self, data_df: pd.DataFrame):
+        """
+        Excludes the aggregated rows (like Asia) from the downloaded data.
+        These are the groups of the membership table and the World.
+        """
+        return data_df.loc[~data_df["Entity"].isin(aggregate_names(self.membership))]
+
+    def _build_index(self):
+        """
+        Builds the index of the rows of each country in data_df.
+        The rows are sorted by country, so each country is a contiguous block
+        and can be sliced without scanning the Entity column.
+        The index is rebuilt whenever data_df is replaced.
+        A partitioned store is indexed by its manifest and read per query instead.
+        """
+        if self._indexed_df is self._source():
+            return
+
+        if self.store is not None:
+            self._entity_slices = {}
+            self._country_list = self.store.entities.tolist()
+            self._country_set = frozenset(self._country_list)
+            self._indexed_df = self.store
+            return
+
+        data_df = self.data_df
+        if not data_df["Entity"].is_monotonic_increasing:
+            data_df = data_df.sort_values(["Entity", "Year"], kind="stable")
+            self.data_df = data_df
+
+        codes, countries = pd.factorize(data_df["Entity"].to_numpy())
+        boundaries = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [len(codes)]))
+
+        self._entity_slices = {
+            country: slice(start, stop)
+            for country, start, stop in zip(countries, starts, stops)
+        }
+        self._country_list = list(countries)
+        self._country_set = frozenset(countries)
+        self._indexed_df = data_df
+
+    def _build_outputs(self):
+        """
+        Precomputes the crop, animal and fish output of every country, region and of
+        the world, both absolute and as shares of the total output, in one vectorized pass.
+        The rows of the countries keep their positions of the entity index and the yearly
+        totals of the regions are appended at the end, so every view of the area graph
+        is a slice. For a partitioned store, only the totals of the regions are kept
+        and the countries are read when they are plotted.
+        """
+        self._build_index()
+        if self._outputs_source is self._source():
+            return
+
+        country_df = None
+        if self.store is None:
+            country_df = self._output_columns(self.data_df)
+        group_df = self._aggregates().to_frame()
+        output_df = pd.concat(
+            [country_df, group_df[["Year", "output_quantity", *self._OUTPUT_COLUMNS]]],
+            ignore_index=True,
+        )
+
+        # the years of each region are a contiguous block at the end
+        n_years = len(self._aggregate_engine.years)
+        offset = len(output_df) - len(group_df)
+        self._group_slices = {
+            group: slice(offset + i * n_years, offset + (i + 1) * n_years)
+            for i, group in enumerate(self._aggregate_engine.groups)
+        }
+        self._output_df = output_df
+        self._share_df = self._output_shares(output_df)
+        self._outputs_source = self._source()
+
+    def _aggregates(self):
+        """
+        Returns the engine of the regional aggregates of the current data.
+        If only the values of some countries changed since the last data,
+        just these countries are added to the aggregates again.
+        """
+        columns = ["output_quantity", *self._OUTPUT_COLUMNS, "tfp"]
+        if self._panel_source is self._source():
+            panel = self._panel
+        elif self.store is None:
+            # only the aggregated columns, the panel of all metrics is built on first use
+            panel = Panel.from_frame(self.data_df[["Entity", "Year", *columns]])
+        else:
+            # only the aggregated columns of the store are held in memory
+            panel = Panel.from_frames(
+                self.store.iter_frames(columns),
+                self.store.entities,
+                self.store.years(),
+                columns,
+            )
+        matrices = {x: panel.matrix(x) for x in columns}
+
+        engine = self._aggregate_engine
+        with self.instrumentation.stage("download_data", "aggregate") as stage:
+            if (
+                engine is not None
+                and engine.entities == panel.entities.tolist()
+                and engine.years == panel.years.tolist()
+            ):
+                stage.info = {"changed": len(engine.update(matrices))}
+            else:
+                engine = AggregateEngine(
+                    self.membership,
+                    panel.entities,
+                    panel.years.tolist(),
+                    totals=["output_quantity", *self._OUTPUT_COLUMNS],
+                    means={"tfp": "output_quantity"},
+                )
+                engine.load(matrices)
+            stage.rows = len(engine.groups)
+        self._aggregate_engine = engine
+        return engine
+
+    def _output_columns(self, data_df: pd.DataFrame):
+        """Returns the year and the output columns of some rows as floats."""
+        columns = ["output_quantity", *self._OUTPUT_COLUMNS]
+        return data_df[["Year", *columns]].astype({x: float for x in columns})
+
+    def _output_shares(self, output_df: pd.DataFrame):
+        """Divides the crop, animal and fish output by the total output."""
+        share_df = output_df.copy()
+        share_df[self._OUTPUT_COLUMNS] = output_df[self._OUTPUT_COLUMNS].div(
+            output_df["output_quantity"], axis=0
+        )
+        return share_df
+
+    def _area_df(self, country: str, normalize: bool):
+        """
+        Returns the yearly crop, animal and fish output of a country, a region or
+        the world, as shares of the total output if normalized.
+        """
+        self._build_outputs()
+        output_df = self._share_df if normalize else self._output_df
+
+        # check if country input is a region, the World or none
+        if country is None:
+            country = WORLD
+        if self._is_region(country):
+            return output_df.iloc[self._group_slices[country]]
+
+        # check if country input is in country list
+        if self._is_country(country) and self.store is not None:
+            country_df = self._output_columns(self._country_df(country))
+            return self._output_shares(country_df) if normalize else country_df
+        if self._is_country(country):
+            return output_df.iloc[self._entity_slices[country]]
+
+        # raise a value error if country input is invalid
+        raise ValueError(f"{country} is not a valid country, try another one")
+
+    def _prepare_geometry(self):
+        """
+        Prepares the country polygons for the choropleth.
+        The polygons are matched to the countries of data_df, named like in data_df,
+        and the others are dropped. The result is reused by every choropleth until
+        the geometry or the data_df is replaced.
+        """
+        self._build_index()
+        if (
+            self._geometry_source is not None
+            and self._geometry_source[0] is self.geometry
+            and self._geometry_source[1] is self._source()
+        ):
+            return
+
+        with self.instrumentation.stage("choropleth", "geometry merge") as stage:
+            matched = self.geometry.match(self._country_list)
+            self._geometry_rows = np.flatnonzero(pd.notna(matched))
+            self._geometry_df = (
+                self.geometry.to_frame(self._geometry_rows)[["name", "geometry"]]
+                .assign(name=matched[self._geometry_rows].astype(str))
+                .reset_index(drop=True)
+            )
+            stage.rows = len(self._geometry_df)
+        self._simplified_geometry = {}
+        self._geometry_source = (self.geometry, self._source())
+
+    def _choropleth_geometry(self, simplify: float = None, region=None):
+        """
+        Returns the prepared country polygons, simplified with the given tolerance
+        and cropped to a region. Only the polygons found by the spatial index
+        are clipped. The results are memoized per tolerance and region.
+        """
+        self._prepare_geometry()
+        bbox = None if region is None else self.geometry.region_bounds(region)
+        if simplify is None and bbox is None:
+            return self._geometry_df
+
+        key = (simplify, bbox)
+        if key not in self._simplified_geometry:
+            geometry_df = self._geometry_df
+            if bbox is not None:
+                with self.instrumentation.stage("choropleth", "crop geometry") as stage:
+                    # positions of the prepared polygons intersecting the box
+                    rows = np.flatnonzero(
+                        np.isin(self._geometry_rows, self.geometry.query(bbox))
+                    )
+                    geometry_df = geometry_df.iloc[rows].reset_index(drop=True)
+                    geometry_df = geometry_df.assign(
+                        geometry=geometry_df.clip_by_rect(*bbox)
+                    )
+                    stage.rows = len(geometry_df)
+            if simplify is not None:
+                with self.instrumentation.stage("choropleth", "simplify geometry"):
+                    geometry_df = geometry_df.assign(
+                        geometry=geometry_df.simplify(simplify, preserve_topology=True)
+                    )
+            self._simplified_geometry[key] = geometry_df
+        return self._simplified_geometry[key]
+
+    def _country_df(self, country: str):
+        """Returns the rows of one country of data_df, without scanning the data."""
+        self._build_index()
+        if self.store is not None:
+            return self.store.read(entities=[country])
+        return self.data_df.iloc[self._entity_slices[country]]
+
+    def _year_df(self, year: int, columns: list = None):
+        """Returns the rows of one year, of the given metric columns or all of them."""
+        if self.store is not None:
+            return self.store.read(years=[year], columns=columns)
+        year_df = self.data_df[self.data_df["Year"] == year]
+        if columns is None:
+            return year_df
+        return year_df[
+            [x for x in year_df.columns if x in ("Entity", "Year", *columns)]
         ]
-        data_df = data_df.loc[~data_df["Entity"].isin(countries_to_drop)]
-        self.data_df = data_df
 
-        self.geopandas_df = gpd.read_file(gpd.datasets.get_path("naturalearth_lowres"))
+    def _years(self):
+        """Returns the sorted list of all years of the data."""
+        if self.store is not None:
+            return self.store.years()
+        return sorted(self.data_df["Year"].unique().tolist())
+
+    def _is_country(self, country):
+        """Checks if a country is in the dataset."""
+        self._build_index()
+        return country in self._country_set
+
+    def _is_region(self, region):
+        """Checks if a region or group of countries, or the World, is aggregated."""
+        self._build_outputs()
+        return region in self._group_slices
+
+    def _region_df(self, region: str):
+        """Returns the yearly aggregates of a region with its name in the Entity column."""
+        self._build_outputs()
+        return self._aggregate_engine.frame(region).assign(Entity=region)
 
     def list_countries(self):
         """Lists all the countries of the Entity column and removes the duplicates.
@@ -159,35 +675,155 @@ class Agros:
 
         """
 
-        country_list = list(self.data_df["Entity"].unique())
+        self._build_index()
+        country_list = list(self._country_list)
 
         return country_list
 
+    def list_regions(self, kind: str = None):
+        """Lists the regions and groups of countries, which are aggregated from
+        their countries and can be plotted like countries.
+
+        Parameters
+        ---------------
+        kind: str
+            only lists groups of one kind: 'world', 'region', 'development' or 'income'
+
+        Returns
+        ---------------
+        region_list: list
+            the names of the regions, the World first
+        """
+        self._build_outputs()
+        engine = self._aggregate_engine
+        if kind is not None and kind not in set(engine.kinds.values()):
+            raise ValueError(
+                f"{kind} is not a kind of region, "
+                f"choose one of: {', '.join(sorted(set(engine.kinds.values())))}"
+            )
+        return [x for x in engine.groups if kind is None or engine.kinds[x] == kind]
+
+    def region_aggregates(self, regions: list = None):
+        """
+        Returns the yearly totals of the output columns and the output-weighted
+        total factor productivity of regions, computed from their countries.
+
+        Parameters
+        ---------------
+        regions: list
+            the regions, all regions of list_regions by default
+
+        Returns
+        ---------------
+        aggregate_df: Pandas DataFrame
+            one row per region and year with the columns Entity, Year, output_quantity,
+            crop_output_quantity, animal_output_quantity, fish_output_quantity and tfp
+        """
+        self._build_outputs()
+        if regions is not None:
+            regions = list(dict.fromkeys(regions))
+            for region in regions:
+                if not self._is_region(region):
+                    raise ValueError(f"{region} is not a region, see list_regions")
+        return self._aggregate_engine.to_frame(regions)
+
     def correlate_quantity(self):
         """Provides a correlation heatmap of the quantity columns"""
+        self._pyplot_figure(self._draw_correlate_quantity)
+
+    def _draw_correlate_quantity(self, figure):
+        """Draws the correlation heatmap of the quantity columns on a figure."""
+        import seaborn as sns
 
-        correlation = self.data_df.loc[
-            :, self.data_df.columns.str.contains("_quantity")
-        ].corr()
+        correlation = self._correlation_engine().pearson()
         mask = np.zeros_like(correlation, dtype=bool)
         mask[np.triu_indices_from(mask)] = True
 
+        axis = figure.add_subplot()
         heatmap = sns.heatmap(
-            correlation, vmin=-1, vmax=1, annot=True, mask=mask, cmap="coolwarm"
+            correlation,
+            vmin=-1,
+            vmax=1,
+            annot=True,
+            mask=mask,
+            cmap="coolwarm",
+            ax=axis,
         )
         heatmap.set_title(
             "Correlation Heatmap of Output Columns", fontdict={"fontsize": 12}, pad=12
         )
-        ax_figure = heatmap.axes
-        ax_figure.text(
+        heatmap.text(
             0,
             -0.35,
             "Source: Agricultural total factor productivity (USDA), Our World in Data 2021",
             fontsize=12,
             ha="left",
-            transform=heatmap.figure.transFigure,
+            transform=figure.transFigure,
         )
 
+    def correlation(self, method: str = "pearson", by: str = None, window: int = 10):
+        """
+        Returns the correlation matrix of the quantity columns, overall or per group.
+
+        Parameters
+        ---------------
+        method: str
+            'pearson' or 'spearman'
+
+        by: str
+            None for one matrix of all rows, 'Entity' for a matrix per country
+            or 'Year' for a matrix per window of years
+
+        window: int
+            number of years per window when grouping by year
+
+        Returns
+        ---------------
+        correlation: Pandas DataFrame or dict
+            the correlation matrix, or a dictionary of the matrix of each country
+            or of the first year of each window
+        """
+        # check if the inputs are valid
+        if method not in ("pearson", "spearman"):
+            raise ValueError("Variable 'method' must be 'pearson' or 'spearman'.")
+        if by not in (None, "Entity", "Year"):
+            raise ValueError("Variable 'by' must be None, 'Entity' or 'Year'.")
+        if not isinstance(window, int) or window < 1:
+            raise ValueError("Variable 'window' must be a positive integer.")
+
+        engine = self._correlation_engine(by, window)
+        if by is None:
+            return getattr(engine, method)()
+        return {key: getattr(engine, method)(key) for key in engine.groups()}
+
+    def _correlation_engine(self, by: str = None, window: int = 10):
+        """
+        Returns the correlation engine of the quantity columns grouped by entity,
+        by window of years or not at all. The engines are kept until data_df is replaced.
+        """
+        if self._correlation_source is not self._source():
+            self._correlation_engines = {}
+            self._correlation_source = self._source()
+
+        key = (by, window if by == "Year" else None)
+        if key not in self._correlation_engines:
+            columns = [x for x in self.data_df.columns if "_quantity" in x]
+            frames = [self.data_df]
+            if self.store is not None:
+                frames = self.store.iter_frames(columns)
+
+            # the statistics are added frame by frame, one partition of a store at a time
+            engine = CorrelationEngine(columns)
+            for frame in frames:
+                keys = None
+                if by == "Entity":
+                    keys = frame["Entity"].astype(str).to_numpy()
+                elif by == "Year":
+                    keys = frame["Year"].to_numpy() // window * window
+                engine.update(frame[columns].to_numpy(dtype=float), keys)
+            self._correlation_engines[key] = engine
+        return self._correlation_engines[key]
+
     def area_graph(self, country: str, normalize: bool):
         """
         Creates an area graph of the output of a given country or the whole world.
@@ -195,61 +831,40 @@ class Agros:
         where the yearly output is always 100%.
         The country input can either be empty or 'World' then the graph will show
         information for the whole world summarized, or it can be a country from the country_list.
-        Then it will show the output for the specific country. If the input is something
-        else, it will raise and error.
+        Then it will show the output for the specific country. A region of list_regions,
+        like 'Sub-Saharan Africa', shows the summed output of its countries.
+        If the input is something else, it will raise and error.
 
         Parameters
         ---------------
         country: string
-            Defines if the data should be shown for a special country or for the whole world
+            Defines if the data should be shown for a special country, a region or for the whole world
 
         normalize: boolean
             Shows if graph should be normalized. Normalized means that it will be relative output
         """
-        country_list = self.list_countries()
+        import matplotlib.pyplot as plt
+
+        self._pyplot_figure(self._draw_area_graph, country, normalize)
 
+        # display area chart
+        plt.show()
+
+    def _draw_area_graph(self, figure, country: str, normalize: bool):
+        """Draws the area graph of the output of a country or the world on a figure."""
         # check if input for normalize is a boolean value
         if not isinstance(normalize, bool):
             raise TypeError("Variable 'normalize' is not a boolean.")
 
-        # check if country input is World or none and adapt dataframe accordingly
-        if country in ("World", None):
-            country_df = self.data_df.groupby("Year", as_index=False).sum().copy()
-            # check if normalize is true and adapt dataframe accordingly
-            if normalize is True:
-                country_df["crop_output_quantity"] = (
-                    country_df["crop_output_quantity"] / country_df["output_quantity"]
-                )
-                country_df["animal_output_quantity"] = (
-                    country_df["animal_output_quantity"] / country_df["output_quantity"]
-                )
-                country_df["fish_output_quantity"] = (
-                    country_df["fish_output_quantity"] / country_df["output_quantity"]
-                )
-
-        # check if country input is in country list
-        elif country in country_list:
-            country_df = self.data_df[self.data_df["Entity"] == f"{country}"].copy()
-            if normalize is True:
-                country_df["crop_output_quantity"] = (
-                    country_df["crop_output_quantity"] / country_df["output_quantity"]
-                )
-                country_df["animal_output_quantity"] = (
-                    country_df["animal_output_quantity"] / country_df["output_quantity"]
-                )
-                country_df["fish_output_quantity"] = (
-                    country_df["fish_output_quantity"] / country_df["output_quantity"]
-                )
-
-        # raise a value error if country input is invalid
-        else:
-            raise ValueError(f"{country} is not a valid country, try another one")
+        # look up the precomputed absolute or relative output
+        country_df = self._area_df(country, normalize)
 
         # define colors to use in chart
         color_map = ["red", "steelblue", "green"]
 
         # create area chart
-        plt.stackplot(
+        axis = figure.add_subplot()
+        axis.stackplot(
             country_df["Year"],
             country_df["crop_output_quantity"],
             country_df["animal_output_quantity"],
@@ -259,36 +874,52 @@ class Agros:
         )
 
         # add legend
-        plt.legend(loc="upper left")
+        axis.legend(loc="upper left")
 
         # add axis labels
-        plt.xlabel("Year")
-        plt.ylabel("Quantity")
+        axis.set_xlabel("Year")
+        axis.set_ylabel("Quantity")
 
         # add title
-        plt.title(f"{country}'s Output by Type of Crop, Animal, and Fish")
+        axis.set_title(f"{country}'s Output by Type of Crop, Animal, and Fish")
 
         # add source
-        plt.text(
+        axis.text(
             0,
             -0.25,
             "Source: Agricultural total factor productivity (USDA), Our World in Data 2021",
             ha="left",
-            transform=plt.gca().transAxes,
+            transform=axis.transAxes,
         )
 
-        # display area chart
-        plt.show()
-
-    def compare_output(self, *country_input: tuple):
+    def compare_output(self, *country_input: tuple, aggregate: bool = None):
         """Plots the total of the output columns of selected countries.
         An unlimited number of countries can be selected for the comparison.
+        Regions of list_regions can be compared like countries.
+        With many countries, the yearly outputs of all of them are drawn as a
+        density raster with their median instead of one line per country.
 
         Parameters
         ---------------
         country_list: string
-            the countries selected for the comparison
+            the countries or regions selected for the comparison
+
+        aggregate: boolean
+            whether the density raster is drawn, by default if the countries have
+            more yearly values than _DENSITY_POINTS
         """
+        import matplotlib.pyplot as plt
+
+        self._pyplot_figure(
+            self._draw_compare_output, *country_input, aggregate=aggregate
+        )
+        plt.show()
+
+    def _draw_compare_output(
+        self, figure, *country_input: tuple, aggregate: bool = None
+    ):
+        """Draws the output comparison of selected countries on a figure."""
+        import seaborn as sns
 
         input_list = list(country_input)
 
@@ -297,70 +928,168 @@ class Agros:
                 raise TypeError("Country inputted is not a string")
 
         for country_input in input_list:
-            if country_input not in self.list_countries():
+            if not self._is_country(country_input) and not self._is_region(
+                country_input
+            ):
                 raise ValueError("Country inputted not available in dataset")
 
-        output_df = self.data_df[self.data_df["Entity"].isin(input_list)]
+        entities = list(dict.fromkeys(input_list))
+        if aggregate is None:
+            aggregate = len(entities) * len(self._years()) > self._DENSITY_POINTS
+        if aggregate:
+            self._draw_output_density(figure, entities)
+            return
+
+        output_df = pd.concat(
+            [
+                (
+                    self._country_df(country)
+                    if self._is_country(country)
+                    else self._region_df(country)
+                )
+                for country in dict.fromkeys(input_list)
+            ]
+        )
 
-        sns.set_style("whitegrid")
-        sns.lineplot(x="Year", y="output_quantity", hue="Entity", data=output_df)
+        with sns.axes_style("whitegrid"):
+            axis = figure.add_subplot()
+        sns.lineplot(
+            x="Year",
+            y="output_quantity",
+            hue="Entity",
+            hue_order=entities,
+            data=output_df,
+            errorbar=None,
+            ax=axis,
+        )
 
-        plt.title("Output Comparison for Selected Countries")
-        plt.xlabel("Year")
-        plt.ylabel("Output")
-        plt.text(
+        axis.set_title("Output Comparison for Selected Countries")
+        axis.set_xlabel("Year")
+        axis.set_ylabel("Output")
+        axis.text(
             0,
             -0.25,
             "Source:Agricultural total factor productivity (USDA), Our World in Data 2021",
             ha="left",
             fontsize=10,
-            transform=plt.gca().transAxes,
+            transform=axis.transAxes,
         )
-        plt.show()
 
-    def gapminder(self, year: int):
+    def _draw_output_density(self, figure, entities: list):
+        """
+        Draws the yearly outputs of many countries or regions as a density raster,
+        one column per year, with the median output of every year.
+        """
+        years = self._years()
+        countries = [x for x in entities if self._is_country(x)]
+        matrices = [self._year_matrix("output_quantity", countries, years)]
+        for region in entities:
+            if not self._is_country(region):
+                region_df = self._region_df(region).set_index("Year")
+                matrices.append(
+                    region_df["output_quantity"].reindex(years).to_numpy()[None]
+                )
+        values = np.vstack(matrices)
+
+        raster, extent = density_raster(
+            np.broadcast_to(np.asarray(years, dtype=float), values.shape),
+            values,
+            bins=(years[-1] - years[0] + 1, DENSITY_BINS[1]),
+            log_x=False,
+            x_range=(years[0] - 0.5, years[-1] + 0.5),
+        )
+        axis = figure.add_subplot()
+        draw_density(axis, raster, extent, log_x=False, label="Number of countries")
+        with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            median = np.log10(np.nanmedian(np.where(values > 0, values, np.nan), 0))
+        axis.plot(years, median, color="black", linewidth=1.5, label="Median")
+        axis.legend(loc="upper left")
+
+        axis.set_title(f"Output Comparison for {len(entities)} Selected Countries")
+        axis.set_xlabel("Year")
+        axis.set_ylabel("Output")
+        axis.text(
+            0,
+            -0.15,
+            "Source:Agricultural total factor productivity (USDA), Our World in Data 2021",
+            ha="left",
+            fontsize=10,
+            transform=axis.transAxes,
+        )
+
+    def gapminder(self, year: int, aggregate: bool = None):
         """
         Generate a scatter plot for a specified ``year`` with the variables
         x being fertilizer quantity,
         y being output quantity,
         and the area of each dot being labor quantity.
+        With more points than _DENSITY_POINTS, the points are counted in a raster
+        of logarithmic cells instead, whose color shows the number of countries.
 
         Parameters
         ----------
         year : int
             Scatter plot will display the data only for the specified year.
+
+        aggregate : bool
+            whether the density raster is drawn, by default if there are
+            more points than _DENSITY_POINTS
         """
+        import matplotlib.pyplot as plt
+
+        self._pyplot_figure(
+            self._draw_gapminder, year, aggregate, figsize=self._FIGSIZES["gapminder"]
+        )
+        plt.show()
+
+    def _draw_gapminder(self, figure, year: int, aggregate: bool = None):
+        """Draws the fertilizer, output and labor scatter plot of a year on a figure."""
+        import seaborn as sns
 
         # check if year input is int
         if type(year) is not int:
             raise TypeError("Variable 'year' is not int.")
 
         # select subset of the dataframe that only contains rows for the selected year
-        df_year = self.data_df[self.data_df["Year"] == year]
+        df_year = self._year_df(
+            year, ["fertilizer_quantity", "output_quantity", "labor_quantity"]
+        )
 
         # get rowcount and raise exception if no entries were found for the year input
         if df_year.shape[0] == 0:
             raise ValueError(
                 "No entries were found for this year. Variable 'year' must be between 1961 and 2019"
             )
-        # plot the bubble graph
-        plt.figure(figsize=(10, 6))
-        axis = sns.scatterplot(
-            data=df_year,
-            x="fertilizer_quantity",
-            y="output_quantity",
-            size="labor_quantity",
-            sizes=(100, 700),
-            alpha=0.5,
-        )
+
+        # count the points in logarithmic cells if there are too many bubbles
+        if aggregate is None:
+            aggregate = len(df_year) > self._DENSITY_POINTS
+        if aggregate:
+            raster, extent = density_raster(
+                df_year["fertilizer_quantity"].to_numpy(dtype=float),
+                df_year["output_quantity"].to_numpy(dtype=float),
+            )
+            axis = figure.add_subplot()
+            draw_density(axis, raster, extent, label="Number of countries")
+        else:
+            # plot the bubble graph
+            axis = sns.scatterplot(
+                data=df_year,
+                x="fertilizer_quantity",
+                y="output_quantity",
+                size="labor_quantity",
+                sizes=(100, 700),
+                alpha=0.5,
+                ax=figure.add_subplot(),
+            )
+            axis.set(xscale="log", yscale="log")
         axis.set(
             xlabel="Fertilizer Quantity (in tons)",
             ylabel="Output Quantity (in 1000$)",
-            xscale="log",
-            yscale="log",
             title=f"Fertilizer, Output and Labor Quantity in {year}",
         )
-        plt.text(
+        axis.text(
             0,
             -0.15,
             "Source:Agricultural total factor productivity (USDA), Our World in Data 2021",
@@ -368,18 +1097,36 @@ class Agros:
             fontsize=10,
             transform=axis.transAxes,
         )
-        plt.show()
 
-    def choropleth(self, year: int):
+    def choropleth(self, year: int, simplify: float = None, region=None):
         """Plots the total factor productivity of a selected year.
-        Also, the function merges the data_df with the geopandas_df.
+        Also, the function joins the tfp of this year to the country polygons of
+        the geometry store. The polygons are prepared once, so only the values
+        of the selected year are joined on each call.
 
         Parameters
         ---------------
         year: int
             the year selected for the plot
+
+        simplify: float
+            tolerance in degrees used to simplify the polygons, e.g. for a zoomed-out map.
+            The simplified polygons are memoized per tolerance
+
+        region: str or tuple
+            crops the map to a country (name or ISO code), a continent, e.g. 'Europe',
+            or a bounding box of minx, miny, maxx, maxy in degrees
         """
+        self._pyplot_figure(
+            self._draw_choropleth,
+            year,
+            simplify,
+            region,
+            figsize=self._FIGSIZES["choropleth"],
+        )
 
+    def _draw_choropleth(self, figure, year: int, simplify: float = None, region=None):
+        """Draws the total factor productivity map of a year on a figure."""
         if type(year) is not int:
             raise TypeError("Year must be an integer")
 
@@ -388,26 +1135,29 @@ class Agros:
                 "No entries were found for this year. Variable 'year' must be between 1961 and 2019"
             )
 
-        self.geopandas_df.replace({"name": self.merge_dict}, inplace=True)
-        merged_df = self.geopandas_df.merge(
-            self.data_df, how="right", left_on="name", right_on="Entity"
-        )
-        merged_df.loc[merged_df["Year"] == year].plot(
+        # join the tfp of the selected year to the prepared polygons
+        year_df = self._year_df(year, ["tfp"])
+        tfp = pd.Series(year_df["tfp"].to_numpy(), index=year_df["Entity"].astype(str))
+        geometry_df = self._choropleth_geometry(simplify, region)
+        merged_df = geometry_df.assign(tfp=geometry_df["name"].map(tfp).to_numpy())
+
+        axis = figure.add_subplot()
+        merged_df.loc[merged_df["tfp"].notna()].plot(
             column="tfp",
+            ax=axis,
             legend=True,
-            figsize=[20, 10],
             vmin=50,
             vmax=250,
             legend_kwds={"label": "Total Factor Productivity"},
         )
-        plt.title(f"Total Factor Productivity in {year}")
-        plt.text(
+        axis.set_title(f"Total Factor Productivity in {year}")
+        axis.text(
             0,
             -0.25,
             "Source:Agricultural total factor productivity (USDA), Our World in Data 2021",
             ha="left",
             fontsize=10,
-            transform=plt.gca().transAxes,
+            transform=axis.transAxes,
         )
 
     def predictor(self, countries: list):
@@ -422,22 +1172,65 @@ class Agros:
         countries: list
         A list of three country names.
 
+        """
+        import matplotlib.pyplot as plt
+
+        valid_countries, data_list, prediction_list = self._predict(countries)
+
+        # plot the data and prediction of each country separately
+        for country, data, prediction in zip(
+            valid_countries, data_list, prediction_list
+        ):
+            self._pyplot_figure(
+                self._draw_prediction,
+                country,
+                data,
+                prediction,
+                figsize=self._FIGSIZES["predictor"],
+            )
+
+        self._pyplot_figure(
+            self._draw_predictions,
+            valid_countries,
+            data_list,
+            prediction_list,
+            figsize=self._FIGSIZES["predictor"],
+        )
+        plt.show()
+
+    def _predict(self, countries: list):
+        """
+        Checks the countries of the predictor and fits their ARIMA models.
+
+        Returns
+        ---------------
+        valid_countries: list
+            the countries of the input that are in the dataset
+
+        data_list: list
+            the data of each valid country, indexed by date
+
+        prediction_list: list
+            the predicted tfp of the next 30 years of each valid country
         """
         # check if list contains max three values
         if len(countries) > 3:
             raise ValueError(
                 "Your input was too long, please add maximum 3 countries to your list."
             )
-         
+
         country_list = self.list_countries()
 
         # check for valid countries in input
-        invalid_countries = [x for x in countries if x not in country_list]
+        invalid_countries = [x for x in countries if not self._is_country(x)]
 
         if len(invalid_countries) > 0:
-            print(f"Ignoring invalid countries: {', '.join(invalid_countries)}")
+            self.instrumentation.notice(
+                "predictor",
+                f"Ignoring invalid countries: {', '.join(invalid_countries)}",
+            )
 
-        valid_countries = [x for x in countries if x in country_list]
+        valid_countries = [x for x in countries if self._is_country(x)]
 
         if len(valid_countries) == 0:
             raise ValueError(
@@ -452,87 +1245,621 @@ class Agros:
         # for loop to perform ARIMA prediction on all valid countries
         for country in valid_countries:
             # get dataset and set year to index in datetime format
-            selected_data = self.data_df.loc[self.data_df["Entity"] == country]
+            selected_data = self._country_df(country)
             data = selected_data.set_index(selected_data.columns[1])
             data.index = pd.to_datetime(data.index, format="%Y")
             data_list.append(data)
 
-            # plot the rolling mean and standard deviation to find out if the data is stationary
-            plt.figure(figsize=(15, 7))
-            plt.plot(data["tfp"], label="Original", color="orange")
-            plt.plot(
-                data["tfp"].rolling(window=12).mean(), color="red", label="Rolling mean"
-            )
-            plt.plot(
-                data["tfp"].rolling(window=12).std(), color="green", label="Rolling std"
-            )
-            plt.xlabel("Date", fontsize=12)
-            plt.ylabel("Total factor productivity", fontsize=12)
-            plt.legend(loc="best")
-            plt.title(
-                "Prediction of future total factor productivity outputs with ARIMA: "
-                + country
-            )
-            plt.text(
-                0,
-                -0.25,
-                "Source:Agricultural total factor productivity (USDA), Our World in Data 2021",
-                ha="left",
-                fontsize=10,
-                transform=plt.gca().transAxes,
-            )
-
             # tune parameters for auto arima
-            stepwise_fit = auto_arima(
-                data["tfp"],
-                start_p=1,
-                start_q=0,
-                max_p=10,
-                max_q=10,
-                m=1,
-                start_P=0,
-                seasonal=False,
-                d=None,
-                D=1,
-                trace=True,
-                error_action="ignore",  # Ignore incompatible settings
-                suppress_warnings=True,
-                stepwise=True,
-            )
+            with self.instrumentation.stage(
+                "predictor", "arima fit", rows=len(data)
+            ) as stage:
+                stepwise_fit = fit_stored(country, data["tfp"], self.model_store)
+                stage.info = {"country": country, "order": stepwise_fit.order}
 
             # make prediction
-            stepwise_fit.summary()
             prediction = pd.DataFrame(stepwise_fit.predict(n_periods=30))
             prediction_list.append(prediction)
-            yhat = prediction[0]
-            years = pd.Series(range(2021, 2051))
-            xhat = pd.to_datetime(years, format="%Y")
 
-            # add prediction to plot
-            plt.plot(xhat, yhat, linestyle="dashed", color="orange")
+        return valid_countries, data_list, prediction_list
+
+    @staticmethod
+    def _draw_prediction(figure, country: str, data, prediction):
+        """Draws the rolling statistics and the prediction of one country on a figure."""
+        # plot the rolling mean and standard deviation to find out if the data is stationary
+        axis = figure.add_subplot()
+        axis.plot(data["tfp"], label="Original", color="orange")
+        axis.plot(
+            data["tfp"].rolling(window=12).mean(), color="red", label="Rolling mean"
+        )
+        axis.plot(
+            data["tfp"].rolling(window=12).std(), color="green", label="Rolling std"
+        )
+        axis.set_xlabel("Date", fontsize=12)
+        axis.set_ylabel("Total factor productivity", fontsize=12)
+        axis.legend(loc="best")
+        axis.set_title(
+            "Prediction of future total factor productivity outputs with ARIMA: "
+            + country
+        )
+        axis.text(
+            0,
+            -0.25,
+            "Source:Agricultural total factor productivity (USDA), Our World in Data 2021",
+            ha="left",
+            fontsize=10,
+            transform=axis.transAxes,
+        )
+
+        # add prediction to plot
+        yhat = prediction[0]
+        years = pd.Series(range(2021, 2051))
+        xhat = pd.to_datetime(years, format="%Y")
+        axis.plot(xhat, yhat, linestyle="dashed", color="orange")
 
+    @staticmethod
+    def _draw_predictions(figure, valid_countries, data_list, prediction_list):
+        """Draws the data and predictions of all countries on a figure."""
         colors = ["red", "green", "blue"]
-        plt.figure(figsize=(15, 7))
+        axis = figure.add_subplot()
         for i in range(len(valid_countries)):
             data = data_list[i]
             prediction = prediction_list[i]
             yhat = prediction[0]
             years = pd.Series(range(2021, 2051))
             xhat = pd.to_datetime(years, format="%Y")
-            plt.plot(data["tfp"], label=valid_countries[i], color=colors[i])
-            plt.plot(xhat, yhat, linestyle="dashed", color=colors[i])
-        plt.xlabel("Date", fontsize=12)
-        plt.ylabel("Total factor productivity", fontsize=12)
-        plt.legend(loc="best")
-        plt.title(
+            axis.plot(data["tfp"], label=valid_countries[i], color=colors[i])
+            axis.plot(xhat, yhat, linestyle="dashed", color=colors[i])
+        axis.set_xlabel("Date", fontsize=12)
+        axis.set_ylabel("Total factor productivity", fontsize=12)
+        axis.legend(loc="best")
+        axis.set_title(
             "Prediction of future total factor productivity outputs with ARIMA for all countries"
         )
-        plt.text(
+        axis.text(
             0,
             -0.25,
             "Source:Agricultural total factor productivity (USDA), Our World in Data 2021",
             ha="left",
             fontsize=10,
-            transform=plt.gca().transAxes,
+            transform=axis.transAxes,
+        )
+
+    def _draw_predictor(self, figure, countries: list):
+        """Fits the ARIMA models of the countries and draws all predictions on a figure."""
+        self._draw_predictions(figure, *self._predict(countries))
+
+    def _pyplot_figure(self, draw, *args, figsize=None, **kwargs):
+        """
+        Draws a chart on a new pyplot figure, with the args and kwargs of the method.
+        The figure is closed again if the input turns out to be invalid.
+        """
+        import matplotlib.pyplot as plt
+
+        # only the predictor draws with methods that aren't renderers
+        method = next(
+            (x for x, y in self._RENDERERS.items() if y == draw.__name__), "predictor"
+        )
+        figure = plt.figure(figsize=figsize)
+        try:
+            with self.instrumentation.stage(method, "draw"):
+                draw(figure, *args, **kwargs)
+        except Exception:
+            plt.close(figure)
+            raise
+        return figure
+
+    def render(self, method: str, *args, fmt: str = "png", dpi: int = 100, **kwargs):
+        """
+        Renders the chart of a plotting method without a display and returns the image.
+        The chart is drawn on its own Agg figure, so the pyplot state is not touched
+        and no figure is left open. The images are kept in the render_cache, so
+        repeated requests with the same arguments are served without drawing.
+        For the predictor, the chart with the predictions of all countries is rendered.
+
+        Parameters
+        ---------------
+        method: str
+            the plotting method, one of area_graph, compare_output, gapminder,
+            choropleth, correlate_quantity and predictor
+
+        *args: any
+            the arguments of the plotting method
+
+        fmt: str
+            image format, e.g. 'png' or 'svg'
+
+        dpi: int
+            resolution of raster images
+
+        **kwargs: any
+            the keyword arguments of the plotting method, e.g. aggregate
+
+        Returns
+        ---------------
+        image: bytes
+            the encoded image
+        """
+        if method not in self._RENDERERS:
+            raise ValueError(
+                f"{method} can't be rendered, choose one of: {', '.join(self._RENDERERS)}"
+            )
+
+        # cached images are outdated once the data is replaced
+        if self._rendered_df is not self._source():
+            self.render_cache.clear()
+            self._rendered_df = self._source()
+
+        key = (method, freeze(args), freeze(kwargs), fmt, dpi)
+        with self.instrumentation.stage(method, "render") as stage:
+            image = self.render_cache.get(key)
+            stage.info = {"cached": image is not None, "format": fmt}
+            if image is None:
+                image = render_figure(
+                    getattr(self, self._RENDERERS[method]),
+                    *args,
+                    figsize=self._FIGSIZES.get(method),
+                    fmt=fmt,
+                    dpi=dpi,
+                    **kwargs,
+                )
+                self.render_cache.put(key, image)
+        return image
+
+    def rolling_statistics(self, column: str = "tfp", window: int = 12):
+        """
+        Computes the rolling mean, the rolling standard deviation and the differences
+        of a column for all countries at once, without plotting.
+        The windows run over consecutive years, like the rolling statistics of the predictor.
+
+        Parameters
+        ---------------
+        column: str
+            the metric column, e.g. 'tfp'
+
+        window: int
+            number of years per window
+
+        Returns
+        ---------------
+        rolling_df: Pandas DataFrame
+            the columns Entity, Year, the column itself, rolling_mean, rolling_std
+            and diff, with one row per country and year with a value
+        """
+        matrix, countries, years = self._country_matrix(column)
+        mean, std = rolling_statistics(matrix, window)
+        diff = np.full(matrix.shape, np.nan)
+        diff[:, 1:] = np.diff(matrix, axis=1)
+
+        rolling_df = pd.DataFrame(
+            {
+                "Entity": np.repeat(countries, len(years)),
+                "Year": np.tile(years, len(countries)),
+                column: matrix.ravel(),
+                "rolling_mean": mean.ravel(),
+                "rolling_std": std.ravel(),
+                "diff": diff.ravel(),
+            }
+        )
+        return rolling_df.loc[rolling_df[column].notna()].reset_index(drop=True)
+
+    def stationarity(self, column: str = "tfp", alpha: float = 0.05):
+        """
+        Tests the series of a column of all countries for stationarity at once.
+        The augmented Dickey-Fuller test has a unit root as null hypothesis,
+        the KPSS test level stationarity. Both are run with the defaults of statsmodels.
+
+        Parameters
+        ---------------
+        column: str
+            the metric column, e.g. 'tfp'
+
+        alpha: float
+            significance level of both tests
+
+        Returns
+        ---------------
+        stationarity_df: Pandas DataFrame
+            one row per country with the number of years, the statistic, p-value and lags
+            of both tests and whether the ADF test rejects a unit root while the KPSS
+            test doesn't reject stationarity
+        """
+        matrix, countries, _ = self._country_matrix(column)
+        adf = adf_test(matrix)
+        kpss = kpss_test(matrix)
+
+        stationarity_df = pd.DataFrame(
+            {
+                "n_years": (~np.isnan(matrix)).sum(axis=1),
+                "adf_stat": adf["stat"],
+                "adf_pvalue": adf["pvalue"],
+                "adf_lags": adf["lags"],
+                "kpss_stat": kpss["stat"],
+                "kpss_pvalue": kpss["pvalue"],
+                "kpss_lags": kpss["lags"],
+            },
+            index=pd.Index(countries, name="Entity"),
+        )
+        stationarity_df["stationary"] = (stationarity_df["adf_pvalue"] < alpha) & (
+            stationarity_df["kpss_pvalue"] > alpha
+        )
+        return stationarity_df
+
+    def _country_matrix(self, column: str):
+        """
+        Returns the values of a metric column with one row per country and one column
+        per year, together with the countries and the years.
+        """
+        if column in ("Entity", "Year") or column not in self.data_df.columns:
+            raise ValueError(f"{column} is not a metric column of the dataset")
+
+        self._build_index()
+        countries = list(self._country_list)
+        years = self._years()
+        return self._year_matrix(column, countries, years), countries, years
+
+    def forecast(
+        self,
+        countries: list = None,
+        n_periods: int = 30,
+        workers: int = None,
+        timeout: float = None,
+        engine: str = "arima",
+    ):
+        """
+        Forecasts the total factor productivity of many countries with ARIMA models.
+        In contrast to the predictor, nothing is plotted and the number of countries
+        is not limited. The models are fitted in parallel across a process pool.
+        Countries whose fit fails or exceeds the timeout are left out of the result.
+        Models found in the model_store are reused instead of searched again.
+        The 'statespace' engine fits local level or local trend models instead, on all
+        countries at once, which is much faster and suits screening many countries.
+
+        Parameters
+        ---------------
+        countries: list
+            the countries to forecast, defaults to all countries of the dataset
+
+        n_periods: int
+            number of years to forecast
+
+        workers: int
+            number of worker processes, defaults to the number of CPUs
+
+        timeout: float
+            maximum number of seconds spent on the fit of a single country
+
+        engine: str
+            'arima' or 'statespace', workers, timeout and the model_store only
+            apply to ARIMA models
+
+        Returns
+        ---------------
+        forecast_df: Pandas DataFrame
+            one row per country and forecasted year with the columns
+            Entity, Year, tfp, tfp_lower and tfp_upper
+        """
+        if countries is None:
+            countries = self.list_countries()
+
+        if not isinstance(n_periods, int) or n_periods < 1:
+            raise ValueError("Variable 'n_periods' must be a positive integer.")
+        if engine not in FORECAST_ENGINES:
+            raise ValueError(
+                f"Variable 'engine' must be one of {', '.join(FORECAST_ENGINES)}."
+            )
+
+        # check for valid countries in input
+        invalid_countries = [x for x in countries if not self._is_country(x)]
+
+        if len(invalid_countries) > 0:
+            raise ValueError(
+                f"Countries not available in dataset: {', '.join(invalid_countries)}"
+            )
+
+        series_dict = {}
+        for country in countries:
+            selected_data = self._country_df(country)
+            series_dict[country] = selected_data.set_index("Year")["tfp"].dropna()
+
+        with self.instrumentation.stage(
+            "forecast", f"{engine} fit", rows=len(series_dict)
+        ):
+            if engine == "statespace":
+                forecast_df, failures = statespace_countries(
+                    series_dict, n_periods=n_periods
+                )
+            else:
+                forecast_df, failures = forecast_countries(
+                    series_dict,
+                    n_periods=n_periods,
+                    workers=workers,
+                    timeout=timeout,
+                    store=self.model_store,
+                )
+
+        if len(failures) > 0:
+            self.instrumentation.notice(
+                "forecast", f"No forecast for countries: {', '.join(failures)}"
+            )
+
+        return forecast_df
+
+    def backtest(
+        self,
+        countries: list = None,
+        start: int = 1990,
+        end: int = 2019,
+        horizon: int = 1,
+        mode: str = "refit",
+        workers: int = None,
+        engine: str = "arima",
+    ):
+        """
+        Backtests the ARIMA forecasts of the total factor productivity with a rolling origin.
+        For every cutoff year from start to end, the models are trained on the years
+        before the cutoff and forecast the following years. By default, the order is only
+        searched at the first cutoff and each later fit is warm-started from the previous
+        parameters, which is much faster than searching the order at every cutoff.
+
+        Parameters
+        ---------------
+        countries: list
+            the countries to backtest, defaults to all countries of the dataset
+
+        start: int
+            the first cutoff year
+
+        end: int
+            the last cutoff year
+
+        horizon: int
+            number of years forecasted at each cutoff
+
+        mode: str
+            'refit' keeps the order and warm-starts each fit, 'update' updates the model
+            in place with the new years and 'search' runs the full order search every time
+
+        workers: int
+            number of worker processes, defaults to the number of CPUs
+
+        engine: str
+            'arima' or 'statespace', which refits the state space models of all
+            countries at every cutoff in this process. The modes only apply to
+            ARIMA models, so only the default mode is accepted with it
+
+        Returns
+        ---------------
+        metrics_df: Pandas DataFrame
+            one row per country with the number of forecasts, mae, rmse and mape
+
+        backtest_df: Pandas DataFrame
+            one row per country, cutoff and forecasted year with the columns
+            Entity, Cutoff, Year, tfp and tfp_predicted
+        """
+        if countries is None:
+            countries = self.list_countries()
+
+        for name, value in (("start", start), ("end", end), ("horizon", horizon)):
+            if not isinstance(value, int):
+                raise TypeError(f"Variable '{name}' is not int.")
+        if horizon < 1:
+            raise ValueError("Variable 'horizon' must be a positive integer.")
+        if end < start:
+            raise ValueError("Variable 'end' must not be before 'start'.")
+        if engine not in FORECAST_ENGINES:
+            raise ValueError(
+                f"Variable 'engine' must be one of {', '.join(FORECAST_ENGINES)}."
+            )
+        if engine == "statespace" and mode != "refit":
+            raise ValueError(
+                f"Mode '{mode}' only applies to the arima engine, "
+                "the statespace engine refits all models at every cutoff."
+            )
+
+        # check for valid countries in input
+        invalid_countries = [x for x in countries if not self._is_country(x)]
+
+        if len(invalid_countries) > 0:
+            raise ValueError(
+                f"Countries not available in dataset: {', '.join(invalid_countries)}"
+            )
+
+        series_dict = {}
+        for country in countries:
+            selected_data = self._country_df(country)
+            series_dict[country] = selected_data.set_index("Year")["tfp"].dropna()
+
+        with self.instrumentation.stage(
+            "backtest", f"{engine} fit", rows=len(series_dict)
+        ):
+            if engine == "statespace":
+                backtest_df, failures = statespace_backtest(
+                    series_dict, list(range(start, end + 1)), horizon=horizon
+                )
+            else:
+                backtest_df, failures = backtest_countries(
+                    series_dict,
+                    list(range(start, end + 1)),
+                    horizon=horizon,
+                    mode=mode,
+                    workers=workers,
+                )
+
+        if len(failures) > 0:
+            self.instrumentation.notice(
+                "backtest", f"No backtest for countries: {', '.join(failures)}"
+            )
+
+        return backtest_metrics(backtest_df), backtest_df
+
+    def export_animation(
+        self,
+        kind: str,
+        path: str,
+        years: list = None,
+        fps: float = 4,
+        workers: int = None,
+        simplify: float = None,
+        dpi: int = 100,
+        region=None,
+    ):
+        """
+        Renders the choropleth or the gapminder chart of a range of years as an animation.
+        The figure is built once per worker process and only its data is updated
+        for each year. The format is taken from the file extension of the path:
+        '.gif' and '.mp4' (which needs ffmpeg) save one animation, any other path
+        is a folder that receives one PNG file per year.
+
+        Parameters
+        ---------------
+        kind: str
+            the chart to animate, either 'choropleth' or 'gapminder'
+
+        path: str
+            the file or folder to write
+
+        years: list
+            the years of the frames, defaults to all years of the dataset
+
+        fps: float
+            frames per second of the animation
+
+        workers: int
+            number of worker processes, defaults to the number of CPUs
+
+        simplify: float
+            tolerance in degrees used to simplify the polygons of the choropleth
+
+        dpi: int
+            resolution of the frames
+
+        region: str or tuple
+            crops the choropleth to a country, a continent or a bounding box,
+            as in the choropleth method
+
+        Returns
+        ---------------
+        path: str
+            the written file or folder
+        """
+        if kind not in ("choropleth", "gapminder"):
+            raise ValueError("Variable 'kind' must be either choropleth or gapminder.")
+
+        available_years = self._years()
+        if years is None:
+            years = available_years
+
+        years = list(years)
+        if len(years) == 0:
+            raise ValueError(
+                "Variable 'years' must contain at least one year between "
+                f"{available_years[0]} and {available_years[-1]}."
+            )
+        for year in years:
+            if type(year) is not int:
+                raise TypeError("Variable 'years' must contain integers.")
+            if year not in available_years:
+                raise ValueError(
+                    f"No entries were found for {year}. Years must be between "
+                    f"{available_years[0]} and {available_years[-1]}"
+                )
+
+        extension = os.path.splitext(path)[1].lower()
+        fmt = extension[1:] if extension in (".gif", ".mp4") else "png"
+
+        if kind == "choropleth":
+            geometry_df = self._choropleth_geometry(simplify, region)
+            values = self._year_matrix("tfp", geometry_df["name"], years)
+            frames = ChoroplethFrames(geometry_df, values, years)
+        else:
+            self._build_index()
+            frames = GapminderFrames(
+                self._year_matrix("fertilizer_quantity", self._country_list, years),
+                self._year_matrix("output_quantity", self._country_list, years),
+                self._year_matrix("labor_quantity", self._country_list, years),
+                years,
+            )
+
+        with self.instrumentation.stage("export_animation", "render frames") as stage:
+            images = render_animation(frames, workers=workers, dpi=dpi)
+            stage.rows = len(images)
+        with self.instrumentation.stage("export_animation", "save"):
+            save_animation(images, path, fmt, years, fps=fps)
+        return path
+
+    def report(
+        self,
+        steps,
+        output_dir: str = "report",
+        workers: int = None,
+        force: bool = False,
+        refresh: bool = False,
+        dpi: int = 100,
+        chunksize: int = None,
+    ):
+        """
+        Runs a report, a list of invocations of the plotting methods and of forecast,
+        and writes one file per step to a folder. The shared intermediates are computed
+        once and the steps run in parallel processes. Each step is fingerprinted with
+        the data it reads, so a rerun only renders the charts and forecasts of the
+        countries and years whose data changed.
+
+        Parameters
+        ---------------
+        steps: list or str
+            the steps, each a dictionary with the keys method, args and optionally
+            kwargs, name and fmt, or a JSON file with such a list
+
+        output_dir: str
+            the folder of the files and of the fingerprints in 'report.json'
+
+        workers: int
+            number of worker processes, defaults to the number of CPUs
+
+        force: boolean
+            whether all steps should run, even if their data is unchanged
+
+        refresh: boolean
+            whether the download should be checked for updates and the data reloaded
+            first, otherwise the data already loaded is reported
+
+        dpi: int
+            resolution of raster images
+
+        chunksize: int
+            loads the data into a partitioned store with this number of rows per
+            partition, keeps the current loading mode if None
+
+        Returns
+        ---------------
+        summary: dict
+            the names of the 'ran' and 'skipped' steps and the errors of the 'failed' steps
+        """
+        options = {
+            "output_dir": output_dir,
+            "workers": workers,
+            "dpi": dpi,
+            "chunksize": chunksize,
+        }
+        if isinstance(steps, str):
+            pipeline = ReportPipeline.from_json(self, steps, **options)
+        else:
+            pipeline = ReportPipeline(self, steps, **options)
+        return pipeline.run(force=force, refresh=refresh)
+
+    def _year_matrix(self, column: str, countries, years: list):
+        """
+        Returns the values of a column as an array with one row per country
+        and one column per year. Missing values are NaN.
+        """
+        if self.store is None:
+            return self.panel.take(column, countries, years)
+
+        # the store is read for the years only, instead of building the whole panel
+        data_df = self.store.read(years=years, columns=[column])
+        matrix = data_df.pivot(index="Entity", columns="Year", values=column)
+        matrix.index = matrix.index.astype(str)
+        return matrix.reindex(index=list(countries), columns=years).to_numpy(
+            dtype=float
         )
-        plt.show()
@@ -0,0 +1,252 @@
+""" This module contains the correlation engine of the Agros class.
+Instead of recomputing the correlation matrix from the raw data on every call,
+the engine keeps running sufficient statistics of the columns: the pairwise
+counts, sums, sums of squares and cross-products over the rows where both columns
+are present. Appended rows are added to these statistics, so the Pearson matrix
+is updated incrementally, and matrices per group, e.g. per country or per window
+of years, are kept alongside the overall one. Spearman correlations are computed
+from ranks: the rows of every group are kept in blocks and each group is ranked once,
+its rank correlation cached until rows of the group arrive, so an update only ranks
+the groups it touches again. Like in pandas, the pairs of columns with missing values
+are ranked over the rows where both are present.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class _Moments:
+    """
+    The pairwise-complete sufficient statistics of the columns of a matrix.
+    The values are shifted by the means of the first block, so the sums stay
+    small and the matrix doesn't suffer from cancellation for large quantities.
+    """
+
+    def __init__(self, n_columns: int):
+        self.shift = None
+        self.counts = np.zeros((n_columns, n_columns))
+        self.sums = np.zeros((n_columns, n_columns))
+        self.squares = np.zeros((n_columns, n_columns))
+        self.products = np.zeros((n_columns, n_columns))
+
+    def add(self, values: np.ndarray):
+        """Adds the rows of a block to the statistics."""
+        if len(values) == 0:
+            return
+        if self.shift is None:
+            with np.errstate(invalid="ignore"):
+                present = ~np.isnan(values)
+                totals = np.where(present, values, 0).sum(axis=0)
+                self.shift = np.divide(
+                    totals,
+                    present.sum(axis=0),
+                    out=np.zeros(values.shape[1]),
+                    where=present.any(axis=0),
+                )
+
+        present = ~np.isnan(values)
+        mask = present.astype(float)
+        centered = np.where(present, values - self.shift, 0)
+
+        # entry [i, j] only sums the rows where both column i and column j are present
+        self.counts += mask.T @ mask
+        self.sums += centered.T @ mask
+        self.squares += (centered**2).T @ mask
+        self.products += centered.T @ centered
+
+    def pearson(self):
+        """Returns the Pearson correlation matrix of the statistics."""
+        counts = self.counts
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = counts * self.products - self.sums * self.sums.T
+            variance = counts * self.squares - self.sums**2
+            variance = np.where(variance > 0, variance, np.nan)
+            correlation = covariance / np.sqrt(variance * variance.T)
+        correlation[counts < 2] = np.nan
+        correlation = np.clip(correlation, -1, 1)
+
+        diagonal = np.diag_indices_from(correlation)
+        correlation[diagonal] = np.where(np.isnan(correlation[diagonal]), np.nan, 1.0)
+        return correlation
+
+
+def _spearman(values: np.ndarray):
+    """
+    Returns the pairwise-complete Spearman correlation matrix of the columns of a
+    matrix, like DataFrame.corr(method='spearman'). The columns are ranked once, and
+    only the pairs of columns missing in different rows are ranked again over the
+    rows where both are present.
+    """
+    present = ~np.isnan(values)
+    moments = _Moments(values.shape[1])
+    moments.add(pd.DataFrame(values).rank().to_numpy(dtype=float))
+    correlation = moments.pearson()
+
+    same_rows = (present[:, :, None] == present[:, None, :]).all(axis=0)
+    for i, j in zip(*np.nonzero(np.triu(~same_rows, 1))):
+        both = present[:, i] & present[:, j]
+        pair = _Moments(2)
+        pair.add(pd.DataFrame(values[both][:, [i, j]]).rank().to_numpy(dtype=float))
+        correlation[i, j] = correlation[j, i] = pair.pearson()[0, 1]
+    return correlation
+
+
+class CorrelationEngine:
+    """
+    Keeps the correlation matrices of some columns up to date as rows are appended.
+
+    Attributes
+    ---------------
+    columns: list
+        the names of the correlated columns
+
+    n_rows: int
+        number of rows added so far
+
+
+    Methods
+    ---------------
+    update
+        adds rows, optionally with the group of each row
+
+    pearson
+        returns the Pearson correlation matrix, overall or of a group
+
+    spearman
+        returns the Spearman correlation matrix, overall or of a group
+
+    groups
+        returns the keys of all groups
+    """
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        self.n_rows = 0
+        self._total = _Moments(len(self.columns))
+        self._groups = {}
+        # the rows of all groups, the key None holding all rows
+        self._blocks = {None: []}
+        self._ranks = {}
+
+    @classmethod
+    def from_frame(cls, data_df: pd.DataFrame, columns: list, keys=None):
+        """
+        Creates an engine from the columns of a DataFrame.
+
+        Parameters
+        ---------------
+        data_df: Pandas DataFrame
+            the data to correlate
+
+        columns: list
+            the names of the columns to correlate
+
+        keys: array-like
+            the group of each row, no groups if None
+
+        Returns
+        ---------------
+        engine: CorrelationEngine
+            the engine holding the statistics of the data
+        """
+        engine = cls(columns)
+        engine.update(data_df[columns].to_numpy(dtype=float), keys)
+        return engine
+
+    def update(self, values, keys=None):
+        """
+        Adds rows to the statistics of the engine and of their groups.
+
+        Parameters
+        ---------------
+        values: array-like
+            the new rows, one column per correlated column, missing values as NaN
+
+        keys: array-like
+            the group of each row, no groups if None
+        """
+        values = np.asarray(values, dtype=float)
+        if values.ndim != 2 or values.shape[1] != len(self.columns):
+            raise ValueError(
+                f"Expected rows with {len(self.columns)} columns, got {values.shape}"
+            )
+
+        self._total.add(values)
+        self._blocks[None].append(values)
+        # only the ranks of the groups with new rows change
+        self._ranks.pop(None, None)
+        if keys is not None:
+            keys = np.asarray(keys)
+            if len(keys) != len(values):
+                raise ValueError("Variable 'keys' must have one key per row.")
+            uniques, inverse = np.unique(keys, return_inverse=True)
+            # the rows sorted by group, so each group is one slice
+            order = np.argsort(inverse, kind="stable")
+            splits = np.cumsum(np.bincount(inverse, minlength=len(uniques)))[:-1]
+            for key, block in zip(uniques, np.split(values[order], splits)):
+                key = key.item() if isinstance(key, np.generic) else key
+                if key not in self._groups:
+                    self._groups[key] = _Moments(len(self.columns))
+                    self._blocks[key] = []
+                self._groups[key].add(block)
+                self._blocks[key].append(block)
+                self._ranks.pop(key, None)
+
+        self.n_rows += len(values)
+
+    def groups(self):
+        """Returns the keys of all groups, sorted."""
+        return sorted(self._groups)
+
+    def _moments(self, key):
+        if key is None:
+            return self._total
+        if key not in self._groups:
+            raise ValueError(f"{key} is not a group of the correlation engine")
+        return self._groups[key]
+
+    def _frame(self, matrix: np.ndarray):
+        return pd.DataFrame(matrix, index=self.columns, columns=self.columns)
+
+    def pearson(self, key=None):
+        """
+        Returns the Pearson correlation matrix of the rows added so far.
+        Like in pandas, each pair of columns is correlated over the rows where both are present.
+
+        Parameters
+        ---------------
+        key: any
+            the group to correlate, all rows if None
+
+        Returns
+        ---------------
+        correlation: Pandas DataFrame
+            the correlation of each pair of columns
+        """
+        return self._frame(self._moments(key).pearson())
+
+    def spearman(self, key=None):
+        """
+        Returns the Spearman correlation matrix of the rows added so far.
+        Like in pandas, each pair of columns is ranked over the rows where both are
+        present. The correlation of the ranks of a group is cached until rows of the
+        group are added.
+
+        Parameters
+        ---------------
+        key: any
+            the group to correlate, all rows if None
+
+        Returns
+        ---------------
+        correlation: Pandas DataFrame
+            the rank correlation of each pair of columns
+        """
+        self._moments(key)
+        if key not in self._ranks:
+            blocks = self._blocks[key] or [np.empty((0, len(self.columns)))]
+            if len(blocks) > 1:
+                # the blocks of a group are joined once, not again on every call
+                self._blocks[key] = [np.concatenate(blocks)]
+            self._ranks[key] = _spearman(self._blocks[key][0])
+        return self._frame(self._ranks[key])
@@ -0,0 +1,417 @@
+""" This module contains the binary cache of the cleaned agricultural data of the Agros class.
+Instead of parsing the downloaded csv file on every load, the cleaned DataFrame is saved
+once as NumPy arrays: the Entity column as categorical codes, the Year column as small
+integers and all metrics as one float32 block. The arrays are memory-mapped when loaded,
+so several processes share the same pages instead of each holding a copy.
+A cache belongs to one version of the csv file and is rebuilt when the file changes.
+Sources larger than memory are written chunk by chunk as a partitioned store of the
+same arrays, which is queried lazily, one partition at a time.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# bump when the layout of the cached files changes
+CACHE_VERSION = 2
+
+
+def source_signature(path: str):
+    """
+    Describes the version of a source file by its size and modification time.
+
+    Parameters
+    ---------------
+    path: str
+        path of the source csv file
+
+    Returns
+    ---------------
+    signature: str
+        short hash identifying the version of the file
+    """
+    stat = os.stat(path)
+    key = f"{CACHE_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def compact_frame(data_df: pd.DataFrame, float_dtype=np.float32):
+    """
+    Converts the agricultural data to compact dtypes.
+    Entity becomes categorical, Year the smallest fitting integer and every
+    other column a float of the given dtype.
+
+    Parameters
+    ---------------
+    data_df: Pandas DataFrame
+        the cleaned agricultural data
+
+    float_dtype: numpy dtype
+        dtype of the metric columns
+
+    Returns
+    ---------------
+    compact_df: Pandas DataFrame
+        the same data with compact dtypes and a fresh index
+    """
+    compact_df = data_df.reset_index(drop=True)
+    metric_columns = [x for x in compact_df.columns if x not in ("Entity", "Year")]
+    return compact_df.astype(
+        {
+            "Entity": "category",
+            "Year": pd.to_numeric(compact_df["Year"], downcast="integer").dtype,
+            **{column: float_dtype for column in metric_columns},
+        }
+    )
+
+
+def write_frame(data_df: pd.DataFrame, directory: str, signature: str):
+    """
+    Saves a compact DataFrame into the cache folder of a source signature.
+    The files are written to a temporary folder that is renamed into place,
+    so a reader never sees a partial cache. Caches of older signatures are removed.
+
+    Parameters
+    ---------------
+    data_df: Pandas DataFrame
+        the compact data, as returned by compact_frame
+
+    directory: str
+        the cache folder, e.g. 'downloads/cache'
+
+    signature: str
+        the signature of the source file, as returned by source_signature
+    """
+    os.makedirs(directory, exist_ok=True)
+    temp_directory = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+
+    entity = data_df["Entity"].astype("category").cat
+    metric_columns = [x for x in data_df.columns if x not in ("Entity", "Year")]
+    metrics = np.ascontiguousarray(data_df[metric_columns].to_numpy().T)
+
+    np.save(os.path.join(temp_directory, "entity_codes.npy"), entity.codes.to_numpy())
+    np.save(
+        os.path.join(temp_directory, "entities.npy"),
+        entity.categories.to_numpy().astype(str),
+    )
+    np.save(os.path.join(temp_directory, "year.npy"), data_df["Year"].to_numpy())
+    np.save(os.path.join(temp_directory, "metrics.npy"), metrics)
+    with open(os.path.join(temp_directory, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump({"columns": list(data_df.columns), "metrics": metric_columns}, file)
+
+    try:
+        os.rename(temp_directory, os.path.join(directory, signature))
+    except OSError:
+        # another process has written the same cache in the meantime
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+    for name in os.listdir(directory):
+        if name != signature and not name.startswith(".tmp-"):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def read_frame(directory: str, signature: str, mmap: bool = True):
+    """
+    Loads the cached DataFrame of a source signature.
+    The metric block is memory-mapped read-only and used by the DataFrame
+    without copying.
+
+    Parameters
+    ---------------
+    directory: str
+        the cache folder, e.g. 'downloads/cache'
+
+    signature: str
+        the signature of the current source file
+
+    mmap: boolean
+        whether the arrays should be memory-mapped instead of read into memory
+
+    Returns
+    ---------------
+    data_df: Pandas DataFrame or None
+        the cached data, or None if there is no cache for this signature
+    """
+    path = os.path.join(directory, signature)
+    if not os.path.isfile(os.path.join(path, "meta.json")):
+        return None
+
+    mmap_mode = "r" if mmap else None
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+        meta = json.load(file)
+    metrics = np.load(os.path.join(path, "metrics.npy"), mmap_mode=mmap_mode)
+    codes = np.load(os.path.join(path, "entity_codes.npy"), mmap_mode=mmap_mode)
+    entities = np.load(os.path.join(path, "entities.npy"))
+    year = np.load(os.path.join(path, "year.npy"), mmap_mode=mmap_mode)
+
+    # the transposed block keeps one contiguous row per metric, as pandas stores it
+    data_df = pd.DataFrame(metrics.T, columns=meta["metrics"], copy=False)
+    data_df.insert(
+        meta["columns"].index("Entity"),
+        "Entity",
+        pd.Categorical.from_codes(codes, entities),
+    )
+    data_df.insert(meta["columns"].index("Year"), "Year", year)
+    return data_df
+
+
+def write_partitions(chunks, directory: str, signature: str):
+    """
+    Saves a stream of compact DataFrames as a partitioned store of a source signature.
+    Every chunk becomes one partition with the layout of the binary cache, except that
+    the Entity codes refer to one dictionary of all entities shared by the partitions.
+    The manifest records the entities and years of each partition, so a query only
+    opens the partitions it needs. Only one chunk is held in memory at a time.
+
+    Parameters
+    ---------------
+    chunks: iterable
+        the compact data in chunks, as returned by compact_frame
+
+    directory: str
+        the store folder, e.g. 'downloads/store'
+
+    signature: str
+        the signature of the source file, as returned by source_signature
+    """
+    os.makedirs(directory, exist_ok=True)
+    temp_directory = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+
+    entity_codes = {}
+    columns = None
+    metric_columns = None
+    partitions = []
+    for chunk in chunks:
+        if columns is None:
+            columns = list(chunk.columns)
+            metric_columns = [x for x in columns if x not in ("Entity", "Year")]
+        if len(chunk) == 0:
+            continue
+
+        # map the entities of the chunk to the codes of the whole store
+        entity = chunk["Entity"].astype("category").cat
+        for name in entity.categories.astype(str):
+            entity_codes.setdefault(name, len(entity_codes))
+        mapping = np.array(
+            [entity_codes[name] for name in entity.categories.astype(str)],
+            dtype=np.int32,
+        )
+        codes = mapping[entity.codes.to_numpy()]
+        year = chunk["Year"].to_numpy().astype(np.int32)
+
+        name = f"part-{len(partitions):05d}"
+        path = os.path.join(temp_directory, name)
+        os.makedirs(path)
+        np.save(os.path.join(path, "entity_codes.npy"), codes)
+        np.save(os.path.join(path, "year.npy"), year)
+        np.save(
+            os.path.join(path, "metrics.npy"),
+            np.ascontiguousarray(chunk[metric_columns].to_numpy().T),
+        )
+        partitions.append(
+            {
+                "name": name,
+                "rows": len(chunk),
+                "entities": np.unique(codes).tolist(),
+                "years": np.unique(year).tolist(),
+            }
+        )
+
+    if not partitions:
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        raise ValueError("The source of the partitioned store contains no data.")
+
+    np.save(
+        os.path.join(temp_directory, "entities.npy"),
+        np.array(list(entity_codes), dtype=str),
+    )
+    with open(os.path.join(temp_directory, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(
+            {"columns": columns, "metrics": metric_columns, "partitions": partitions},
+            file,
+        )
+
+    try:
+        os.rename(temp_directory, os.path.join(directory, signature))
+    except OSError:
+        # another process has written the same store in the meantime
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+    for name in os.listdir(directory):
+        if name != signature and not name.startswith(".tmp-"):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class PartitionedStore:
+    """
+    Lazily queries the partitioned store of a source signature.
+    Partitions are memory-mapped when read and skipped entirely if the manifest
+    shows they hold none of the requested entities or years.
+
+    Attributes
+    ---------------
+    path: str
+        the folder of the store
+
+    columns: list
+        the columns of the data, in their original order
+
+    metrics: list
+        the columns of the metric block
+
+    entities: numpy array
+        the names of all entities, sorted
+
+
+    Methods
+    ---------------
+    open
+        returns the store of a signature, or None if it hasn't been written
+
+    years
+        returns all years of the data
+
+    read
+        returns the rows of some entities, years and columns
+
+    iter_frames
+        yields each partition as a DataFrame
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        self.columns = meta["columns"]
+        self.metrics = meta["metrics"]
+        self._partitions = meta["partitions"]
+
+        # the codes follow the first appearance, the categories are sorted by name
+        names = np.load(os.path.join(path, "entities.npy"))
+        order = np.argsort(names, kind="stable")
+        self.entities = names[order]
+        self._ranks = np.empty(len(names), dtype=np.int32)
+        self._ranks[order] = np.arange(len(names), dtype=np.int32)
+        self._codes = {name: code for code, name in enumerate(names.tolist())}
+
+    @classmethod
+    def open(cls, directory: str, signature: str):
+        """Returns the store of a source signature, or None if there is none."""
+        path = os.path.join(directory, signature)
+        if not os.path.isfile(os.path.join(path, "meta.json")):
+            return None
+        return cls(path)
+
+    def years(self):
+        """Returns the sorted list of all years of the data."""
+        years = set()
+        for partition in self._partitions:
+            years.update(partition["years"])
+        return sorted(years)
+
+    def _frame(self, partition: dict, metrics: list, rows=None):
+        """Builds the DataFrame of a partition, optionally of some rows only."""
+        path = os.path.join(self.path, partition["name"])
+        block = np.load(os.path.join(path, "metrics.npy"), mmap_mode="r")
+        codes = np.load(os.path.join(path, "entity_codes.npy"), mmap_mode="r")
+        year = np.load(os.path.join(path, "year.npy"), mmap_mode="r")
+
+        positions = [self.metrics.index(x) for x in metrics]
+        if rows is None and positions == list(range(len(self.metrics))):
+            block = block.T
+        elif rows is None:
+            block = block[positions].T
+        else:
+            block = block[np.ix_(positions, rows)].T
+            codes = codes[rows]
+            year = year[rows]
+
+        frame = pd.DataFrame(block, columns=metrics, copy=False)
+        columns = [x for x in self.columns if x in ("Entity", "Year") or x in metrics]
+        frame.insert(
+            columns.index("Entity"),
+            "Entity",
+            pd.Categorical.from_codes(self._ranks[codes], self.entities),
+        )
+        frame.insert(columns.index("Year"), "Year", year)
+        return frame
+
+    def read(self, entities=None, years=None, columns=None):
+        """
+        Returns the rows of some entities and years, sorted by entity and year.
+        Only the partitions holding any of them are opened.
+
+        Parameters
+        ---------------
+        entities: list
+            the entities to read, all entities if None
+
+        years: list
+            the years to read, all years if None
+
+        columns: list
+            the metric columns to read, all metrics if None
+
+        Returns
+        ---------------
+        data_df: Pandas DataFrame
+            the selected rows, with Entity and Year and the selected metrics
+        """
+        metrics = (
+            self.metrics
+            if columns is None
+            else [x for x in self.metrics if x in columns]
+        )
+        codes = None
+        if entities is not None:
+            codes = [self._codes[x] for x in entities if x in self._codes]
+        if years is not None:
+            years = list(years)
+
+        frames = []
+        for partition in self._partitions:
+            if codes is not None and not np.isin(partition["entities"], codes).any():
+                continue
+            if years is not None and not np.isin(partition["years"], years).any():
+                continue
+
+            path = os.path.join(self.path, partition["name"])
+            mask = np.ones(partition["rows"], dtype=bool)
+            if codes is not None:
+                part_codes = np.load(
+                    os.path.join(path, "entity_codes.npy"), mmap_mode="r"
+                )
+                mask &= np.isin(part_codes, codes)
+            if years is not None:
+                part_years = np.load(os.path.join(path, "year.npy"), mmap_mode="r")
+                mask &= np.isin(part_years, years)
+            frames.append(self._frame(partition, metrics, np.flatnonzero(mask)))
+
+        if not frames:
+            frames.append(self._frame(self._partitions[0], metrics, np.array([], int)))
+        data_df = pd.concat(frames, ignore_index=True)
+        if len(frames) > 1:
+            data_df = data_df.sort_values(["Entity", "Year"], kind="stable")
+        return data_df.reset_index(drop=True)
+
+    def iter_frames(self, columns=None):
+        """
+        Yields each partition as a memory-mapped DataFrame, one at a time.
+
+        Parameters
+        ---------------
+        columns: list
+            the metric columns to read, all metrics if None
+        """
+        metrics = (
+            self.metrics
+            if columns is None
+            else [x for x in self.metrics if x in columns]
+        )
+        for partition in self._partitions:
+            yield self._frame(partition, metrics)
@@ -0,0 +1,157 @@
+""" This module contains the density rendering of the Agros class.
+Charts with more points than can be told apart, like the gapminder chart or the
+comparison of many entities of a large panel, are drawn as a raster instead: the points
+are counted in the cells of a 2D histogram with vectorized NumPy, on logarithmic axes
+where the values span orders of magnitude, and the counts are drawn as one image with
+a logarithmic color scale. The cost of drawing depends on the number of cells only,
+so the render time stays about the same however many points there are.
+"""
+
+# matplotlib is only imported when a raster is drawn
+# pylint: disable=import-outside-toplevel
+
+import numpy as np
+
+# cells of the rasters along the x and y axes
+DENSITY_BINS = (160, 100)
+
+
+def _cells(values: np.ndarray, n_bins: int, value_range: tuple = None):
+    """Returns the cell of each value and the range of the cells."""
+    if value_range is None:
+        value_range = (values.min(), values.max())
+        if value_range[0] == value_range[1]:
+            value_range = (value_range[0] - 0.5, value_range[1] + 0.5)
+    low, high = value_range
+    cells = ((values - low) * (n_bins / (high - low))).astype(np.intp)
+    np.clip(cells, 0, n_bins - 1, out=cells)
+    return cells, (float(low), float(high))
+
+
+def density_raster(
+    x,
+    y,
+    bins: tuple = DENSITY_BINS,
+    log_x: bool = True,
+    log_y: bool = True,
+    x_range: tuple = None,
+):
+    """
+    Counts points in the cells of a 2D histogram.
+
+    Parameters
+    ---------------
+    x, y: array-like
+        the coordinates of the points, of any shape. Points with a missing coordinate,
+        or a coordinate not above zero on a logarithmic axis, are left out
+
+    bins: tuple
+        number of cells along the x and the y axis
+
+    log_x, log_y: boolean
+        whether the cells are spaced logarithmically along the axis
+
+    x_range: tuple
+        the range of the x axis, in decimal exponents if logarithmic,
+        the range of the points by default
+
+    Returns
+    ---------------
+    raster: numpy array
+        the number of points of each cell, one row per y cell from the bottom
+
+    extent: tuple
+        the left, right, bottom and top of the raster, in decimal exponents
+        on logarithmic axes
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    keep = np.isfinite(x) & np.isfinite(y)
+    if log_x:
+        keep &= x > 0
+    if log_y:
+        keep &= y > 0
+    x, y = x[keep], y[keep]
+
+    n_x, n_y = bins
+    if len(x) == 0:
+        return np.zeros((n_y, n_x), dtype=np.int64), (0.0, 1.0, 0.0, 1.0)
+    if log_x:
+        x = np.log10(x)
+    if log_y:
+        y = np.log10(y)
+
+    x_cells, (left, right) = _cells(x, n_x, x_range)
+    y_cells, (bottom, top) = _cells(y, n_y)
+    # one flat count of all cells is much faster than histogram2d
+    raster = np.bincount(y_cells * n_x + x_cells, minlength=n_x * n_y)
+    return raster.reshape(n_y, n_x), (left, right, bottom, top)
+
+
+def _power_label(exponent: float, _=None):
+    """Returns the label of a decimal exponent, as a power of ten if it is whole."""
+    if float(exponent).is_integer():
+        return f"$10^{{{exponent:g}}}$"
+    return f"{10**exponent:.3g}"
+
+
+def _exponent_axis(axis):
+    """Labels an axis in decimal exponents with the values they stand for."""
+    from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+    axis.set_major_locator(MaxNLocator(integer=True))
+    axis.set_major_formatter(FuncFormatter(_power_label))
+
+
+def draw_density(
+    axis,
+    raster: np.ndarray,
+    extent: tuple,
+    log_x: bool = True,
+    log_y: bool = True,
+    label: str = "Number of points",
+    cmap: str = "viridis",
+):
+    """
+    Draws a raster of counts as one image with a logarithmic color scale and a colorbar.
+    Empty cells are left blank.
+
+    Parameters
+    ---------------
+    axis: matplotlib Axes
+        the axes to draw on
+
+    raster, extent:
+        the counts and their extent, as returned by density_raster
+
+    log_x, log_y: boolean
+        whether the axis of the raster is logarithmic, labeled as powers of ten
+
+    label: str
+        the label of the colorbar
+
+    cmap: str
+        the colormap of the counts
+
+    Returns
+    ---------------
+    image: matplotlib AxesImage
+        the drawn image
+    """
+    from matplotlib.colors import LogNorm
+
+    image = axis.imshow(
+        np.ma.masked_equal(raster, 0),
+        origin="lower",
+        extent=extent,
+        aspect="auto",
+        interpolation="nearest",
+        cmap=cmap,
+        norm=LogNorm(vmin=1, vmax=max(int(raster.max()), 2)),
+    )
+    if log_x:
+        _exponent_axis(axis.xaxis)
+    if log_y:
+        _exponent_axis(axis.yaxis)
+    axis.figure.colorbar(image, ax=axis, label=label)
+    return image
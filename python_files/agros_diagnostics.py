@@ -0,0 +1,237 @@
+""" This module contains the time series diagnostics of the Agros class.
+The statistics are computed for all countries at once on a matrix with one row per
+country and one column per year, instead of looping over the countries.
+Rolling means and standard deviations come from cumulative sums, and the augmented
+Dickey-Fuller and KPSS stationarity tests solve the regressions of all countries
+as one batch of small least squares problems. The tests follow the defaults of
+statsmodels: the ADF lag length is chosen by AIC and the KPSS bandwidth with the
+method of Hobijn et al. (1998).
+"""
+
+# statsmodels is only imported for the MacKinnon p-values of the ADF test
+# pylint: disable=import-outside-toplevel
+
+import numpy as np
+
+# critical values and p-values of the KPSS level stationarity test
+KPSS_CRITICAL = [0.347, 0.463, 0.574, 0.739]
+KPSS_PVALUES = [0.10, 0.05, 0.025, 0.01]
+
+
+def rolling_statistics(matrix: np.ndarray, window: int = 12):
+    """
+    Computes the rolling mean and standard deviation of every row of a matrix.
+    Like in pandas, a window with a missing value has no statistics.
+
+    Parameters
+    ---------------
+    matrix: numpy array
+        the values of each country (rows) and year (columns)
+
+    window: int
+        number of consecutive years per window
+
+    Returns
+    ---------------
+    mean: numpy array
+        the rolling mean, of the same shape as the matrix
+
+    std: numpy array
+        the rolling standard deviation with one degree of freedom
+    """
+    if not isinstance(window, int) or window < 2:
+        raise ValueError("Variable 'window' must be an integer of at least 2.")
+
+    matrix = np.asarray(matrix, dtype=float)
+    valid = ~np.isnan(matrix)
+    # shift every row by its mean, so the cumulative sums don't lose precision
+    with np.errstate(invalid="ignore"):
+        center = np.nan_to_num(np.nanmean(np.where(valid, matrix, np.nan), axis=1))
+    values = np.where(valid, matrix - center[:, None], 0)
+
+    def window_sum(array):
+        total = np.cumsum(np.pad(array, ((0, 0), (1, 0))), axis=1)
+        return total[:, window:] - total[:, :-window]
+
+    count = window_sum(valid.astype(float))
+    first = window_sum(values)
+    second = window_sum(values**2)
+
+    mean = np.full(matrix.shape, np.nan)
+    std = np.full(matrix.shape, np.nan)
+    full = count == window
+    with np.errstate(invalid="ignore"):
+        variance = np.maximum((second - first**2 / window) / (window - 1), 0)
+    mean[:, window - 1 :] = np.where(full, first / window + center[:, None], np.nan)
+    std[:, window - 1 :] = np.where(full, np.sqrt(variance), np.nan)
+    return mean, std
+
+
+def _right_align(matrix: np.ndarray):
+    """
+    Moves the values of every row to its end, dropping the gaps like dropna.
+    Returns the aligned matrix and the number of values of each row.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    valid = ~np.isnan(matrix)
+    order = np.argsort(valid, axis=1, kind="stable")
+    return np.take_along_axis(matrix, order, axis=1), valid.sum(axis=1)
+
+
+def _lag_products(residuals: np.ndarray, lag: int):
+    """Sums the products of the residuals of each row with their lagged values."""
+    return np.sum(residuals[:, lag:] * residuals[:, :-lag], axis=1)
+
+
+def kpss_test(matrix: np.ndarray):
+    """
+    Runs the KPSS test for level stationarity on every row of a matrix.
+    Missing values are dropped. Rows with less than three values get NaN.
+
+    Parameters
+    ---------------
+    matrix: numpy array
+        the values of each country (rows) and year (columns)
+
+    Returns
+    ---------------
+    result: dict
+        the arrays 'stat', 'pvalue' and 'lags', with one entry per row.
+        The p-values are interpolated and capped at 0.01 and 0.1
+    """
+    values, nobs = _right_align(matrix)
+    valid = ~np.isnan(values)
+    usable = nobs >= 3
+    safe_nobs = np.maximum(nobs, 1).astype(float)
+
+    mean = np.where(valid, values, 0).sum(axis=1) / safe_nobs
+    residuals = np.where(valid, values - mean[:, None], 0)
+    eta = np.sum(np.cumsum(residuals, axis=1) ** 2, axis=1) / safe_nobs**2
+
+    # bandwidth of Hobijn et al. (1998)
+    covlags = np.power(safe_nobs, 2.0 / 9.0).astype(int)
+    s_zero = np.sum(residuals**2, axis=1) / safe_nobs
+    s_one = np.zeros(len(values))
+    for lag in range(1, covlags.max(initial=0) + 1):
+        product = _lag_products(residuals, lag) / (safe_nobs / 2.0)
+        product = np.where(lag <= covlags, product, 0)
+        s_zero += product
+        s_one += lag * product
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gamma = 1.1447 * np.power((s_one / s_zero) ** 2, 1.0 / 3.0)
+        lags = np.nan_to_num(gamma * np.power(safe_nobs, 1.0 / 3.0)).astype(int)
+    lags = np.minimum(lags, nobs - 1)
+
+    # long run variance with the Bartlett kernel
+    s_hat = np.sum(residuals**2, axis=1)
+    for lag in range(1, lags.max(initial=0) + 1):
+        weight = np.where(lag <= lags, 1.0 - lag / (lags + 1.0), 0)
+        s_hat += 2 * _lag_products(residuals, lag) * weight
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stat = eta / (s_hat / safe_nobs)
+
+    stat = np.where(usable, stat, np.nan)
+    pvalue = np.where(
+        np.isnan(stat), np.nan, np.interp(stat, KPSS_CRITICAL, KPSS_PVALUES)
+    )
+    return {"stat": stat, "pvalue": pvalue, "lags": np.where(usable, lags, -1)}
+
+
+def _batched_ols(design: np.ndarray, target: np.ndarray, weights: np.ndarray):
+    """
+    Solves one least squares regression per row, over the observations with weight one.
+    Returns the t-statistic of the first regressor, the AIC and the number of observations.
+    """
+    weighted = design * weights[:, :, None]
+    gram = np.einsum("ntk,ntl->nkl", weighted, design)
+    moment = np.einsum("ntk,nt->nk", weighted, target)
+    inverse = np.linalg.pinv(gram)
+    beta = np.einsum("nkl,nl->nk", inverse, moment)
+
+    residuals = (target - np.einsum("ntk,nk->nt", design, beta)) * weights
+    ssr = np.sum(residuals**2, axis=1)
+    nobs = weights.sum(axis=1)
+    n_regressors = design.shape[2]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma2 = ssr / (nobs - n_regressors)
+        tstat = beta[:, 0] / np.sqrt(sigma2 * inverse[:, 0, 0])
+        aic = nobs * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1) + 2 * n_regressors
+    return tstat, aic, nobs
+
+
+def adf_test(matrix: np.ndarray):
+    """
+    Runs the augmented Dickey-Fuller test with a constant on every row of a matrix.
+    The number of lagged differences is chosen per row by AIC, up to the maximum
+    lag of Schwert (1989). Missing values are dropped. Rows that are too short get NaN.
+
+    Parameters
+    ---------------
+    matrix: numpy array
+        the values of each country (rows) and year (columns)
+
+    Returns
+    ---------------
+    result: dict
+        the arrays 'stat', 'pvalue', 'lags' and 'nobs', with one entry per row
+    """
+    from statsmodels.tsa.adfvalues import mackinnonp
+
+    values, length = _right_align(matrix)
+    n_rows, n_years = values.shape
+    start = n_years - length
+
+    maxlag = np.ceil(12.0 * np.power(length / 100.0, 1 / 4.0)).astype(int)
+    maxlag = np.minimum(length // 2 - 2, maxlag)
+    usable = maxlag >= 0
+    max_lag = maxlag.max(initial=-1)
+
+    # the regression of year t explains the difference to year t + 1 by the level
+    # of year t, the differences of the max_lag previous years and a constant
+    padded = np.pad(values, ((0, 0), (max_lag + 1, 0)), constant_values=np.nan)
+    differences = np.diff(padded, axis=1)
+    n_steps = n_years - 1
+    offset = max_lag + 1
+    target = differences[:, offset : offset + n_steps]
+    columns = [padded[:, offset : offset + n_steps]]
+    for lag in range(1, max_lag + 1):
+        columns.append(differences[:, offset - lag : offset - lag + n_steps])
+    columns.append(np.ones((n_rows, n_steps)))
+    design = np.nan_to_num(np.stack(columns, axis=2))
+    target = np.nan_to_num(target)
+    steps = np.arange(n_steps)
+
+    def regression(lags: np.ndarray, sample_lags: np.ndarray, rows):
+        n_lags = lags[rows][0]
+        weights = (steps[None, :] >= (start + sample_lags)[rows, None]).astype(float)
+        selected = np.concatenate([np.arange(n_lags + 1), [max_lag + 1]])
+        return _batched_ols(design[rows][:, :, selected], target[rows], weights)
+
+    # choose the lag length by AIC on the common sample of the maximum lag
+    aic = np.full((max_lag + 1, n_rows), np.inf)
+    rows = np.flatnonzero(usable)
+    for lag in range(max_lag + 1):
+        candidates = rows[maxlag[rows] >= lag]
+        if len(candidates) > 0:
+            lags = np.full(n_rows, lag)
+            aic[lag, candidates] = regression(lags, maxlag, candidates)[1]
+    bestlag = np.argmin(aic, axis=0) if max_lag >= 0 else np.zeros(n_rows, int)
+
+    # rerun the regression with the chosen lag on all available years
+    stat = np.full(n_rows, np.nan)
+    nobs = np.zeros(n_rows, dtype=int)
+    for lag in np.unique(bestlag[usable]):
+        group = rows[bestlag[rows] == lag]
+        tstat, _, group_nobs = regression(bestlag, bestlag, group)
+        stat[group] = tstat
+        nobs[group] = group_nobs
+
+    pvalue = np.array(
+        [mackinnonp(x, regression="c", N=1) if np.isfinite(x) else np.nan for x in stat]
+    )
+    return {
+        "stat": stat,
+        "pvalue": pvalue,
+        "lags": np.where(usable, bestlag, -1),
+        "nobs": nobs,
+    }
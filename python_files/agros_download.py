@@ -0,0 +1,222 @@
+""" This module contains the download helpers of the Agros class.
+The agricultural dataset is streamed in chunks to a partial file next to its
+destination and renamed into place once it is complete, so an interrupted
+download never leaves a corrupt csv file behind. An interrupted download is
+resumed with a range request. When the dataset is refreshed, the ETag and
+Last-Modified validators of the previous download are sent along, so an
+unchanged dataset is not downloaded again.
+"""
+
+# requests is only imported once a download is made, to keep the import of Agros fast
+# pylint: disable=import-outside-toplevel
+
+import json
+import os
+
+DATA_URL = (
+    "https://raw.githubusercontent.com/owid/owid-datasets/master/datasets/"
+    "Agricultural%20total%20factor%20productivity%20(USDA)"
+    "/Agricultural%20total%20factor%20productivity%20(USDA).csv"
+)
+
+
+def make_session(retries: int = 3, backoff_factor: float = 0.5):
+    """
+    Creates a requests Session with a pooled connection adapter that retries
+    failed connections and transient server errors.
+
+    Parameters
+    ---------------
+    retries: int
+        maximum number of retries of a request
+
+    backoff_factor: float
+        factor of the exponential waiting time between the retries
+
+    Returns
+    ---------------
+    session: requests.Session
+        the session to use for the downloads
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _read_json(path: str):
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path: str, content: dict):
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(content, file)
+    os.replace(path + ".tmp", path)
+
+
+def _validators(response):
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+def _range_total(response):
+    """Returns the full size of the file in the Content-Range header, if any."""
+    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def _expected_size(response, offset: int):
+    """Returns the full size of the file announced by a response, if any."""
+    if response.status_code == 206:
+        return _range_total(response)
+    length = response.headers.get("Content-Length")
+    return offset + int(length) if length is not None else None
+
+
+def _complete(part_path: str, path: str):
+    """Moves a complete partial file and its validators into place."""
+    os.replace(part_path, path)
+    _write_json(path + ".json", _read_json(part_path + ".json"))
+    if os.path.isfile(part_path + ".json"):
+        os.remove(part_path + ".json")
+
+
+def _discard(part_path: str):
+    """Removes a partial file that can't be resumed, with its validators."""
+    for stale_path in (part_path, part_path + ".json"):
+        if os.path.isfile(stale_path):
+            os.remove(stale_path)
+
+
+def fetch(
+    url: str,
+    path: str,
+    session=None,
+    refresh: bool = False,
+    chunk_size: int = 1 << 16,
+    timeout: float = 30,
+    attempts: int = 3,
+):
+    """
+    Downloads a file, unless it already exists or hasn't changed on the server.
+    The body is streamed to 'path.part' and renamed to 'path' when complete.
+    The validators of the download are saved in 'path.json'.
+
+    Parameters
+    ---------------
+    url: str
+        the address of the file
+
+    path: str
+        the destination of the file
+
+    session: requests.Session
+        the session to use, a new retrying session if None
+
+    refresh: boolean
+        whether an existing file should be revalidated against the server
+
+    chunk_size: int
+        number of bytes written per chunk
+
+    timeout: float
+        seconds to wait for the server to connect or send data
+
+    attempts: int
+        number of times an interrupted download is resumed before giving up
+
+    Returns
+    ---------------
+    changed: boolean
+        whether a new version of the file was saved
+    """
+    if os.path.isfile(path) and not refresh:
+        return False
+
+    import requests
+
+    if session is None:
+        session = make_session()
+
+    part_path = path + ".part"
+    meta = _read_json(path + ".json")
+
+    for attempt in range(attempts):
+        headers = {"Accept-Encoding": "identity"}
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        part_meta = _read_json(part_path + ".json")
+        validator = part_meta.get("etag") or part_meta.get("last_modified")
+
+        if offset > 0 and validator:
+            # resume the partial download if it still belongs to the same version
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        elif os.path.isfile(path):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with session.get(
+            url, headers=headers, stream=True, timeout=timeout
+        ) as response:
+            if response.status_code == 304:
+                return False
+            if response.status_code == 416 and "Range" in headers:
+                # the partial file is already complete if the process stopped before
+                # renaming it, otherwise it doesn't match the server and is started over
+                if _range_total(response) == offset:
+                    _complete(part_path, path)
+                    return True
+                _discard(part_path)
+                continue
+            response.raise_for_status()
+
+            if response.status_code != 206:
+                offset = 0
+                _write_json(part_path + ".json", _validators(response))
+            expected_size = _expected_size(response, offset)
+
+            try:
+                with open(part_path, "ab" if offset else "wb") as file:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        file.write(chunk)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                if attempt == attempts - 1:
+                    raise
+                continue
+
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size > expected_size:
+            # the partial file doesn't match the server anymore, start over
+            os.remove(part_path)
+        if expected_size is not None and size != expected_size:
+            if attempt == attempts - 1:
+                raise IOError(
+                    f"Download of {url} is incomplete: {size} of {expected_size} bytes"
+                )
+            continue
+
+        _complete(part_path, path)
+        return True
+
+    raise IOError(f"Download of {url} failed after {attempts} attempts")
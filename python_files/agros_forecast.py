@@ -0,0 +1,607 @@
+""" This module contains the forecasting helpers of the Agros class.
+An ARIMA model is fitted on the total factor productivity of each country and
+used to forecast the following years. The models of many countries can be fitted
+at once across a process pool, and the forecasts are returned as one tidy
+DataFrame instead of being plotted.
+Fitted models can be kept in a ModelStore, so that the order search only runs
+again for countries without a stored model.
+Rolling-origin backtests refit the models at every cutoff year. After the order
+search of the first cutoff, the order is kept and each refit starts from the
+previous parameters, which is much faster than searching again.
+As a faster engine for screening all countries, the 'statespace' engine fits local
+level and local linear trend models on all countries at once with agros_statespace.
+"""
+
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# pmdarima pulls in statsmodels and scikit-learn, so it is only imported once a model is fitted
+# pylint: disable=import-outside-toplevel
+
+import numpy as np
+import pandas as pd
+
+from agros_statespace import fit_statespace
+
+# settings of the stepwise order search used for every country
+ARIMA_SEARCH = {
+    "start_p": 1,
+    "start_q": 0,
+    "max_p": 10,
+    "max_q": 10,
+    "m": 1,
+    "start_P": 0,
+    "seasonal": False,
+    "d": None,
+    "D": 1,
+    "error_action": "ignore",  # Ignore incompatible settings
+    "suppress_warnings": True,
+    "stepwise": True,
+}
+
+# ways of refitting the models of a backtest at each cutoff
+BACKTEST_MODES = ("search", "refit", "update")
+
+# fewest years a model of a backtest is trained on
+MIN_TRAIN_YEARS = 10
+
+# the failure of a country without enough training years at any cutoff
+_TOO_SHORT = f"ValueError: fewer than {MIN_TRAIN_YEARS} years before every cutoff"
+
+# forecasting engines, one ARIMA search per country or state space models of all at once
+FORECAST_ENGINES = ("arima", "statespace")
+
+
+def fit_arima(series, trace: bool = False):
+    """
+    Runs the stepwise auto ARIMA order search on a series and returns the fitted model.
+
+    Parameters
+    ---------------
+    series: array-like
+        the total factor productivity of one country, ordered by year
+
+    trace: boolean
+        whether every candidate model of the search should be printed
+
+    Returns
+    ---------------
+    model: pmdarima.arima.ARIMA
+        the best model found by the search, fitted on the series
+    """
+    from pmdarima.arima import auto_arima
+
+    return auto_arima(series, trace=trace, **ARIMA_SEARCH)
+
+
+def refit_order(entry: dict, series):
+    """
+    Fits a stored ARIMA order on a new series without searching the order again.
+    The stored parameters are used as starting values of the optimizer.
+
+    Parameters
+    ---------------
+    entry: dict
+        a ModelStore entry with the keys model and params
+
+    series: array-like
+        the total factor productivity of one country, ordered by year
+
+    Returns
+    ---------------
+    model: pmdarima.arima.ARIMA
+        a model with the stored order, fitted on the series
+    """
+    from pmdarima.arima import ARIMA
+
+    model = ARIMA(**entry["model"].get_params())
+    try:
+        return model.fit(series, start_params=entry["params"])
+    except ValueError:
+        # the stored parameters don't match the model anymore, start from scratch
+        return ARIMA(**entry["model"].get_params()).fit(series)
+
+
+def fit_stored(entity: str, series: pd.Series, store, trace: bool = False):
+    """
+    Returns the ARIMA model of a country, using the ModelStore where possible.
+    A stored model fitted on the same data is loaded as it is. If only a model
+    fitted on older data is stored, its order is refitted on the new data.
+    Otherwise the full order search is run. New fits are saved to the store.
+
+    Parameters
+    ---------------
+    entity: str
+        the country of the series
+
+    series: Pandas Series
+        the total factor productivity of the country, indexed by year or date
+
+    store: ModelStore
+        the store to use, or None to always run the order search
+
+    trace: boolean
+        whether every candidate model of the search should be printed
+
+    Returns
+    ---------------
+    model: pmdarima.arima.ARIMA
+        the fitted model
+    """
+    values = np.asarray(series, dtype=float)
+    if store is None:
+        return fit_arima(values, trace=trace)
+
+    fingerprint = store.fingerprint(series)
+    model = store.load(entity, fingerprint)
+    if model is not None:
+        return model
+
+    previous = store.latest(entity)
+    if previous is not None:
+        model = refit_order(previous, values)
+    else:
+        model = fit_arima(values, trace=trace)
+
+    store.save(entity, fingerprint, model)
+    return model
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("ARIMA fit exceeded the time limit")
+
+
+def _forecast_country(
+    country: str,
+    years: np.ndarray,
+    values: np.ndarray,
+    n_periods: int,
+    timeout,
+    store,
+):
+    """
+    Fits the ARIMA model of one country and forecasts the following years.
+    Runs inside a worker process, so it only receives plain arrays.
+    If a timeout is given, the fit is interrupted with an alarm signal where the
+    platform supports it.
+
+    Returns
+    ---------------
+    result: tuple
+        the country, the forecast DataFrame (or None) and the error message (or None)
+    """
+    use_alarm = (
+        timeout is not None
+        and hasattr(signal, "setitimer")
+        and threading.current_thread() is threading.main_thread()
+    )
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        model = fit_stored(country, pd.Series(values, index=years), store)
+        prediction, conf_int = model.predict(n_periods=n_periods, return_conf_int=True)
+    except Exception as error:  # pylint: disable=broad-except
+        return country, None, f"{type(error).__name__}: {error}"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+    forecast_df = pd.DataFrame(
+        {
+            "Entity": country,
+            "Year": np.arange(years[-1] + 1, years[-1] + 1 + n_periods),
+            "tfp": np.asarray(prediction),
+            "tfp_lower": conf_int[:, 0],
+            "tfp_upper": conf_int[:, 1],
+        }
+    )
+    return country, forecast_df, None
+
+
+def forecast_countries(
+    series_dict: dict,
+    n_periods: int = 30,
+    workers: int = None,
+    timeout: float = None,
+    store=None,
+):
+    """
+    Forecasts the total factor productivity of several countries.
+    Each country is fitted in its own task of a process pool.
+
+    Parameters
+    ---------------
+    series_dict: dict
+        maps each country to a Pandas Series of its tfp, indexed by year
+
+    n_periods: int
+        number of years to forecast after the last year of each series
+
+    workers: int
+        number of worker processes, defaults to the number of CPUs.
+        With one worker the countries are fitted in the current process
+
+    timeout: float
+        maximum number of seconds spent on the fit of a single country
+
+    store: ModelStore
+        store of fitted models shared by the workers, or None to always search
+
+    Returns
+    ---------------
+    forecast_df: Pandas DataFrame
+        tidy forecasts with the columns Entity, Year, tfp, tfp_lower and tfp_upper
+
+    failures: dict
+        maps the countries without a forecast to the reason of the failure
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("Variable 'workers' must be at least 1.")
+
+    countries = list(series_dict)
+    years = [series_dict[country].index.to_numpy() for country in countries]
+    values = [series_dict[country].to_numpy(dtype=float) for country in countries]
+    periods = [n_periods] * len(countries)
+    timeouts = [timeout] * len(countries)
+    stores = [store] * len(countries)
+
+    if workers == 1 or len(countries) <= 1:
+        results = list(
+            map(_forecast_country, countries, years, values, periods, timeouts, stores)
+        )
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(countries))) as executor:
+            results = list(
+                executor.map(
+                    _forecast_country,
+                    countries,
+                    years,
+                    values,
+                    periods,
+                    timeouts,
+                    stores,
+                )
+            )
+
+    frames = [frame for _, frame, _ in results if frame is not None]
+    failures = {country: error for country, _, error in results if error is not None}
+
+    if frames:
+        forecast_df = pd.concat(frames, ignore_index=True)
+    else:
+        forecast_df = pd.DataFrame(
+            columns=["Entity", "Year", "tfp", "tfp_lower", "tfp_upper"]
+        )
+    return forecast_df, failures
+
+
+def _backtest_country(
+    country: str,
+    years: np.ndarray,
+    values: np.ndarray,
+    cutoffs: list,
+    horizon: int,
+    mode: str,
+):
+    """
+    Runs the rolling-origin backtest of one country.
+    At every cutoff, the model is trained on the years before the cutoff and
+    forecasts the horizon starting at the cutoff. Only the first cutoff runs the
+    order search, unless the mode is 'search'. Afterwards, the order is kept and
+    the model is either refitted from the previous parameters ('refit') or updated
+    in place with the observations since the last cutoff ('update').
+
+    Returns
+    ---------------
+    result: tuple
+        the country, the DataFrame of the forecasts (or None) and the error message (or None)
+    """
+    rows = []
+    model = None
+    trained_until = None
+    try:
+        for cutoff in cutoffs:
+            train = values[years < cutoff]
+            if len(train) < MIN_TRAIN_YEARS:
+                continue
+
+            if model is None or mode == "search":
+                model = fit_arima(train)
+            elif mode == "refit":
+                model = refit_order({"model": model, "params": model.params()}, train)
+            else:
+                new_values = values[(years >= trained_until) & (years < cutoff)]
+                if len(new_values) > 0:
+                    model.update(new_values)
+            trained_until = cutoff
+
+            prediction = np.asarray(model.predict(n_periods=horizon))
+            # compare the forecast with the observed years of the horizon
+            observed = (years >= cutoff) & (years < cutoff + horizon)
+            actual = dict(zip(years[observed].tolist(), values[observed]))
+            for year, predicted in zip(range(cutoff, cutoff + horizon), prediction):
+                if year in actual:
+                    rows.append((country, cutoff, year, actual[year], predicted))
+    except Exception as error:  # pylint: disable=broad-except
+        return country, None, f"{type(error).__name__}: {error}"
+
+    if trained_until is None:
+        return country, None, _TOO_SHORT
+    backtest_df = pd.DataFrame(
+        rows, columns=["Entity", "Cutoff", "Year", "tfp", "tfp_predicted"]
+    )
+    return country, backtest_df, None
+
+
+def backtest_countries(
+    series_dict: dict,
+    cutoffs: list,
+    horizon: int = 1,
+    mode: str = "refit",
+    workers: int = None,
+):
+    """
+    Runs rolling-origin backtests of the ARIMA forecasts of several countries.
+    Each country is backtested in its own task of a process pool.
+
+    Parameters
+    ---------------
+    series_dict: dict
+        maps each country to a Pandas Series of its tfp, indexed by year
+
+    cutoffs: list
+        the first forecasted year of each backtest step, in increasing order
+
+    horizon: int
+        number of years forecasted at each cutoff
+
+    mode: str
+        'search' runs the order search at every cutoff, 'refit' keeps the order of the
+        first cutoff and warm-starts each fit from the previous parameters, 'update'
+        keeps the model and updates it in place with the new observations
+
+    workers: int
+        number of worker processes, defaults to the number of CPUs.
+        With one worker the countries are backtested in the current process
+
+    Returns
+    ---------------
+    backtest_df: Pandas DataFrame
+        one row per country, cutoff and forecasted year with the columns
+        Entity, Cutoff, Year, tfp and tfp_predicted
+
+    failures: dict
+        maps the countries without a backtest, e.g. with too few years before
+        every cutoff, to the reason of the failure
+    """
+    if mode not in BACKTEST_MODES:
+        raise ValueError(f"Variable 'mode' must be one of {', '.join(BACKTEST_MODES)}.")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("Variable 'workers' must be at least 1.")
+
+    countries = list(series_dict)
+    arguments = (
+        countries,
+        [series_dict[country].index.to_numpy() for country in countries],
+        [series_dict[country].to_numpy(dtype=float) for country in countries],
+        [list(cutoffs)] * len(countries),
+        [horizon] * len(countries),
+        [mode] * len(countries),
+    )
+
+    if workers == 1 or len(countries) <= 1:
+        results = list(map(_backtest_country, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(countries))) as executor:
+            results = list(executor.map(_backtest_country, *arguments))
+
+    frames = [frame for _, frame, _ in results if frame is not None]
+    failures = {country: error for country, _, error in results if error is not None}
+
+    if frames:
+        backtest_df = pd.concat(frames, ignore_index=True)
+    else:
+        backtest_df = pd.DataFrame(
+            columns=["Entity", "Cutoff", "Year", "tfp", "tfp_predicted"]
+        )
+    return backtest_df, failures
+
+
+def backtest_metrics(backtest_df: pd.DataFrame):
+    """
+    Summarizes the errors of a backtest per country.
+
+    Parameters
+    ---------------
+    backtest_df: Pandas DataFrame
+        the forecasts of a backtest, as returned by backtest_countries
+
+    Returns
+    ---------------
+    metrics_df: Pandas DataFrame
+        one row per country with the number of forecasts and the mean absolute error
+        (mae), root mean squared error (rmse) and mean absolute percentage error (mape)
+    """
+    error = backtest_df["tfp_predicted"].astype(float) - backtest_df["tfp"].astype(
+        float
+    )
+    actual = backtest_df["tfp"].astype(float)
+    errors_df = pd.DataFrame(
+        {
+            "Entity": backtest_df["Entity"],
+            "n_forecasts": 1,
+            "mae": error.abs(),
+            "rmse": error**2,
+            # years without output have no percentage error
+            "mape": (error / actual.where(actual != 0)).abs() * 100,
+        }
+    )
+    metrics_df = errors_df.groupby("Entity", sort=True).agg(
+        {"n_forecasts": "sum", "mae": "mean", "rmse": "mean", "mape": "mean"}
+    )
+    metrics_df["rmse"] = np.sqrt(metrics_df["rmse"])
+    return metrics_df
+
+
+def _series_matrix(series_dict: dict):
+    """
+    Aligns the series of several countries as a matrix with one row per country
+    and one column per year, from the first to the last year of any series.
+    """
+    years = [series.index.to_numpy() for series in series_dict.values()]
+    years = np.concatenate(years) if years else np.array([], dtype=int)
+    if len(years) == 0:
+        return np.empty((len(series_dict), 0)), np.array([], dtype=int)
+    all_years = np.arange(years.min(), years.max() + 1)
+    matrix = np.full((len(series_dict), len(all_years)), np.nan)
+    for row, series in enumerate(series_dict.values()):
+        matrix[row, series.index.to_numpy() - all_years[0]] = series.to_numpy(
+            dtype=float
+        )
+    return matrix, all_years
+
+
+def statespace_countries(
+    series_dict: dict, n_periods: int = 30, model: str = "auto", alpha: float = 0.05
+):
+    """
+    Forecasts the total factor productivity of several countries with state space
+    models, which are fitted on all countries at once.
+
+    Parameters
+    ---------------
+    series_dict: dict
+        maps each country to a Pandas Series of its tfp, indexed by year
+
+    n_periods: int
+        number of years to forecast after the last year of each series
+
+    model: str
+        'level', 'trend' or 'auto' to pick the better model of each country
+
+    alpha: float
+        the prediction intervals cover 1 - alpha of the forecast distribution
+
+    Returns
+    ---------------
+    forecast_df: Pandas DataFrame
+        tidy forecasts with the columns Entity, Year, tfp, tfp_lower and tfp_upper
+
+    failures: dict
+        maps the countries without a forecast to the reason of the failure
+    """
+    countries = list(series_dict)
+    matrix, years = _series_matrix(series_dict)
+    fit = fit_statespace(matrix, model)
+    mean, lower, upper = fit.forecast(n_periods, alpha)
+
+    fitted = np.flatnonzero(fit.fitted)
+    steps = np.arange(1, n_periods + 1)
+    last_years = years[fit.last[fitted]] if len(fitted) > 0 else fitted
+    forecast_df = pd.DataFrame(
+        {
+            "Entity": np.repeat(np.array(countries, dtype=object)[fitted], n_periods),
+            "Year": (last_years[:, None] + steps).ravel(),
+            "tfp": mean[fitted].ravel(),
+            "tfp_lower": lower[fitted].ravel(),
+            "tfp_upper": upper[fitted].ravel(),
+        }
+    )
+    failures = {
+        countries[x]: "ValueError: too few observations"
+        for x in np.flatnonzero(~fit.fitted)
+    }
+    return forecast_df, failures
+
+
+def statespace_backtest(
+    series_dict: dict, cutoffs: list, horizon: int = 1, model: str = "auto"
+):
+    """
+    Runs rolling-origin backtests of the state space forecasts of several countries.
+    At every cutoff, the models of all countries are fitted at once on the years
+    before the cutoff and forecast the horizon starting at the cutoff.
+
+    Parameters
+    ---------------
+    series_dict: dict
+        maps each country to a Pandas Series of its tfp, indexed by year
+
+    cutoffs: list
+        the first forecasted year of each backtest step, in increasing order
+
+    horizon: int
+        number of years forecasted at each cutoff
+
+    model: str
+        'level', 'trend' or 'auto' to pick the better model of each country
+
+    Returns
+    ---------------
+    backtest_df: Pandas DataFrame
+        one row per country, cutoff and forecasted year with the columns
+        Entity, Cutoff, Year, tfp and tfp_predicted
+
+    failures: dict
+        maps the countries without a backtest, e.g. with too few years before
+        every cutoff, to the reason of the failure
+    """
+    countries = np.array(list(series_dict), dtype=object)
+    matrix, years = _series_matrix(series_dict)
+    frames = []
+    ever_trained = np.zeros(len(countries), dtype=bool)
+    ever_fitted = np.zeros(len(countries), dtype=bool)
+    for cutoff in cutoffs:
+        train = matrix[:, years < cutoff]
+        trained = np.isfinite(train).sum(axis=1) >= MIN_TRAIN_YEARS
+        if not trained.any():
+            continue
+        fit = fit_statespace(train[trained], model)
+        ever_trained |= trained
+        ever_fitted[np.flatnonzero(trained)[fit.fitted]] = True
+
+        # the forecast steps from the last training year of each country to the horizon
+        last_years = years[np.maximum(fit.last, 0)]
+        mean = fit.forecast(int(cutoff + horizon - 1 - last_years.min()))[0]
+        for year in range(cutoff, cutoff + horizon):
+            if year > years[-1]:
+                break
+            steps = year - last_years - 1
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "Entity": countries[trained],
+                        "Cutoff": cutoff,
+                        "Year": year,
+                        "tfp": matrix[trained, year - years[0]],
+                        "tfp_predicted": mean[np.arange(len(steps)), steps],
+                    }
+                )
+            )
+
+    columns = ["Entity", "Cutoff", "Year", "tfp", "tfp_predicted"]
+    if frames:
+        backtest_df = pd.concat(frames, ignore_index=True)
+        backtest_df = backtest_df.dropna(subset=["tfp", "tfp_predicted"])
+        backtest_df = backtest_df.sort_values(
+            ["Entity", "Cutoff", "Year"], kind="stable"
+        ).reset_index(drop=True)
+    else:
+        backtest_df = pd.DataFrame(columns=columns)
+    failures = {x: _TOO_SHORT for x in countries[~ever_trained]}
+    failures.update(
+        {
+            x: "ValueError: too few observations"
+            for x in countries[ever_trained & ~ever_fitted]
+        }
+    )
+    return backtest_df[columns], failures
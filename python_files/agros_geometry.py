@@ -0,0 +1,475 @@
+""" This module contains the geometry store of the country polygons of the Agros class.
+The polygons of Natural Earth are read once, from the dataset bundled with older
+geopandas versions or from a download, and cached in 'downloads/geometry' as
+well-known binary arrays, so later loads neither parse a shapefile nor need the network.
+The GeometryStore keeps an R-tree (shapely's STRtree) of the polygons for point and
+bounding box queries, and resolves country names and ISO codes to the spelling of the
+agricultural data, so only a few aliases have to be maintained by hand.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+
+import numpy as np
+
+from agros_data import source_signature
+from agros_download import fetch
+
+GEOMETRY_URL = (
+    "https://naciscdn.org/naturalearth/110m/cultural/ne_110m_admin_0_countries.zip"
+)
+
+# bump when the layout of the cached files changes
+GEOMETRY_VERSION = 1
+
+# abbreviations of the Natural Earth names and words ignored when comparing names
+_ABBREVIATIONS = {
+    "cent": "central",
+    "dem": "democratic",
+    "eq": "equatorial",
+    "herz": "herzegovina",
+    "is": "islands",
+    "n": "north",
+    "rep": "republic",
+    "s": "south",
+    "st": "saint",
+}
+_STOPWORDS = {"and", "of", "the"}
+
+# bounding boxes of the continents of Natural Earth, as minx, miny, maxx, maxy. The boxes
+# of their polygons are useless for crops, e.g. Russia spans the antimeridian and France
+# reaches South America with French Guiana
+CONTINENT_BOUNDS = {
+    "africa": (-18.0, -35.0, 52.0, 38.0),
+    "antarctica": (-180.0, -90.0, 180.0, -60.0),
+    "asia": (25.0, -11.0, 146.0, 56.0),
+    "europe": (-25.0, 34.0, 45.0, 72.0),
+    "north america": (-170.0, 7.0, -52.0, 84.0),
+    "oceania": (112.0, -48.0, 180.0, 0.0),
+    "south america": (-82.0, -56.0, -34.0, 13.0),
+}
+
+
+def name_key(name: str):
+    """
+    Returns the key of a name used to compare spellings, e.g. 'Dem. Rep. Congo'
+    and 'Democratic Republic of Congo' have the same key.
+    """
+    text = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode()
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return " ".join(_ABBREVIATIONS.get(x, x) for x in words if x not in _STOPWORDS)
+
+
+def _column(geopandas_df, *names):
+    """Returns the first of some columns found in a frame, compared case-insensitively."""
+    columns = {x.lower(): x for x in geopandas_df.columns}
+    for name in names:
+        if name in columns:
+            return geopandas_df[columns[name]].astype(str).to_numpy()
+    return np.full(len(geopandas_df), "", dtype=object)
+
+
+class GeometryStore:
+    """
+    The country polygons with a spatial index and a name resolver.
+
+    Attributes
+    ---------------
+    names: numpy array
+        the names of the polygons, spelled like in the agricultural data where
+        an alias is known
+
+    source_names: numpy array
+        the names of the polygons as spelled by the source
+
+    iso_codes: numpy array
+        the ISO 3166-1 alpha-3 codes of the polygons, empty where unknown
+
+    continents: numpy array
+        the continents of the polygons
+
+    geometries: numpy array
+        the shapely polygons, in longitude and latitude
+
+    bounds: numpy array
+        the bounding boxes of the polygons, one row of minx, miny, maxx, maxy each
+
+    mainland_bounds: numpy array
+        the bounding boxes of the largest part of every polygon, without islands
+        and overseas territories
+
+    tree: shapely.STRtree
+        the R-tree of the polygons
+
+
+    Methods
+    ---------------
+    from_frame
+        builds the store from a geopandas frame
+
+    resolve
+        returns the name of a country given by any spelling or its ISO code
+
+    match
+        returns the entity of the data of every polygon
+
+    locate
+        returns the countries containing points
+
+    query
+        returns the polygons intersecting a bounding box
+
+    region_bounds
+        returns the bounding box of a country, a continent or a box
+
+    to_frame
+        returns polygons as a geopandas frame
+    """
+
+    def __init__(
+        self, source_names, iso_codes, continents, geometries, aliases: dict = None
+    ):
+        import shapely  # pylint: disable=import-outside-toplevel
+
+        aliases = aliases or {}
+        self.source_names = np.asarray(source_names, dtype=str)
+        self.names = np.array([aliases.get(x, x) for x in self.source_names], dtype=str)
+        self.iso_codes = np.asarray(iso_codes, dtype=str)
+        self.continents = np.asarray(continents, dtype=str)
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.bounds = shapely.bounds(self.geometries)
+        self.mainland_bounds = self.bounds.copy()
+        parts, owners = shapely.get_parts(self.geometries, return_index=True)
+        if len(parts) > 0:
+            # the largest part of every polygon is the last of its parts sorted by area
+            order = np.lexsort((shapely.area(parts), owners))
+            last = np.append(owners[order][1:] != owners[order][:-1], True)
+            self.mainland_bounds[owners[order][last]] = shapely.bounds(
+                parts[order][last]
+            )
+        self.tree = shapely.STRtree(self.geometries)
+
+        # every spelling and code of a polygon points to its name
+        self._lookup = {}
+        for name, source_name, code in zip(
+            self.names, self.source_names, self.iso_codes
+        ):
+            self._lookup.setdefault(name_key(source_name), name)
+            self._lookup.setdefault(name_key(name), name)
+            if re.fullmatch("[A-Z]{3}", code):
+                self._lookup.setdefault(code, name)
+
+    @classmethod
+    def from_frame(cls, geopandas_df, aliases: dict = None):
+        """
+        Builds the store from a geopandas frame of Natural Earth countries.
+
+        Parameters
+        ---------------
+        geopandas_df: Geopandas df
+            the country polygons with a name column and, if available,
+            ISO codes and continents
+
+        aliases: dict
+            names of the source mapped to the spelling of the agricultural data
+
+        Returns
+        ---------------
+        store: GeometryStore
+            the store of the polygons
+        """
+        if geopandas_df.crs is not None and not geopandas_df.crs.equals("EPSG:4326"):
+            geopandas_df = geopandas_df.to_crs("EPSG:4326")
+        return cls(
+            _column(geopandas_df, "name"),
+            # the plain ISO code of Natural Earth is -99 for a few countries like France
+            np.where(
+                _column(geopandas_df, "iso_a3_eh") != "",
+                _column(geopandas_df, "iso_a3_eh"),
+                _column(geopandas_df, "iso_a3"),
+            ),
+            _column(geopandas_df, "continent"),
+            geopandas_df.geometry.to_numpy(),
+            aliases,
+        )
+
+    def resolve(self, name: str):
+        """
+        Returns the name of a country given by any spelling or its ISO code,
+        e.g. 'USA' or 'United States of America', or None if it is unknown.
+        """
+        name = str(name)
+        if name.upper() in self._lookup and len(name) == 3:
+            return self._lookup[name.upper()]
+        return self._lookup.get(name_key(name))
+
+    def match(self, entities):
+        """
+        Returns the entity of the agricultural data of every polygon, None where
+        the data has no entity of that name. Names are matched through the aliases
+        first and by their spelling key otherwise.
+        """
+        entities = [str(x) for x in entities]
+        keys = {name_key(x): x for x in entities}
+        entity_set = set(entities)
+        matched = np.empty(len(self.names), dtype=object)
+        for row, (name, source_name) in enumerate(zip(self.names, self.source_names)):
+            if name in entity_set:
+                matched[row] = name
+            else:
+                matched[row] = keys.get(name_key(name), keys.get(name_key(source_name)))
+        return matched
+
+    def locate(self, longitudes, latitudes):
+        """
+        Returns the names of the countries containing points.
+
+        Parameters
+        ---------------
+        longitudes: array-like
+            the longitudes of the points
+
+        latitudes: array-like
+            the latitudes of the points
+
+        Returns
+        ---------------
+        names: numpy array
+            the country of every point, None for points outside all countries
+        """
+        import shapely  # pylint: disable=import-outside-toplevel
+
+        points = shapely.points(
+            np.atleast_1d(np.asarray(longitudes, dtype=float)),
+            np.atleast_1d(np.asarray(latitudes, dtype=float)),
+        )
+        point_rows, rows = self.tree.query(points, predicate="intersects")
+        names = np.full(len(points), None, dtype=object)
+        # points on a shared border keep the first country found
+        first = np.unique(point_rows, return_index=True)[1]
+        names[point_rows[first]] = self.names[rows[first]]
+        return names
+
+    def query(self, bbox):
+        """
+        Returns the sorted rows of the polygons intersecting a bounding box
+        of minx, miny, maxx, maxy in degrees.
+        """
+        import shapely  # pylint: disable=import-outside-toplevel
+
+        return np.sort(self.tree.query(shapely.box(*bbox), predicate="intersects"))
+
+    def region_bounds(self, region):
+        """
+        Returns the bounding box of a region, which is a country in any spelling or
+        ISO code, a continent or a tuple of minx, miny, maxx, maxy in degrees.
+        Countries are bounded by their mainland, without islands and overseas
+        territories, and the continents of Natural Earth by a box of their mainland.
+        """
+        if isinstance(region, (tuple, list, np.ndarray)):
+            if len(region) != 4:
+                raise ValueError(
+                    "A bounding box must have the four values minx, miny, maxx, maxy."
+                )
+            return tuple(float(x) for x in region)
+
+        rows = np.flatnonzero(self.names == self.resolve(region))
+        if len(rows) == 0:
+            continent = str(region).lower()
+            rows = np.flatnonzero(np.char.lower(self.continents) == continent)
+            if len(rows) > 0 and continent in CONTINENT_BOUNDS:
+                return CONTINENT_BOUNDS[continent]
+        if len(rows) == 0:
+            raise ValueError(f"{region} is neither a country nor a continent")
+        bounds = self.mainland_bounds[rows]
+        return (
+            float(bounds[:, 0].min()),
+            float(bounds[:, 1].min()),
+            float(bounds[:, 2].max()),
+            float(bounds[:, 3].max()),
+        )
+
+    def to_frame(self, rows=None):
+        """Returns the polygons of some rows, all by default, as a geopandas frame."""
+        import geopandas as gpd  # pylint: disable=import-outside-toplevel
+
+        rows = slice(None) if rows is None else rows
+        return gpd.GeoDataFrame(
+            {
+                "name": self.source_names[rows],
+                "iso_a3": self.iso_codes[rows],
+                "continent": self.continents[rows],
+            },
+            geometry=self.geometries[rows],
+            crs="EPSG:4326",
+        )
+
+
+def write_geometry(store: GeometryStore, directory: str, signature: str):
+    """
+    Saves the polygons of a store into the cache folder of a source signature.
+    The files are written to a temporary folder that is renamed into place.
+
+    Parameters
+    ---------------
+    store: GeometryStore
+        the store to save
+
+    directory: str
+        the cache folder, e.g. 'downloads/geometry'
+
+    signature: str
+        the signature of the source file
+    """
+    import shapely  # pylint: disable=import-outside-toplevel
+
+    os.makedirs(directory, exist_ok=True)
+    temp_directory = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+
+    # the well-known binaries of all polygons are concatenated into one array
+    wkb = shapely.to_wkb(store.geometries)
+    offsets = np.cumsum([0] + [len(x) for x in wkb])
+    np.save(
+        os.path.join(temp_directory, "wkb.npy"),
+        np.frombuffer(b"".join(wkb), dtype=np.uint8),
+    )
+    np.save(os.path.join(temp_directory, "offsets.npy"), offsets)
+    np.save(os.path.join(temp_directory, "names.npy"), store.source_names)
+    np.save(os.path.join(temp_directory, "iso_codes.npy"), store.iso_codes)
+    np.save(os.path.join(temp_directory, "continents.npy"), store.continents)
+    with open(os.path.join(temp_directory, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump({"version": GEOMETRY_VERSION, "polygons": len(wkb)}, file)
+
+    try:
+        os.rename(temp_directory, os.path.join(directory, signature))
+    except OSError:
+        # another process has written the same cache in the meantime
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name != signature and not name.startswith(".tmp-") and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def read_geometry(directory: str, signature: str = None, aliases: dict = None):
+    """
+    Loads the cached polygons of a source signature, or of any cached source
+    if the signature is None.
+
+    Parameters
+    ---------------
+    directory: str
+        the cache folder, e.g. 'downloads/geometry'
+
+    signature: str
+        the signature of the source file, None to accept any cache
+
+    aliases: dict
+        names of the source mapped to the spelling of the agricultural data
+
+    Returns
+    ---------------
+    store: GeometryStore or None
+        the cached polygons, or None if there is no matching cache
+    """
+    import shapely  # pylint: disable=import-outside-toplevel
+
+    if signature is None:
+        if not os.path.isdir(directory):
+            return None
+        cached = [
+            x
+            for x in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, x, "meta.json"))
+        ]
+        if not cached:
+            return None
+        signature = cached[0]
+
+    path = os.path.join(directory, signature)
+    if not os.path.isfile(os.path.join(path, "meta.json")):
+        return None
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+        if json.load(file).get("version") != GEOMETRY_VERSION:
+            return None
+
+    buffer = np.load(os.path.join(path, "wkb.npy")).tobytes()
+    offsets = np.load(os.path.join(path, "offsets.npy"))
+    wkb = np.array(
+        [buffer[start:end] for start, end in zip(offsets[:-1], offsets[1:])],
+        dtype=object,
+    )
+    return GeometryStore(
+        np.load(os.path.join(path, "names.npy")),
+        np.load(os.path.join(path, "iso_codes.npy")),
+        np.load(os.path.join(path, "continents.npy")),
+        shapely.from_wkb(wkb),
+        aliases,
+    )
+
+
+def _bundled_path():
+    """Returns the path of the countries bundled with geopandas, None in geopandas 1.0+."""
+    import geopandas as gpd  # pylint: disable=import-outside-toplevel
+
+    try:
+        return gpd.datasets.get_path("naturalearth_lowres")
+    except (AttributeError, ValueError):
+        return None
+
+
+def load_geometry(
+    directory: str = "downloads/geometry",
+    url: str = GEOMETRY_URL,
+    session=None,
+    aliases: dict = None,
+):
+    """
+    Returns the store of the country polygons, from the cache if it is current.
+    The source is the dataset bundled with geopandas if available and the
+    Natural Earth download otherwise. Without any source, e.g. offline,
+    the last cached polygons are used.
+
+    Parameters
+    ---------------
+    directory: str
+        the cache folder of the polygons and the download
+
+    url: str
+        address of the zipped Natural Earth countries
+
+    session: requests.Session
+        the session used for the download
+
+    aliases: dict
+        names of the source mapped to the spelling of the agricultural data
+
+    Returns
+    ---------------
+    store: GeometryStore
+        the country polygons
+    """
+    source = _bundled_path()
+    download = os.path.join(directory, os.path.basename(url))
+    if source is None and os.path.isfile(download):
+        source = download
+    if source is None:
+        store = read_geometry(directory, aliases=aliases)
+        if store is not None:
+            return store
+        fetch(url, download, session=session)
+        source = download
+
+    signature = source_signature(source)
+    store = read_geometry(directory, signature, aliases)
+    if store is None:
+        import geopandas as gpd  # pylint: disable=import-outside-toplevel
+
+        store = GeometryStore.from_frame(gpd.read_file(source), aliases)
+        write_geometry(store, directory, signature)
+    return store
@@ -0,0 +1,290 @@
+""" This module contains the opt-in instrumentation of the Agros class.
+The methods of Agros report their stages, like parsing the csv file, merging the
+geometry, searching an ARIMA order or rendering a chart, to an Instrumentation.
+While it is enabled, every stage is timed and emitted as a record with its row count
+and, optionally, the change of the traced memory, to pluggable hooks: any callable,
+a logger, a recorder or a Prometheus-style counter registry. While it is disabled,
+which is the default, a stage is a shared no-op context, so the overhead is negligible.
+Notices, like ignored countries or failed forecasts, are always logged as warnings of
+the 'agros' logger and also passed to the hooks while enabled.
+"""
+
+import logging
+import time
+import tracemalloc
+from collections import defaultdict
+
+# the logger of the notices, which are logged whether instrumentation is enabled or not
+LOGGER = logging.getLogger("agros")
+
+
+class _NullStage:
+    """The stage of a disabled instrumentation, which ignores everything."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Times a stage of a method and emits its record when it ends."""
+
+    def __init__(self, instrumentation, method: str, stage: str, rows=None):
+        self.instrumentation = instrumentation
+        self.method = method
+        self.stage = stage
+        self.rows = rows
+        self.info = None
+        self._start = None
+        self._memory = None
+
+    def __enter__(self):
+        if self.instrumentation.memory and tracemalloc.is_tracing():
+            self._memory = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._start
+        memory_delta = None
+        if self._memory is not None and tracemalloc.is_tracing():
+            memory_delta = tracemalloc.get_traced_memory()[0] - self._memory
+        self.instrumentation.emit(
+            {
+                "method": self.method,
+                "stage": self.stage,
+                "seconds": seconds,
+                "rows": self.rows,
+                "memory_delta": memory_delta,
+                "info": self.info,
+                "error": None if exc_type is None else exc_type.__name__,
+            }
+        )
+        return False
+
+
+class Instrumentation:
+    """
+    Collects the timings of the stages of the Agros methods and passes them to hooks.
+
+    Attributes
+    ---------------
+    hooks: list
+        the callables receiving every record, a dictionary with the keys method, stage,
+        seconds, rows, memory_delta (bytes), info and error, or method, stage and message
+        for notices
+
+    memory: boolean
+        whether the change of the memory traced by tracemalloc is recorded
+
+    enabled: boolean
+        whether stages are recorded at all
+
+
+    Methods
+    ---------------
+    enable
+        adds hooks and starts recording
+
+    disable
+        stops recording, the hooks are kept
+
+    stage
+        returns the context of a stage of a method
+
+    notice
+        passes a message of a method to the hooks
+
+    emit
+        passes a record to the hooks
+    """
+
+    def __init__(self, hooks: list = None, memory: bool = False):
+        self.hooks = list(hooks or [])
+        self.memory = memory
+        self.enabled = False
+        if self.hooks:
+            self.enable(memory=memory)
+
+    def enable(self, *hooks, memory: bool = None):
+        """
+        Adds hooks and starts recording the stages.
+
+        Parameters
+        ---------------
+        *hooks: callable
+            the hooks to add, called with every record
+
+        memory: boolean
+            whether memory deltas should be recorded, which starts tracemalloc.
+            Tracing memory slows down Python considerably
+        """
+        self.hooks.extend(hooks)
+        if memory is not None:
+            self.memory = memory
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self):
+        """Stops recording the stages, the hooks are kept for a later enable."""
+        self.enabled = False
+
+    def stage(self, method: str, stage: str, rows: int = None):
+        """
+        Returns the context of a stage of a method.
+        The rows and info attributes of the context can be set inside the stage.
+
+        Parameters
+        ---------------
+        method: str
+            the Agros method, e.g. 'download_data'
+
+        stage: str
+            the stage of the method, e.g. 'parse csv'
+
+        rows: int
+            number of rows processed by the stage, if known upfront
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, method, stage, rows)
+
+    def notice(self, method: str, message: str):
+        """
+        Logs a message of a method, e.g. about ignored input, as a warning
+        and passes it to the hooks while enabled.
+        """
+        LOGGER.warning("%s: %s", method, message)
+        if self.enabled:
+            self.emit({"method": method, "stage": "notice", "message": message})
+
+    def emit(self, record: dict):
+        """Passes a record to every hook."""
+        for hook in self.hooks:
+            hook(record)
+
+
+class LoggingHook:
+    """
+    A hook writing every record to a logger.
+
+    Attributes
+    ---------------
+    logger: logging.Logger
+        the logger to write to, 'agros' by default
+
+    level: int
+        the level of the stage records, notices are logged as warnings
+    """
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("agros")
+        self.level = level
+
+    def __call__(self, record: dict):
+        if record["stage"] == "notice":
+            # notices are already logged to the 'agros' logger
+            if self.logger is not LOGGER:
+                self.logger.warning("%s: %s", record["method"], record["message"])
+            return
+        self.logger.log(
+            self.level,
+            "%s %s: %.4f s, rows=%s, memory_delta=%s%s",
+            record["method"],
+            record["stage"],
+            record["seconds"],
+            record["rows"],
+            record["memory_delta"],
+            f", failed with {record['error']}" if record["error"] else "",
+        )
+
+
+class Recorder:
+    """
+    A hook keeping every record in a list.
+
+    Attributes
+    ---------------
+    records: list
+        the records received so far
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record: dict):
+        self.records.append(record)
+
+    def clear(self):
+        """Removes all records."""
+        self.records.clear()
+
+    def to_frame(self):
+        """Returns the stage records as a Pandas DataFrame, one row per stage."""
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        return pd.DataFrame([x for x in self.records if x["stage"] != "notice"])
+
+
+class CounterRegistry:
+    """
+    A hook counting the calls, seconds and rows of every stage, like Prometheus counters.
+
+    Attributes
+    ---------------
+    prefix: str
+        the prefix of the metric names
+
+
+    Methods
+    ---------------
+    value
+        returns the value of a counter
+
+    expose
+        returns all counters in the Prometheus text format
+    """
+
+    def __init__(self, prefix: str = "agros"):
+        self.prefix = prefix
+        self._counters = defaultdict(float)
+
+    def __call__(self, record: dict):
+        labels = (("method", record["method"]), ("stage", record["stage"]))
+        if record["stage"] == "notice":
+            self._counters[("notices_total", labels[:1])] += 1
+            return
+        self._counters[("stage_calls_total", labels)] += 1
+        self._counters[("stage_seconds_total", labels)] += record["seconds"]
+        if record["rows"] is not None:
+            self._counters[("stage_rows_total", labels)] += record["rows"]
+        if record["error"] is not None:
+            self._counters[("stage_errors_total", labels)] += 1
+
+    def value(self, name: str, **labels):
+        """
+        Returns the value of a counter, e.g. value('stage_seconds_total',
+        method='download_data', stage='parse csv').
+        """
+        return self._counters.get((name, tuple(labels.items())), 0.0)
+
+    def expose(self):
+        """Returns all counters in the Prometheus text exposition format."""
+        lines = []
+        for name in sorted({name for name, _ in self._counters}):
+            lines.append(f"# TYPE {self.prefix}_{name} counter")
+            for (counter, labels), value in sorted(self._counters.items()):
+                if counter != name:
+                    continue
+                text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{self.prefix}_{name}{{{text}}} {value:g}")
+        return "\n".join(lines) + "\n"
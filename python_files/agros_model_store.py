@@ -0,0 +1,284 @@
+""" This module contains the on-disk store for the fitted ARIMA models of the Agros class.
+Every entry holds the fitted model of one country together with its order and parameters.
+Entries are keyed by the country and a fingerprint of its tfp series, so that a model is only
+searched again when the data of the country changed. The store evicts entries by age,
+number and size, and can be invalidated explicitly. The file names hold the exact name of
+the country as a hash, so the entries of similar names are never mixed up.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class ModelStore:
+    """
+    A directory of pickled ARIMA models keyed by country and data fingerprint.
+
+    Attributes
+    ---------------
+    directory: str
+        folder where the models are saved, created on the first save
+
+    max_entries: int
+        maximum number of stored models, the least recently used are evicted first
+
+    max_bytes: int
+        maximum total size of the stored models in bytes
+
+    max_age: float
+        maximum age of a stored model in seconds since it was last used
+
+
+    Methods
+    ---------------
+    fingerprint
+        returns the hash of a tfp series
+
+    load
+        returns the stored model of a country for a fingerprint
+
+    latest
+        returns the most recently used entry of a country, whatever its fingerprint
+
+    save
+        stores the fitted model of a country
+
+    invalidate
+        removes the stored models of a country or of all countries
+
+    evict
+        removes the entries exceeding the age, number or size limits
+    """
+
+    def __init__(
+        self,
+        directory: str = "downloads/models",
+        max_entries: int = None,
+        max_bytes: int = None,
+        max_age: float = None,
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    @staticmethod
+    def fingerprint(series: pd.Series):
+        """
+        Hashes the years and values of a tfp series.
+
+        Parameters
+        ---------------
+        series: Pandas Series
+            the tfp of one country, indexed by year or by date
+
+        Returns
+        ---------------
+        fingerprint: str
+            hexadecimal sha256 digest of the series
+        """
+        index = series.index
+        if isinstance(index, pd.DatetimeIndex):
+            index = index.year
+        digest = hashlib.sha256()
+        digest.update(np.asarray(index, dtype=np.int64).tobytes())
+        digest.update(np.asarray(series, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def _prefix(self, entity: str):
+        """
+        Returns the file name prefix of all entries of a country, its readable name
+        and a hash of the exact name, which tells apart names spelled alike.
+        """
+        key = hashlib.sha256(entity.encode()).hexdigest()[:12]
+        return f"{re.sub(r'[^A-Za-z0-9]+', '_', entity)}-{key}-"
+
+    def _path(self, entity: str, fingerprint: str):
+        return os.path.join(
+            self.directory, f"{self._prefix(entity)}{fingerprint[:32]}.pkl"
+        )
+
+    def _entries(self, entity: str = None):
+        """Lists the paths of the stored entries, optionally of one country only."""
+        if not os.path.isdir(self.directory):
+            return []
+        if entity is None:
+            pattern = re.compile(r".+-[0-9a-f]{12}-[0-9a-f]{32}\.pkl")
+        else:
+            pattern = re.compile(re.escape(self._prefix(entity)) + r"[0-9a-f]{32}\.pkl")
+        return [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if pattern.fullmatch(name)
+        ]
+
+    @staticmethod
+    def _read(path: str):
+        try:
+            with open(path, "rb") as file:
+                entry = pickle.load(file)
+            # mark the entry as recently used for the eviction
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # the entry is partial or was evicted by another process meanwhile
+            return None
+        return entry
+
+    def load(self, entity: str, fingerprint: str):
+        """
+        Returns the stored model of a country if it was fitted on the same data.
+
+        Parameters
+        ---------------
+        entity: str
+            the country of the model
+
+        fingerprint: str
+            the fingerprint of the current tfp series of the country
+
+        Returns
+        ---------------
+        model: pmdarima.arima.ARIMA or None
+            the fitted model, or None if there is no entry for this data
+        """
+        path = self._path(entity, fingerprint)
+        if not os.path.isfile(path):
+            return None
+        entry = self._read(path)
+        if (
+            entry is None
+            or entry["entity"] != entity
+            or entry["fingerprint"] != fingerprint
+        ):
+            return None
+        return entry["model"]
+
+    def latest(self, entity: str):
+        """
+        Returns the most recently used entry of a country, whatever data it was fitted on.
+
+        Parameters
+        ---------------
+        entity: str
+            the country of the model
+
+        Returns
+        ---------------
+        entry: dict or None
+            with the keys entity, fingerprint, order, params and model
+        """
+        entries = []
+        for path in self._entries(entity):
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                # evicted by another process meanwhile
+                continue
+        for _, path in sorted(entries, reverse=True):
+            entry = self._read(path)
+            if entry is not None and entry["entity"] == entity:
+                return entry
+        return None
+
+    def save(self, entity: str, fingerprint: str, model):
+        """
+        Stores the fitted model of a country and evicts entries over the limits.
+        The file is written to a temporary file first and renamed into place,
+        so concurrent readers never see a partial entry.
+
+        Parameters
+        ---------------
+        entity: str
+            the country of the model
+
+        fingerprint: str
+            the fingerprint of the tfp series the model was fitted on
+
+        model: pmdarima.arima.ARIMA
+            the fitted model
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {
+            "entity": entity,
+            "fingerprint": fingerprint,
+            "order": model.order,
+            "params": np.asarray(model.params()),
+            "model": model,
+        }
+        file_handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(file_handle, "wb") as file:
+                pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(entity, fingerprint))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.evict()
+
+    def invalidate(self, entity: str = None):
+        """
+        Removes the stored models of a country, or all stored models.
+
+        Parameters
+        ---------------
+        entity: str
+            the country whose models are removed, all countries if None
+
+        Returns
+        ---------------
+        removed: int
+            number of removed entries
+        """
+        paths = self._entries(entity)
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(paths)
+
+    def evict(self):
+        """
+        Removes entries older than max_age, then the least recently used entries
+        until both max_entries and max_bytes are respected.
+
+        Returns
+        ---------------
+        removed: int
+            number of removed entries
+        """
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        # most recently used entries first
+        entries.sort(reverse=True)
+
+        now = time.time()
+        kept_bytes = 0
+        removed = 0
+        for position, (mtime, size, path) in enumerate(entries):
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            too_many = (
+                self.max_entries is not None and position - removed >= self.max_entries
+            )
+            too_big = self.max_bytes is not None and kept_bytes + size > self.max_bytes
+            if too_old or too_many or too_big:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                removed += 1
+            else:
+                kept_bytes += size
+        return removed
@@ -0,0 +1,196 @@
+""" This module contains the compact panel representation of the agricultural data.
+The Panel keeps every metric as a dense matrix with one row per entity and one column
+per year, stacked in a single NumPy block of float32 values by default. The entity
+names are dictionary-encoded as the row positions of a sorted array and the years as
+column positions, so the series of a country and the cross-section of a year are
+views of the block, without copying or scanning the data.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _positions(values: pd.Series, labels: np.ndarray):
+    """Returns the positions of the values in the sorted labels."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # look up each category once instead of every row
+        categories = np.searchsorted(labels, values.cat.categories.to_numpy(dtype=str))
+        return categories[values.cat.codes.to_numpy()]
+    return np.searchsorted(labels, values.to_numpy())
+
+
+class Panel:
+    """
+    A compact entity by year panel of metrics.
+
+    Attributes
+    ---------------
+    entities: numpy array
+        the sorted names of the entities, the dictionary of the row codes
+
+    years: numpy array
+        the sorted years, one per column
+
+    metrics: list
+        the names of the metrics
+
+    blocks: numpy array
+        read-only values of shape (metrics, entities, years), NaN where missing
+
+
+    Methods
+    ---------------
+    from_frame
+        builds a panel from a DataFrame with Entity and Year columns
+
+    from_frames
+        builds a panel chunk by chunk from several DataFrames
+
+    series
+        returns the values of an entity over the years, as a view
+
+    cross_section
+        returns the values of all entities in a year, as a view
+
+    matrix
+        returns the entity by year matrix of a metric, as a view
+
+    take
+        returns the matrix of a metric for some entities and years, as a copy
+    """
+
+    __slots__ = ("entities", "years", "metrics", "blocks", "_rows", "_columns")
+
+    def __init__(self, entities, years, metrics: list, blocks: np.ndarray):
+        self.entities = np.asarray(entities, dtype=str)
+        self.years = np.asarray(years)
+        self.metrics = list(metrics)
+        if blocks.shape != (len(self.metrics), len(self.entities), len(self.years)):
+            raise ValueError(
+                "Variable 'blocks' must have one matrix of entities and years per metric."
+            )
+        blocks.flags.writeable = False
+        self.blocks = blocks
+        self._rows = {name: row for row, name in enumerate(self.entities.tolist())}
+        self._columns = {
+            year: column for column, year in enumerate(self.years.tolist())
+        }
+
+    @classmethod
+    def from_frame(cls, data_df: pd.DataFrame, dtype=np.float32):
+        """
+        Builds a panel from a DataFrame with one row per entity and year.
+
+        Parameters
+        ---------------
+        data_df: Pandas DataFrame
+            the data, with the columns Entity, Year and the metrics
+
+        dtype: numpy dtype
+            dtype of the values, float32 or float64
+
+        Returns
+        ---------------
+        panel: Panel
+            the panel of all metrics of the data
+        """
+        entity = data_df["Entity"]
+        if isinstance(entity.dtype, pd.CategoricalDtype):
+            entity = entity.cat.remove_unused_categories().cat.categories
+        entities = np.unique(np.asarray(entity, dtype=str))
+        years = np.unique(data_df["Year"].to_numpy())
+        metrics = [x for x in data_df.columns if x not in ("Entity", "Year")]
+        return cls.from_frames([data_df], entities, years, metrics, dtype)
+
+    @classmethod
+    def from_frames(cls, frames, entities, years, metrics: list, dtype=np.float32):
+        """
+        Builds a panel from DataFrames holding parts of the rows, one at a time,
+        e.g. the partitions of a PartitionedStore.
+
+        Parameters
+        ---------------
+        frames: iterable
+            the parts of the data, with the columns Entity, Year and the metrics
+
+        entities: array-like
+            the sorted names of all entities
+
+        years: array-like
+            the sorted list of all years
+
+        metrics: list
+            the names of the metrics
+
+        dtype: numpy dtype
+            dtype of the values, float32 or float64
+
+        Returns
+        ---------------
+        panel: Panel
+            the panel of the metrics of all frames
+        """
+        entities = np.asarray(entities, dtype=str)
+        years = np.asarray(years)
+        blocks = np.full((len(metrics), len(entities), len(years)), np.nan, dtype=dtype)
+        for frame in frames:
+            rows = _positions(frame["Entity"], entities)
+            columns = np.searchsorted(years, frame["Year"].to_numpy())
+            blocks[:, rows, columns] = frame[metrics].to_numpy(dtype=dtype).T
+        return cls(entities, years, metrics, blocks)
+
+    @property
+    def nbytes(self):
+        """Number of bytes of the values."""
+        return self.blocks.nbytes
+
+    def _metric(self, metric: str):
+        try:
+            return self.metrics.index(metric)
+        except ValueError:
+            raise ValueError(f"{metric} is not a metric of the panel") from None
+
+    def _row(self, entity: str):
+        if entity not in self._rows:
+            raise ValueError(f"{entity} is not an entity of the panel")
+        return self._rows[entity]
+
+    def _column(self, year: int):
+        if year not in self._columns:
+            raise ValueError(f"{year} is not a year of the panel")
+        return self._columns[year]
+
+    def matrix(self, metric: str):
+        """Returns the entity by year matrix of a metric, as a view."""
+        return self.blocks[self._metric(metric)]
+
+    def series(self, entity: str, metric: str = None):
+        """
+        Returns the values of an entity over all years, as a view.
+        Without a metric, a metric by year matrix of all metrics is returned.
+        """
+        values = self.blocks[:, self._row(entity)]
+        return values if metric is None else values[self._metric(metric)]
+
+    def cross_section(self, year: int, metric: str = None):
+        """
+        Returns the values of all entities in a year, as a view.
+        Without a metric, a metric by entity matrix of all metrics is returned.
+        """
+        values = self.blocks[:, :, self._column(year)]
+        return values if metric is None else values[self._metric(metric)]
+
+    def take(self, metric: str, entities, years):
+        """
+        Returns the matrix of a metric for some entities and years as float64.
+        Entities and years missing from the panel get NaN.
+        """
+        rows = np.array([self._rows.get(x, -1) for x in entities], dtype=int)
+        columns = np.array([self._columns.get(x, -1) for x in years], dtype=int)
+        values = self.matrix(metric)[
+            np.ix_(np.maximum(rows, 0), np.maximum(columns, 0))
+        ]
+        values = values.astype(float)
+        values[rows < 0, :] = np.nan
+        values[:, columns < 0] = np.nan
+        return values
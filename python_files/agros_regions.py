@@ -0,0 +1,232 @@
+""" This module contains the regions and groups of countries of the Agros class.
+The membership table 'regions.csv' lists the countries of every aggregate entity of the
+agricultural data, like 'Sub-Saharan Africa' or 'High income'. Its groups are dropped
+from the downloaded data, and the AggregateEngine computes them again from the
+countries: the totals of output columns and the output-weighted means like the tfp,
+for every group and year at once, as one product of the membership matrix with the
+entity by year matrices. When the data is replaced, only the countries whose values
+changed are added to the cached totals again.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from agros_geometry import name_key
+
+REGIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regions.csv")
+
+# the aggregate of all countries, which isn't listed in the membership table
+WORLD = "World"
+
+
+def read_membership(path: str = REGIONS_PATH):
+    """
+    Reads a membership table.
+
+    Parameters
+    ---------------
+    path: str
+        csv file with the columns Entity, Group and Kind, the shipped table by default
+
+    Returns
+    ---------------
+    membership_df: Pandas DataFrame
+        one row per country and group
+    """
+    membership_df = pd.read_csv(path, comment="#")
+    missing = {"Entity", "Group", "Kind"} - set(membership_df.columns)
+    if missing:
+        raise ValueError(
+            f"The membership table misses the columns {', '.join(sorted(missing))}"
+        )
+    return membership_df
+
+
+def aggregate_names(membership_df: pd.DataFrame):
+    """Returns the names of all aggregate entities, the groups and the World."""
+    return frozenset(membership_df["Group"].astype(str)) | {WORLD}
+
+
+class AggregateEngine:
+    """
+    Computes the totals and the weighted means of groups of entities for every year.
+
+    Attributes
+    ---------------
+    entities: list
+        the entities of the rows of the matrices
+
+    years: list
+        the years of the columns of the matrices
+
+    groups: list
+        the names of the groups, the World first
+
+    kinds: dict
+        the kind of every group, e.g. 'region' or 'income'
+
+    membership: numpy array
+        one row per group and one column per entity, 1 for the members of a group
+
+    totals: list
+        the metrics summed over the members
+
+    means: dict
+        the metrics averaged over the members, with the metric used as weight
+
+
+    Methods
+    ---------------
+    load
+        computes the aggregates of entity by year matrices
+
+    update
+        adds the changes of the entities whose values differ from the loaded ones
+
+    frame
+        returns the yearly aggregates of a group
+
+    to_frame
+        returns the yearly aggregates of many groups
+    """
+
+    def __init__(
+        self,
+        membership_df: pd.DataFrame,
+        entities,
+        years,
+        totals: list,
+        means: dict = None,
+    ):
+        self.entities = [str(x) for x in entities]
+        self.years = list(years)
+        self.totals = list(totals)
+        self.means = dict(means or {})
+        self._metrics = list(
+            dict.fromkeys([*self.totals, *self.means, *self.means.values()])
+        )
+
+        # members are matched by name, or by spelling key if the data spells them else
+        positions = {x: i for i, x in enumerate(self.entities)}
+        keys = {name_key(x): i for i, x in enumerate(self.entities)}
+        groups = sorted(set(membership_df["Group"].astype(str)) - {WORLD})
+        self.groups = [WORLD, *groups]
+        self.kinds = {WORLD: "world"}
+        self.kinds.update(
+            zip(membership_df["Group"].astype(str), membership_df["Kind"].astype(str))
+        )
+        rows = {x: i for i, x in enumerate(self.groups)}
+        self.membership = np.zeros((len(self.groups), len(self.entities)))
+        self.membership[0] = 1
+        for entity, group in zip(membership_df["Entity"], membership_df["Group"]):
+            column = positions.get(entity, keys.get(name_key(entity)))
+            if column is not None and group != WORLD:
+                self.membership[rows[group], column] = 1
+
+        self._inputs = None
+        self._sums = None
+        self._frames = {}
+
+    def _stack(self, matrices: dict):
+        """Stacks the entity by year matrices of the metrics as float64."""
+        return np.stack([np.asarray(matrices[x], dtype=float) for x in self._metrics])
+
+    def _terms(self, inputs: np.ndarray):
+        """
+        Returns the summands of the aggregates, the metrics of the totals and
+        the weighted metric and the weight of every mean, where both are known.
+        """
+        values = dict(zip(self._metrics, inputs))
+        terms = [np.nan_to_num(values[x]) for x in self.totals]
+        for metric, weight in self.means.items():
+            known = np.isfinite(values[metric]) & np.isfinite(values[weight])
+            terms.append(np.where(known, values[metric] * values[weight], 0.0))
+            terms.append(np.where(known, values[weight], 0.0))
+        return np.stack(terms)
+
+    def load(self, matrices: dict):
+        """
+        Computes the aggregates of all groups and years.
+
+        Parameters
+        ---------------
+        matrices: dict
+            the entity by year matrix of every metric, e.g. from Panel.matrix
+        """
+        self._inputs = self._stack(matrices)
+        # one product sums every term over the members of every group
+        self._sums = self.membership @ self._terms(self._inputs)
+        self._frames = {}
+
+    def update(self, matrices: dict):
+        """
+        Updates the aggregates with new matrices of the same entities and years.
+        Only the entities whose values changed are added to the sums again.
+
+        Parameters
+        ---------------
+        matrices: dict
+            the new entity by year matrix of every metric
+
+        Returns
+        ---------------
+        changed: list
+            the entities whose values changed
+        """
+        if self._inputs is None:
+            self.load(matrices)
+            return list(self.entities)
+
+        inputs = self._stack(matrices)
+        same = (inputs == self._inputs) | (np.isnan(inputs) & np.isnan(self._inputs))
+        changed = np.flatnonzero(~same.all(axis=(0, 2)))
+        if len(changed) > 0:
+            delta = self._terms(inputs[:, changed]) - self._terms(
+                self._inputs[:, changed]
+            )
+            self._sums += self.membership[:, changed] @ delta
+            self._inputs[:, changed] = inputs[:, changed]
+            self._frames = {}
+        return [self.entities[x] for x in changed]
+
+    def frame(self, group: str):
+        """
+        Returns the yearly aggregates of a group, memoized until the next update.
+
+        Parameters
+        ---------------
+        group: str
+            the name of the group
+
+        Returns
+        ---------------
+        group_df: Pandas DataFrame
+            one row per year with the totals and the weighted means of the group
+        """
+        if group not in self._frames:
+            row = self.groups.index(group)
+            group_df = pd.DataFrame({"Year": self.years})
+            for position, metric in enumerate(self.totals):
+                group_df[metric] = self._sums[position, row]
+            position = len(self.totals)
+            for metric in self.means:
+                weights = self._sums[position + 1, row]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    group_df[metric] = np.where(
+                        weights > 0, self._sums[position, row] / weights, np.nan
+                    )
+                position += 2
+            self._frames[group] = group_df
+        return self._frames[group]
+
+    def to_frame(self, groups: list = None):
+        """
+        Returns the yearly aggregates of some groups, all by default, one after
+        the other with the name of the group in the Entity column.
+        """
+        groups = self.groups if groups is None else groups
+        return pd.concat(
+            [self.frame(x).assign(Entity=x) for x in groups], ignore_index=True
+        )[["Entity", "Year", *self.totals, *self.means]]
@@ -0,0 +1,136 @@
+""" This module contains the headless rendering helpers of the Agros class.
+Charts are drawn on object-oriented matplotlib figures with the Agg canvas,
+so they never touch the pyplot state, and are returned as PNG or SVG bytes.
+Finished images are kept in a least recently used cache keyed by the chart
+method and its arguments, so repeated requests are served without drawing.
+"""
+
+# matplotlib is only imported once a chart is rendered
+# pylint: disable=import-outside-toplevel
+
+import io
+import threading
+from collections import OrderedDict
+
+
+def freeze(value):
+    """
+    Converts an argument into a hashable value for the cache key.
+    Lists, tuples and sets become tuples and dictionaries sorted tuples of items.
+
+    Parameters
+    ---------------
+    value: any
+        the argument of a chart method
+
+    Returns
+    ---------------
+    frozen: any
+        a hashable equivalent of the argument
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(x) for x in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(freeze(x) for x in value))
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(x)) for key, x in value.items()))
+    return value
+
+
+def render_figure(
+    draw, *args, figsize=None, fmt: str = "png", dpi: int = 100, **kwargs
+):
+    """
+    Draws a chart on a new Agg figure and returns the encoded image.
+
+    Parameters
+    ---------------
+    draw: callable
+        function drawing the chart, called with the figure, the args and the kwargs
+
+    figsize: tuple
+        width and height of the figure in inches, the matplotlib default if None
+
+    fmt: str
+        image format, e.g. 'png' or 'svg'
+
+    dpi: int
+        resolution of raster images
+
+    Returns
+    ---------------
+    image: bytes
+        the encoded image
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    draw(figure, *args, **kwargs)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=fmt, dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+class RenderCache:
+    """
+    A thread-safe least recently used cache of rendered images.
+
+    Attributes
+    ---------------
+    maxsize: int
+        maximum number of images kept in the cache
+
+    hits: int
+        number of requests served from the cache
+
+    misses: int
+        number of requests that had to be rendered
+
+
+    Methods
+    ---------------
+    get
+        returns the image of a key, or None
+
+    put
+        stores the image of a key and drops the least recently used images
+
+    clear
+        removes all images
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._images)
+
+    def get(self, key):
+        """Returns the cached image of a key and marks it as recently used, or None."""
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._images.move_to_end(key)
+            return image
+
+    def put(self, key, image: bytes):
+        """Stores the image of a key and drops the least recently used images."""
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self.maxsize:
+                self._images.popitem(last=False)
+
+    def clear(self):
+        """Removes all images from the cache."""
+        with self._lock:
+            self._images.clear()
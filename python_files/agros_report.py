@@ -0,0 +1,481 @@
+""" This module contains the incremental report pipeline of the Agros class.
+A report is a list of invocations of the plotting methods and of forecast, written to
+files of an output folder. The pipeline runs them as a dependency graph: the shared
+intermediates, like the loaded data, the panel, the regional aggregates, the prepared
+polygons and the correlation statistics, are computed once, independent ones in
+parallel threads, and the steps then run in parallel worker processes, which inherit
+the prepared instance where processes can be forked.
+Every step is fingerprinted with the values of the countries or the year it reads,
+so a rerun only renders the charts and forecasts whose data actually changed.
+"""
+
+# the pipeline prepares the private intermediates of the Agros instance
+# pylint: disable=protected-access
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import numpy as np
+
+from agros_render import freeze
+
+# the methods a report can run and the extension of their files, the image format if None
+REPORT_METHODS = {
+    "area_graph": None,
+    "compare_output": None,
+    "gapminder": None,
+    "choropleth": None,
+    "correlate_quantity": None,
+    "predictor": None,
+    "forecast": "csv",
+}
+
+# the shared intermediates, their dependencies and the Agros calls computing them
+_INTERMEDIATES = {
+    "data": ((), None),
+    "index": (("data",), lambda agros: agros._build_index()),
+    # a store is read per query instead of holding a panel of all metrics
+    "panel": (("data",), lambda agros: agros.store is None and agros.panel),
+    "outputs": (("index",), lambda agros: agros._build_outputs()),
+    "geometry": (("index",), lambda agros: agros._prepare_geometry()),
+    "correlation": (("index",), lambda agros: agros._correlation_engine()),
+}
+
+# the intermediates every method reads
+_NEEDS = {
+    "area_graph": ("outputs",),
+    "compare_output": ("outputs",),
+    "gapminder": ("panel",),
+    "choropleth": ("geometry", "panel"),
+    "correlate_quantity": ("correlation",),
+    "predictor": ("index",),
+    "forecast": ("index",),
+}
+
+# the instance of a worker process, inherited from the parent or set by the initializer
+_WORKER = {"agros": None}
+
+
+def _init_worker(agros):
+    _WORKER["agros"] = agros
+
+
+class ReportStep:
+    """
+    One invocation of a report.
+
+    Attributes
+    ---------------
+    method: str
+        the Agros method, a key of REPORT_METHODS
+
+    args: tuple
+        the arguments of the method
+
+    kwargs: dict
+        the keyword arguments of the method
+
+    name: str
+        the name of the output file without extension, derived from the arguments if None
+
+    fmt: str
+        the image format of charts, e.g. 'png' or 'svg'
+    """
+
+    def __init__(
+        self,
+        method: str,
+        args=(),
+        kwargs: dict = None,
+        name: str = None,
+        fmt: str = "png",
+    ):
+        if method not in REPORT_METHODS:
+            raise ValueError(
+                f"{method} can't be run in a report, "
+                f"choose one of: {', '.join(REPORT_METHODS)}"
+            )
+        self.method = method
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.fmt = fmt
+        if name is None:
+            parts = [method, *map(str, _flatten(self.args))]
+            parts += [f"{key}-{value}" for key, value in sorted(self.kwargs.items())]
+            name = re.sub(r"[^A-Za-z0-9_.]+", "-", "_".join(parts)).strip("-")
+        self.name = name
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Builds a step from a dictionary with the keys method, args, kwargs, name and fmt,
+        or from a list of the method and its arguments.
+        """
+        if isinstance(spec, ReportStep):
+            return spec
+        if isinstance(spec, dict):
+            return cls(**spec)
+        return cls(spec[0], spec[1:])
+
+    @property
+    def filename(self):
+        """The name of the output file."""
+        return f"{self.name}.{REPORT_METHODS[self.method] or self.fmt}"
+
+    def key(self):
+        """The hashable identity of the step."""
+        return (self.method, freeze(self.args), freeze(self.kwargs), self.fmt)
+
+
+def _flatten(values):
+    for value in values:
+        if isinstance(value, (list, tuple)):
+            yield from _flatten(value)
+        else:
+            yield value
+
+
+class Fingerprints:
+    """
+    Hashes of the values of the countries and years of the loaded data.
+    The rows are read from data_df, or from the store one partition at a time,
+    so no panel of all metrics is built.
+
+    Methods
+    ---------------
+    step
+        returns the fingerprint of a step
+    """
+
+    def __init__(self, agros):
+        self.agros = agros
+        self._columns = [
+            x for x in agros._source().columns if x not in ("Entity", "Year")
+        ]
+        self._entities = {}
+        self._years = {}
+        self._store_hashed = False
+
+    def _values(self, data_df):
+        """Returns the bytes of the years and metrics of some rows."""
+        values = data_df[["Year", *self._columns]].to_numpy(dtype=np.float64)
+        return np.ascontiguousarray(values).tobytes()
+
+    def _hash_store(self):
+        """Hashes the rows of every country of the store in one pass over its partitions."""
+        digests = {}
+        for frame in self.agros.store.iter_frames():
+            entity = frame["Entity"].astype(str).to_numpy()
+            order = np.argsort(entity, kind="stable")
+            values = frame[["Year", *self._columns]].to_numpy(dtype=np.float64)[order]
+            names, starts = np.unique(entity[order], return_index=True)
+            for name, block in zip(names, np.split(values, starts[1:])):
+                if name not in digests:
+                    digests[name] = hashlib.blake2b(name.encode(), digest_size=16)
+                digests[name].update(np.ascontiguousarray(block).tobytes())
+        self._entities.update({x: digest.hexdigest() for x, digest in digests.items()})
+
+    def entity(self, entity: str):
+        """Returns the hash of all values of a country."""
+        if self.agros.store is not None and not self._store_hashed:
+            self._hash_store()
+            self._store_hashed = True
+        if entity not in self._entities:
+            digest = hashlib.blake2b(entity.encode(), digest_size=16)
+            if self.agros.store is None and self.agros._is_country(entity):
+                digest.update(self._values(self.agros._country_df(entity)))
+            self._entities[entity] = digest.hexdigest()
+        return self._entities[entity]
+
+    def year(self, year: int):
+        """Returns the hash of the values of all countries in a year."""
+        if year not in self._years:
+            digest = hashlib.blake2b(str(year).encode(), digest_size=16)
+            if isinstance(year, int):
+                year_df = self.agros._year_df(year).sort_values("Entity", kind="stable")
+                digest.update("\n".join(year_df["Entity"].astype(str)).encode())
+                digest.update(self._values(year_df))
+            self._years[year] = digest.hexdigest()
+        return self._years[year]
+
+    def _members(self, name):
+        """Returns the countries of a country, a region or the World."""
+        if name is None or not isinstance(name, str):
+            return list(self.agros._country_list)
+        if self.agros._is_country(name):
+            return [name]
+        engine = self.agros._aggregate_engine
+        if engine is not None and name in engine.groups:
+            row = engine.membership[engine.groups.index(name)]
+            return [engine.entities[x] for x in np.flatnonzero(row)]
+        return [name]
+
+    def step(self, step: ReportStep):
+        """
+        Returns the fingerprint of a step: a hash of its invocation and of the
+        values it reads, the countries of its arguments or the cross-section of its year.
+        """
+        digest = hashlib.blake2b(repr(step.key()).encode(), digest_size=16)
+        method, args = step.method, step.args
+        if method in ("gapminder", "choropleth"):
+            parts = [self.year(args[0]) if args else ""]
+            if method == "choropleth":
+                geometry = self.agros.geometry
+                parts.append(hashlib.blake2b(geometry.bounds.tobytes()).hexdigest())
+                parts.append("\n".join(geometry.names.tolist()))
+        else:
+            if method == "area_graph":
+                names = self._members(args[0] if args else None)
+            elif method == "compare_output":
+                names = [x for name in args for x in self._members(name)]
+            elif method in ("predictor", "forecast"):
+                countries = args[0] if args else step.kwargs.get("countries")
+                names = self._members(None) if countries is None else list(countries)
+            else:
+                names = self._members(None)
+            parts = [self.entity(x) for x in sorted(set(map(str, names)))]
+        digest.update("\n".join(parts).encode())
+        return digest.hexdigest()
+
+
+def _write(path: str, content: bytes):
+    """Writes a file atomically, so a report never holds a partial file."""
+    temp_path = f"{path}.part"
+    with open(temp_path, "wb") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+
+def _run_step(step: ReportStep, path: str, dpi: int):
+    """
+    Runs one step with the instance of the process and writes its file.
+
+    Returns
+    ---------------
+    result: tuple
+        the name of the step and the error message, or None
+    """
+    agros = _WORKER["agros"]
+    try:
+        if step.method == "forecast":
+            kwargs = dict(step.kwargs)
+            # the worker is already one of many processes
+            kwargs.setdefault("workers", 1)
+            forecast_df = agros.forecast(*step.args, **kwargs)
+            _write(path, forecast_df.to_csv(index=False).encode())
+        else:
+            image = agros.render(
+                step.method, *step.args, fmt=step.fmt, dpi=dpi, **step.kwargs
+            )
+            _write(path, image)
+    except Exception as error:  # pylint: disable=broad-except
+        return step.name, f"{type(error).__name__}: {error}"
+    return step.name, None
+
+
+class ReportPipeline:
+    """
+    Runs a report incrementally, as a dependency graph of shared intermediates and steps.
+
+    Attributes
+    ---------------
+    agros: Agros
+        the instance running the report
+
+    steps: list
+        the ReportSteps of the report
+
+    output_dir: str
+        the folder of the files and of the manifest 'report.json'
+
+    workers: int
+        number of threads of the intermediates and processes of the steps
+
+    dpi: int
+        resolution of raster images
+
+    chunksize: int
+        number of csv rows per partition if the data is loaded into a partitioned store,
+        the loading mode of the instance if None
+
+
+    Methods
+    ---------------
+    from_json
+        reads a report from a JSON file with a list of steps
+
+    run
+        runs the steps whose data or invocation changed since the last run
+    """
+
+    def __init__(
+        self,
+        agros,
+        steps: list,
+        output_dir: str = "report",
+        workers: int = None,
+        dpi: int = 100,
+        chunksize: int = None,
+    ):
+        self.agros = agros
+        self.steps = [ReportStep.from_spec(x) for x in steps]
+        names = [x.name for x in self.steps]
+        duplicates = sorted({x for x in names if names.count(x) > 1})
+        if duplicates:
+            raise ValueError(f"Steps with the same name: {', '.join(duplicates)}")
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.dpi = dpi
+        self.chunksize = chunksize
+
+    @classmethod
+    def from_json(cls, agros, path: str, **kwargs):
+        """Reads a report from a JSON file with a list of steps, see ReportStep.from_spec."""
+        with open(path, encoding="utf-8") as file:
+            return cls(agros, json.load(file), **kwargs)
+
+    def _prepare(self, names: set, refresh: bool = False):
+        """
+        Computes the intermediates and their dependencies once, as a graph: each
+        intermediate starts in a thread as soon as its dependencies are done.
+        """
+        closure = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name not in closure:
+                closure.add(name)
+                stack.extend(_INTERMEDIATES[name][0])
+
+        def compute(name):
+            with self.agros.instrumentation.stage("report", f"prepare {name}"):
+                if name == "data":
+                    self._load(refresh)
+                else:
+                    _INTERMEDIATES[name][1](self.agros)
+
+        done = set(self._prepared)
+        remaining = closure - done
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            while remaining or pending:
+                ready = [x for x in remaining if set(_INTERMEDIATES[x][0]) <= done]
+                for name in ready:
+                    pending[executor.submit(compute, name)] = name
+                    remaining.discard(name)
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    future.result()
+                    done.add(pending.pop(future))
+        self._prepared = done
+
+    def _load(self, refresh: bool):
+        """
+        Loads the data unless it is already loaded in the requested mode.
+        A reload keeps the loading mode of the instance, in memory or in a store.
+        """
+        agros = self.agros
+        chunksize = agros._chunksize if self.chunksize is None else self.chunksize
+        loaded = agros.store is not None or not agros.data_df.empty
+        if refresh or not loaded or chunksize != agros._chunksize:
+            agros.download_data(refresh=refresh, chunksize=chunksize)
+
+    def _executor(self, n_steps: int):
+        """
+        Returns the pool running the steps. Forked processes inherit the prepared
+        instance, elsewhere the steps run in threads of this process.
+        """
+        workers = max(1, min(self.workers, n_steps))
+        if "fork" in multiprocessing.get_all_start_methods() and workers > 1:
+            return ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+                initargs=(self.agros,),
+            )
+        _init_worker(self.agros)
+        return ThreadPoolExecutor(max_workers=workers)
+
+    def run(self, force: bool = False, refresh: bool = False):
+        """
+        Runs the report. Steps whose file exists and whose fingerprint is unchanged
+        are skipped, unless forced.
+
+        Parameters
+        ---------------
+        force: boolean
+            whether all steps should run, whatever their fingerprints
+
+        refresh: boolean
+            whether the download should be checked for updates and the data reloaded
+            first, otherwise the data already loaded by the instance is reported
+
+        Returns
+        ---------------
+        summary: dict
+            the names of the 'ran' and 'skipped' steps and the errors of the 'failed' steps
+        """
+        self._prepared = set()
+        self._prepare({"outputs"}, refresh=refresh)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest_path = os.path.join(self.output_dir, "report.json")
+        manifest = {}
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, encoding="utf-8") as file:
+                manifest = json.load(file)
+
+        with self.agros.instrumentation.stage("report", "fingerprint") as stage:
+            fingerprints = Fingerprints(self.agros)
+            current = {x.name: fingerprints.step(x) for x in self.steps}
+            stale = [
+                x
+                for x in self.steps
+                if force
+                or manifest.get(x.name, {}).get("fingerprint") != current[x.name]
+                or not os.path.isfile(os.path.join(self.output_dir, x.filename))
+            ]
+            stage.rows = len(stale)
+
+        summary = {
+            "ran": [],
+            "skipped": [x.name for x in self.steps if x not in stale],
+            "failed": {},
+        }
+        if stale:
+            self._prepare({x for step in stale for x in _NEEDS[step.method]})
+            with self.agros.instrumentation.stage("report", "steps", rows=len(stale)):
+                with self._executor(len(stale)) as executor:
+                    results = list(
+                        executor.map(
+                            _run_step,
+                            stale,
+                            [os.path.join(self.output_dir, x.filename) for x in stale],
+                            [self.dpi] * len(stale),
+                        )
+                    )
+            steps = {x.name: x for x in stale}
+            for name, error in results:
+                if error is None:
+                    summary["ran"].append(name)
+                    manifest[name] = {
+                        "fingerprint": current[name],
+                        "file": steps[name].filename,
+                    }
+                else:
+                    summary["failed"][name] = error
+                    manifest.pop(name, None)
+
+        # steps removed from the report are forgotten, their files are kept
+        manifest = {x.name: manifest[x.name] for x in self.steps if x.name in manifest}
+        _write(manifest_path, json.dumps(manifest, indent=2).encode())
+        return summary
@@ -0,0 +1,273 @@
+""" This module contains the asyncio front end of the Agros class.
+A web service can await the methods of AgrosService without blocking its event loop.
+Downloads and light queries run on a bounded thread pool, while charts and forecasts,
+which are bound by the CPU, run on a bounded process pool. Every worker process keeps
+its own Agros instance on the memory-mapped binary cache, so the data is shared
+between the processes and is only reloaded when the downloaded file changes.
+Concurrent identical requests are coalesced into one computation, and new requests
+are rejected with ServiceBusy once too many computations are pending.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from agros_class import Agros
+from agros_data import source_signature
+from agros_render import freeze
+
+# the Agros instance of a worker process and the signature of the data it has loaded
+_WORKER = {"agros": None, "signature": None, "chunksize": None}
+
+
+def _init_worker(chunksize: int = None):
+    _WORKER["chunksize"] = chunksize
+
+
+def _worker_agros():
+    """Returns the Agros instance of a worker process, reloading it if the data changed."""
+    signature = source_signature("downloads/download.csv")
+    if _WORKER["agros"] is None or _WORKER["signature"] != signature:
+        agros = Agros()
+        agros.download_data(chunksize=_WORKER["chunksize"])
+        _WORKER["agros"] = agros
+        _WORKER["signature"] = signature
+    return _WORKER["agros"]
+
+
+def _render_in_worker(method: str, args: tuple, fmt: str, dpi: int, kwargs: dict):
+    return _worker_agros().render(method, *args, fmt=fmt, dpi=dpi, **kwargs)
+
+
+def _forecast_in_worker(countries: list, n_periods: int, timeout: float, engine: str):
+    return _worker_agros().forecast(
+        countries, n_periods=n_periods, workers=1, timeout=timeout, engine=engine
+    )
+
+
+class ServiceBusy(RuntimeError):
+    """Raised when a request would exceed the pending computations of the service."""
+
+
+class AgrosService:
+    """
+    Serves the queries, charts and forecasts of Agros to asyncio code.
+
+    Attributes
+    ---------------
+    agros: Agros
+        the instance answering the queries in the service process
+
+    max_pending: int
+        maximum number of distinct computations running or waiting at once
+
+    stats: dict
+        number of computed, coalesced, cached and rejected requests
+
+
+    Methods
+    ---------------
+    load
+        loads the data, downloading it if needed
+
+    refresh
+        checks the download for updates and reloads the data
+
+    list_countries
+        returns all countries of the dataset
+
+    render
+        renders the chart of a plotting method on a worker process
+
+    forecast
+        forecasts the tfp of some countries on a worker process
+
+    close
+        shuts the executors down
+    """
+
+    def __init__(
+        self,
+        agros: Agros = None,
+        threads: int = 4,
+        processes: int = None,
+        max_pending: int = 64,
+        chunksize: int = None,
+    ):
+        self.agros = agros if agros is not None else Agros()
+        self.max_pending = max_pending
+        self.chunksize = chunksize
+        self.stats = {"computed": 0, "coalesced": 0, "cached": 0, "rejected": 0}
+        self._threads = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="agros"
+        )
+        self._processes = ProcessPoolExecutor(
+            max_workers=processes or os.cpu_count() or 1,
+            initializer=_init_worker,
+            initargs=(chunksize,),
+        )
+        self._pending = {}
+
+    async def __aenter__(self):
+        await self.load()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shuts the thread and process pools down, without waiting for running work."""
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        self._processes.shutdown(wait=False, cancel_futures=True)
+
+    async def _coalesce(self, key: tuple, executor, function, *args):
+        """
+        Runs a function on an executor, or joins the identical computation
+        that is already pending. Cancelling one caller doesn't cancel the others.
+        """
+        task = self._pending.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        if len(self._pending) >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise ServiceBusy(
+                f"{len(self._pending)} computations are pending, try again later"
+            )
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(loop.run_in_executor(executor, function, *args))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        self.stats["computed"] += 1
+        return await asyncio.shield(task)
+
+    async def load(self):
+        """Loads the data into the service process, downloading it if needed."""
+        await self._coalesce(
+            ("download_data", False),
+            self._threads,
+            self._download,
+            False,
+        )
+
+    async def refresh(self):
+        """
+        Checks the download for updates and reloads the data if it changed.
+        The worker processes reload the data with their next request.
+        """
+        await self._coalesce(
+            ("download_data", True),
+            self._threads,
+            self._download,
+            True,
+        )
+
+    def _download(self, refresh: bool):
+        signature = None
+        if os.path.isfile("downloads/download.csv"):
+            signature = source_signature("downloads/download.csv")
+        self.agros.download_data(refresh=refresh, chunksize=self.chunksize)
+        if signature != source_signature("downloads/download.csv"):
+            self.agros.render_cache.clear()
+
+    async def list_countries(self):
+        """Returns all countries of the dataset."""
+        return await self._coalesce(
+            ("list_countries",), self._threads, self.agros.list_countries
+        )
+
+    async def render(
+        self, method: str, *args, fmt: str = "png", dpi: int = 100, **kwargs
+    ):
+        """
+        Renders the chart of a plotting method on a worker process and returns the image.
+        Images are cached in the render_cache of the service's Agros instance.
+
+        Parameters
+        ---------------
+        method: str
+            the plotting method, as for Agros.render
+
+        *args: any
+            the arguments of the plotting method
+
+        fmt: str
+            image format, e.g. 'png' or 'svg'
+
+        dpi: int
+            resolution of raster images
+
+        **kwargs: any
+            the keyword arguments of the plotting method, e.g. aggregate
+
+        Returns
+        ---------------
+        image: bytes
+            the encoded image
+        """
+        if method not in Agros._RENDERERS:  # pylint: disable=protected-access
+            raise ValueError(
+                f"{method} can't be rendered, "
+                f"choose one of: {', '.join(Agros._RENDERERS)}"  # pylint: disable=protected-access
+            )
+
+        key = (method, freeze(args), freeze(kwargs), fmt, dpi)
+        image = self.agros.render_cache.get(key)
+        if image is not None:
+            self.stats["cached"] += 1
+            return image
+
+        image = await self._coalesce(
+            ("render", *key),
+            self._processes,
+            _render_in_worker,
+            method,
+            args,
+            fmt,
+            dpi,
+            kwargs,
+        )
+        self.agros.render_cache.put(key, image)
+        return image
+
+    async def forecast(
+        self,
+        countries: list = None,
+        n_periods: int = 30,
+        timeout: float = None,
+        engine: str = "arima",
+    ):
+        """
+        Forecasts the total factor productivity of some countries on a worker process.
+
+        Parameters
+        ---------------
+        countries: list
+            the countries to forecast, defaults to all countries of the dataset
+
+        n_periods: int
+            number of years to forecast
+
+        timeout: float
+            maximum number of seconds spent on the fit of a single country
+
+        engine: str
+            'arima' or the much faster 'statespace' engine
+
+        Returns
+        ---------------
+        forecast_df: Pandas DataFrame
+            the forecasts, as returned by Agros.forecast
+        """
+        countries = None if countries is None else list(countries)
+        return await self._coalesce(
+            ("forecast", freeze(countries), n_periods, timeout, engine),
+            self._processes,
+            _forecast_in_worker,
+            countries,
+            n_periods,
+            timeout,
+            engine,
+        )
@@ -0,0 +1,313 @@
+""" This module contains the state space forecaster of the Agros class.
+Local level and local linear trend models are fitted on the total factor productivity
+of all countries at once. The countries are the rows of an entity by year matrix, and
+one Kalman filter runs over all of them, and over a grid of variance ratios, with
+vectorized NumPy operations instead of one model search per country. Missing years
+are skipped by the filter. The variance of the observations is concentrated out of
+the likelihood, so only the ratios of the level and slope variances to it are searched:
+on a coarse grid first and on a finer grid around the best ratios of each country.
+The models are simpler than ARIMA models but many times faster to fit, which suits
+screening all countries.
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+
+# kinds of models, 'auto' picks the model with the lower AIC for each country
+STATESPACE_MODELS = ("level", "trend", "auto")
+
+# variance of the diffuse initial state, relative to the variance of the observations
+_KAPPA = 1e7
+
+# coarse grids of the variance ratios of the level and the slope
+_LEVEL_GRID = np.concatenate(([0.0], np.logspace(-4, 4, 17)))
+_SLOPE_GRID = np.concatenate(([0.0], np.logspace(-6, 2, 9)))
+
+# factors around the best coarse ratios of the finer grids, a quarter of the spacing
+_LEVEL_REFINE = 10.0 ** np.linspace(-0.25, 0.25, 5)
+_SLOPE_REFINE = 10.0 ** np.linspace(-0.5, 0.5, 5)
+
+
+def _filter(
+    values: np.ndarray, q_level, q_slope, trend: bool, skip: int, state: bool = False
+):
+    """
+    Runs the Kalman filter of a local level or local linear trend model.
+
+    Parameters
+    ---------------
+    values: numpy array
+        the observations, one row per entity and one column per year, NaN if missing
+
+    q_level, q_slope: numpy array
+        the variance ratios of the level and the slope, of shape (grid, entities)
+
+    trend: boolean
+        whether the model has a slope
+
+    skip: int
+        number of first observations of each entity left out of the likelihood,
+        which are needed to initialize the diffuse state
+
+    state: boolean
+        whether the filtered state at the last observation of each entity is returned
+
+    Returns
+    ---------------
+    result: dict
+        the log likelihood, the variance of the observations and the number of
+        observations in the likelihood of every entity and ratio, the column of
+        the last observation of every entity and, if requested, the state
+    """
+    shape = np.broadcast_shapes(np.shape(q_level), np.shape(q_slope), values.shape[:1])
+    level = np.zeros(shape)
+    slope = np.zeros(shape)
+    p11 = np.full(shape, _KAPPA)
+    p12 = np.zeros(shape)
+    p22 = np.full(shape, _KAPPA if trend else 0.0)
+    sum_log_f = np.zeros(shape)
+    sum_v2_f = np.zeros(shape)
+
+    observed = np.isfinite(values)
+    filled = np.where(observed, values, 0.0)
+    # the observations of the likelihood follow the first ones of each entity
+    counted = observed & (np.cumsum(observed, axis=1) > skip)
+    n_obs = counted.sum(axis=1)
+    last = np.where(
+        observed.any(axis=1), values.shape[1] - 1 - np.argmax(observed[:, ::-1], 1), -1
+    )
+    filtered = [np.zeros(shape) for _ in range(5)]
+
+    for t in range(values.shape[1]):
+        if t > 0:
+            # predict the state of the next year
+            level = level + slope
+            p11 = p11 + 2 * p12 + p22 + q_level
+            p12 = p12 + p22
+            p22 = p22 + q_slope
+
+        mask = observed[:, t]
+        if not mask.any():
+            continue
+
+        # update the state with the observations of the year, with unit noise variance
+        f = p11 + 1.0
+        v = filled[:, t] - level
+        if not mask.all():
+            v = np.where(mask, v, 0.0)
+        gain = v / f
+        if counted[:, t].all():
+            sum_log_f += np.log(f)
+            sum_v2_f += v * gain
+        else:
+            sum_log_f += np.where(counted[:, t], np.log(f), 0.0)
+            sum_v2_f += np.where(counted[:, t], v * gain, 0.0)
+        level = level + p11 * gain
+        slope = slope + p12 * gain
+        if mask.all():
+            p22 = p22 - p12 * p12 / f
+            p11 = p11 / f
+            p12 = p12 / f
+        else:
+            p22 = np.where(mask, p22 - p12 * p12 / f, p22)
+            p11 = np.where(mask, p11 / f, p11)
+            p12 = np.where(mask, p12 / f, p12)
+
+        rows = np.flatnonzero(last == t)
+        if state and len(rows) > 0:
+            for array, current in zip(filtered, (level, slope, p11, p12, p22)):
+                array[..., rows] = current[..., rows]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma2 = sum_v2_f / n_obs
+        loglik = -0.5 * (n_obs * np.log(2 * np.pi * sigma2) + n_obs + sum_log_f)
+    # entities without observations in the likelihood can't be fitted
+    loglik = np.where((n_obs > 0) & (sigma2 > 0), loglik, -np.inf)
+    return {
+        "loglik": loglik,
+        "sigma2": sigma2,
+        "n_obs": n_obs,
+        "last": last,
+        "state": filtered if state else None,
+    }
+
+
+def _best(loglik: np.ndarray, *grids):
+    """Returns the index of the best ratios of each entity and the ratios."""
+    best = np.argmax(loglik, axis=0)
+    columns = np.arange(loglik.shape[1])
+    return best, [np.broadcast_to(x, loglik.shape)[best, columns] for x in grids]
+
+
+def _fit_model(values: np.ndarray, trend: bool, skip: int):
+    """
+    Searches the variance ratios of one kind of model for all entities.
+    Returns the filter result of the best ratios and the ratios.
+    """
+    if trend:
+        q_level, q_slope = np.meshgrid(_LEVEL_GRID, _SLOPE_GRID, indexing="ij")
+        q_level, q_slope = q_level.reshape(-1, 1), q_slope.reshape(-1, 1)
+    else:
+        q_level, q_slope = _LEVEL_GRID.reshape(-1, 1), np.zeros((1, 1))
+    coarse = _filter(values, q_level, q_slope, trend, skip)
+    _, (q_level, q_slope) = _best(coarse["loglik"], q_level, q_slope)
+
+    # a finer grid around the best coarse ratios of each entity
+    if trend:
+        level_factor, slope_factor = np.meshgrid(
+            _LEVEL_REFINE, _SLOPE_REFINE, indexing="ij"
+        )
+        q_level = q_level * level_factor.reshape(-1, 1)
+        q_slope = q_slope * slope_factor.reshape(-1, 1)
+    else:
+        q_level = q_level * _LEVEL_REFINE.reshape(-1, 1)
+        q_slope = np.zeros((1, 1))
+    fine = _filter(values, q_level, q_slope, trend, skip)
+    _, (q_level, q_slope) = _best(fine["loglik"], q_level, q_slope)
+
+    result = _filter(values, q_level[None], q_slope[None], trend, skip, state=True)
+    result["loglik"] = result["loglik"][0]
+    result["sigma2"] = result["sigma2"][0]
+    result["state"] = [x[0] for x in result["state"]]
+    result["q_level"] = q_level
+    result["q_slope"] = q_slope
+    return result
+
+
+class StateSpaceFit:
+    """
+    The fitted state space models of the rows of an entity by year matrix.
+
+    Attributes
+    ---------------
+    model: numpy array
+        the kind of model of each entity, 'level' or 'trend'
+
+    q_level, q_slope: numpy array
+        the variance ratios of the level and the slope to the observations
+
+    sigma2: numpy array
+        the variance of the observations
+
+    loglik, aic: numpy array
+        the log likelihood and the Akaike information criterion of each model,
+        -inf and inf for entities with too few observations
+
+    last: numpy array
+        the column of the last observation of each entity, -1 without observations
+
+
+    Methods
+    ---------------
+    forecast
+        returns the forecasts and prediction intervals after the last observations
+    """
+
+    def __init__(self, model, q_level, q_slope, sigma2, loglik, n_params, last, state):
+        self.model = model
+        self.q_level = q_level
+        self.q_slope = q_slope
+        self.sigma2 = sigma2
+        self.loglik = loglik
+        self.aic = np.where(np.isfinite(loglik), 2 * n_params - 2 * loglik, np.inf)
+        self.last = last
+        self._state = state
+
+    @property
+    def fitted(self):
+        """Whether the model of each entity could be fitted."""
+        return np.isfinite(self.loglik)
+
+    def forecast(self, n_periods: int = 30, alpha: float = 0.05):
+        """
+        Forecasts the years after the last observation of each entity.
+
+        Parameters
+        ---------------
+        n_periods: int
+            number of years to forecast
+
+        alpha: float
+            the prediction intervals cover 1 - alpha of the forecast distribution
+
+        Returns
+        ---------------
+        mean, lower, upper: numpy array
+            the forecasts and the bounds of the prediction intervals,
+            one row per entity and one column per forecasted year
+        """
+        level, slope, p11, p12, p22 = (x.copy() for x in self._state)
+        z = NormalDist().inv_cdf(1 - alpha / 2)
+        mean = np.empty((len(level), n_periods))
+        scale = np.empty((len(level), n_periods))
+        for h in range(n_periods):
+            level = level + slope
+            p11 = p11 + 2 * p12 + p22 + self.q_level
+            p12 = p12 + p22
+            p22 = p22 + self.q_slope
+            mean[:, h] = level
+            scale[:, h] = np.sqrt(self.sigma2 * (p11 + 1.0))
+        mean[~self.fitted] = np.nan
+        return mean, mean - z * scale, mean + z * scale
+
+
+def fit_statespace(values: np.ndarray, model: str = "auto"):
+    """
+    Fits a local level or local linear trend model on every row of a matrix.
+
+    Parameters
+    ---------------
+    values: numpy array
+        the observations, one row per entity and one column per consecutive year,
+        NaN where missing
+
+    model: str
+        'level', 'trend' or 'auto' to pick the model with the lower AIC per entity
+
+    Returns
+    ---------------
+    fit: StateSpaceFit
+        the fitted models of all entities
+    """
+    if model not in STATESPACE_MODELS:
+        raise ValueError(
+            f"Variable 'model' must be one of {', '.join(STATESPACE_MODELS)}."
+        )
+    values = np.asarray(values, dtype=float)
+    if values.ndim != 2:
+        raise ValueError("Variable 'values' must be a matrix of entities and years.")
+
+    # both kinds of models leave out the same observations, so their AIC is comparable
+    skip = {"level": 1, "trend": 2, "auto": 2}[model]
+    fits = {}
+    if model in ("level", "auto"):
+        fits["level"] = _fit_model(values, False, skip)
+    if model in ("trend", "auto"):
+        fits["trend"] = _fit_model(values, True, skip)
+
+    n_params = {"level": 2, "trend": 3}
+    if model == "auto":
+        aic = {
+            name: 2 * n_params[name] - 2 * fit["loglik"] for name, fit in fits.items()
+        }
+        use_trend = aic["trend"] < aic["level"]
+    else:
+        use_trend = np.full(len(values), model == "trend")
+
+    level_fit = fits.get("level", fits.get("trend"))
+    trend_fit = fits.get("trend", level_fit)
+
+    def pick(level, trend):
+        return np.where(use_trend, trend, level)
+
+    return StateSpaceFit(
+        pick("level", "trend"),
+        pick(level_fit["q_level"], trend_fit["q_level"]),
+        pick(level_fit["q_slope"], trend_fit["q_slope"]),
+        pick(level_fit["sigma2"], trend_fit["sigma2"]),
+        pick(level_fit["loglik"], trend_fit["loglik"]),
+        pick(n_params["level"], n_params["trend"]),
+        level_fit["last"],
+        [pick(x, y) for x, y in zip(level_fit["state"], trend_fit["state"])],
+    )
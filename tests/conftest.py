@@ -0,0 +1,37 @@
+""" Shared fixtures of the tests: a synthetic dataset in a temporary working folder,
+so that no test downloads anything or writes next to the repository.
+"""
+
+import os
+import sys
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "python_files"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# pylint: disable=wrong-import-position,redefined-outer-name
+import pytest
+
+from agros_class import Agros
+from synthetic import generate_panel
+
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    """A working folder whose 'downloads' holds a synthetic dataset."""
+    os.makedirs(tmp_path / "downloads")
+    generate_panel().to_csv(tmp_path / "downloads" / "download.csv", index=False)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def agros(data_folder):
+    """An Agros instance with the synthetic dataset loaded."""
+    agros = Agros()
+    agros.download_data()
+    return agros
@@ -0,0 +1,43 @@
+""" Tests of the export of animations. """
+
+import os
+
+import pytest
+
+from agros_animation import save_animation
+
+
+def test_gapminder_frames(agros, tmp_path):
+    path = agros.export_animation(
+        "gapminder", str(tmp_path / "frames"), years=[2000, 2001], workers=1
+    )
+    assert sorted(os.listdir(path)) == ["frame_2000.png", "frame_2001.png"]
+
+
+def test_gapminder_gif(agros, tmp_path):
+    path = agros.export_animation(
+        "gapminder", str(tmp_path / "chart.gif"), years=range(2000, 2003), workers=2
+    )
+    assert open(path, "rb").read(6) == b"GIF89a"
+
+
+@pytest.mark.parametrize("years", [[], range(2000, 2000)])
+def test_empty_years(agros, tmp_path, years):
+    with pytest.raises(ValueError, match="at least one year"):
+        agros.export_animation("gapminder", str(tmp_path / "chart.gif"), years=years)
+
+
+@pytest.mark.parametrize("years", [[1900], [2000, 2100]])
+def test_years_outside_the_data(agros, tmp_path, years):
+    with pytest.raises(ValueError, match="between 1961 and 2019"):
+        agros.export_animation("gapminder", str(tmp_path / "chart.gif"), years=years)
+
+
+def test_years_must_be_integers(agros, tmp_path):
+    with pytest.raises(TypeError):
+        agros.export_animation("gapminder", str(tmp_path / "chart.gif"), years=["2000"])
+
+
+def test_save_without_frames(tmp_path):
+    with pytest.raises(ValueError):
+        save_animation([], str(tmp_path / "chart.gif"), "gif", [])
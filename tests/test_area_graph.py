@@ -0,0 +1,63 @@
+""" Tests of the precomputed outputs and shares of the area graph. """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agros_class import Agros
+
+OUTPUTS = ["crop_output_quantity", "animal_output_quantity", "fish_output_quantity"]
+
+
+def _country_outputs(agros, country):
+    data_df = agros.data_df[agros.data_df["Entity"] == country].sort_values("Year")
+    return data_df[["Year", "output_quantity", *OUTPUTS]].astype(float)
+
+
+def test_country_shares(agros):
+    expected = _country_outputs(agros, "Chile")
+    absolute = agros._area_df("Chile", False)
+    shares = agros._area_df("Chile", True)
+
+    np.testing.assert_allclose(absolute[OUTPUTS], expected[OUTPUTS])
+    np.testing.assert_allclose(
+        shares[OUTPUTS], expected[OUTPUTS].div(expected["output_quantity"], axis=0)
+    )
+    np.testing.assert_allclose(shares["Year"], expected["Year"])
+
+
+@pytest.mark.parametrize("region", ["World", None, "Asia"])
+def test_region_totals(agros, region):
+    members = agros.list_countries()
+    if region == "Asia":
+        membership_df = agros.membership
+        members = membership_df.loc[membership_df["Group"] == "Asia", "Entity"]
+    data_df = agros.data_df[agros.data_df["Entity"].isin(members)]
+    totals = data_df.astype({x: float for x in OUTPUTS}).groupby("Year")[OUTPUTS].sum()
+
+    absolute = agros._area_df(region, False)
+    shares = agros._area_df(region, True)
+    np.testing.assert_allclose(absolute[OUTPUTS], totals, rtol=1e-6)
+    np.testing.assert_allclose(
+        shares[OUTPUTS].sum(axis=1),
+        totals.sum(axis=1) / absolute["output_quantity"].to_numpy(),
+        rtol=1e-6,
+    )
+
+
+def test_store_shares_match_memory(agros):
+    stored = Agros()
+    stored.download_data(chunksize=1000)
+    for country in ("Chile", "World"):
+        pd.testing.assert_frame_equal(
+            stored._area_df(country, True).reset_index(drop=True),
+            agros._area_df(country, True).reset_index(drop=True),
+            check_dtype=False,
+        )
+
+
+def test_invalid_area_graphs(agros):
+    with pytest.raises(ValueError):
+        agros._area_df("Atlantis", True)
+    with pytest.raises(TypeError):
+        agros.render("area_graph", "Chile", "yes")
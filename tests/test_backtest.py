@@ -0,0 +1,108 @@
+""" Tests of the rolling-origin backtests of the forecasts. """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agros_forecast import (
+    backtest_countries,
+    backtest_metrics,
+    fit_arima,
+    statespace_backtest,
+)
+from agros_statespace import fit_statespace
+
+
+def _series(agros, country):
+    country_df = agros.data_df[agros.data_df["Entity"] == country]
+    return country_df.set_index("Year")["tfp"].astype(float).sort_index()
+
+
+def test_metrics_by_hand():
+    backtest_df = pd.DataFrame(
+        {
+            "Entity": ["Peru", "Chile", "Chile"],
+            "Cutoff": [2000, 2000, 2001],
+            "Year": [2000, 2000, 2001],
+            "tfp": [0.0, 100.0, 50.0],
+            "tfp_predicted": [1.0, 110.0, 45.0],
+        }
+    )
+    metrics_df = backtest_metrics(backtest_df)
+    assert metrics_df.index.tolist() == ["Chile", "Peru"]
+    assert metrics_df.loc["Chile", "n_forecasts"] == 2
+    assert metrics_df.loc["Chile", "mae"] == pytest.approx(7.5)
+    assert metrics_df.loc["Chile", "rmse"] == pytest.approx(np.sqrt(62.5))
+    assert metrics_df.loc["Chile", "mape"] == pytest.approx(10.0)
+    assert np.isnan(metrics_df.loc["Peru", "mape"])
+
+
+@pytest.mark.parametrize("mode", ["search", "refit", "update"])
+def test_first_cutoff_matches_a_fresh_fit(agros, mode):
+    series = _series(agros, "Chile")
+    backtest_df, failures = backtest_countries(
+        {"Chile": series}, [2015, 2016, 2017], horizon=2, mode=mode, workers=1
+    )
+    first = backtest_df[backtest_df["Cutoff"] == 2015]
+    expected = fit_arima(series[series.index < 2015].to_numpy()).predict(2)
+
+    assert failures == {}
+    assert len(backtest_df) == 6
+    np.testing.assert_allclose(first["tfp_predicted"], expected)
+    np.testing.assert_allclose(first["tfp"], series.loc[[2015, 2016]])
+
+
+def test_horizon_is_cut_at_the_last_year(agros):
+    backtest_df, _ = backtest_countries(
+        {"Chile": _series(agros, "Chile")}, [2018, 2019], horizon=3, workers=1
+    )
+    assert backtest_df[["Cutoff", "Year"]].values.tolist() == [
+        [2018, 2018],
+        [2018, 2019],
+        [2019, 2019],
+    ]
+    with pytest.raises(ValueError):
+        backtest_countries({}, [2018], mode="rolling")
+
+
+def test_statespace_backtest_matches_a_fresh_fit(agros):
+    series_dict = {x: _series(agros, x) for x in ("Chile", "Peru")}
+    backtest_df, _ = statespace_backtest(series_dict, [2010, 2011], horizon=2)
+    train = np.array([x[x.index < 2011].to_numpy() for x in series_dict.values()])
+    mean = fit_statespace(train).forecast(2)[0]
+
+    second = backtest_df[backtest_df["Cutoff"] == 2011]
+    assert second["Entity"].tolist() == ["Chile", "Chile", "Peru", "Peru"]
+    np.testing.assert_allclose(second["tfp_predicted"], mean.ravel())
+
+
+def test_agros_backtest(agros):
+    metrics_df, backtest_df = agros.backtest(
+        ["Chile", "Peru"], start=2017, end=2019, engine="statespace"
+    )
+    assert metrics_df["n_forecasts"].tolist() == [3, 3]
+    assert set(backtest_df["Year"]) == {2017, 2018, 2019}
+    with pytest.raises(ValueError):
+        agros.backtest(["Atlantis"])
+    with pytest.raises(ValueError):
+        agros.backtest(["Chile"], start=2019, end=2017)
+    with pytest.raises(TypeError):
+        agros.backtest(["Chile"], start="2017")
+
+
+@pytest.mark.parametrize("engine", ["arima", "statespace"])
+def test_short_series_are_failures(agros, engine):
+    series_dict = {"Chile": _series(agros, "Chile"), "Peru": _series(agros, "Peru")}
+    series_dict["Peru"] = series_dict["Peru"].loc[2012:]
+    if engine == "statespace":
+        backtest_df, failures = statespace_backtest(series_dict, [2018, 2019])
+    else:
+        backtest_df, failures = backtest_countries(series_dict, [2018, 2019], workers=1)
+    assert set(backtest_df["Entity"]) == {"Chile"}
+    assert list(failures) == ["Peru"]
+    assert "fewer than 10 years" in failures["Peru"]
+
+
+def test_statespace_backtest_rejects_modes(agros):
+    with pytest.raises(ValueError):
+        agros.backtest(["Chile"], start=2018, engine="statespace", mode="update")
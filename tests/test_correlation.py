@@ -0,0 +1,85 @@
+""" Tests of the incremental correlation engine against pandas. """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agros_correlation import CorrelationEngine
+
+COLUMNS = ["a", "b", "c", "d"]
+
+
+@pytest.fixture
+def data_df():
+    """Correlated columns with gaps in different rows and a group column."""
+    rng = np.random.default_rng(1)
+    base = rng.normal(size=(600, 1))
+    values = base + rng.normal(scale=[0.2, 0.5, 1.0, 3.0], size=(600, 4))
+    values[:, 3] = np.exp(values[:, 3])
+    data_df = pd.DataFrame(values, columns=COLUMNS)
+    data_df.loc[rng.random(600) < 0.1, "a"] = np.nan
+    data_df.loc[rng.random(600) < 0.2, "c"] = np.nan
+    data_df["group"] = rng.integers(0, 6, 600)
+    return data_df
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_matches_pandas(data_df, method):
+    engine = CorrelationEngine.from_frame(data_df, COLUMNS, data_df["group"])
+    expected = data_df[COLUMNS].corr(method=method)
+    pd.testing.assert_frame_equal(getattr(engine, method)(), expected, atol=1e-10)
+    for key, group_df in data_df.groupby("group"):
+        expected = group_df[COLUMNS].corr(method=method)
+        pd.testing.assert_frame_equal(
+            getattr(engine, method)(key), expected, atol=1e-10
+        )
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_incremental_updates(data_df, method):
+    engine = CorrelationEngine(COLUMNS)
+    for start in range(0, len(data_df), 90):
+        block_df = data_df.iloc[start : start + 90]
+        engine.update(block_df[COLUMNS], block_df["group"])
+        getattr(engine, method)(0)
+    full = CorrelationEngine.from_frame(data_df, COLUMNS, data_df["group"])
+    assert engine.n_rows == len(data_df)
+    assert engine.groups() == full.groups()
+    for key in [None, *engine.groups()]:
+        pd.testing.assert_frame_equal(
+            getattr(engine, method)(key), getattr(full, method)(key), atol=1e-10
+        )
+
+
+def test_update_only_reranks_touched_groups(data_df):
+    engine = CorrelationEngine.from_frame(data_df, COLUMNS, data_df["group"])
+    before = {key: engine.spearman(key) for key in engine.groups()}
+    new_df = data_df[data_df["group"] == 2].head(5)
+    engine.update(new_df[COLUMNS], new_df["group"])
+    assert set(engine._ranks) == set(before) - {2}  # pylint: disable=protected-access
+    pd.testing.assert_frame_equal(engine.spearman(1), before[1])
+    combined_df = pd.concat([data_df[data_df["group"] == 2], new_df])
+    pd.testing.assert_frame_equal(
+        engine.spearman(2), combined_df[COLUMNS].corr("spearman"), atol=1e-10
+    )
+
+
+def test_invalid_input():
+    engine = CorrelationEngine(COLUMNS)
+    with pytest.raises(ValueError):
+        engine.update(np.zeros((3, 2)))
+    with pytest.raises(ValueError):
+        engine.update(np.zeros((3, 4)), keys=[1, 2])
+    with pytest.raises(ValueError):
+        engine.pearson("missing")
+
+
+def test_agros_correlation(agros):
+    data_df = agros.data_df
+    columns = [x for x in data_df.columns if "_quantity" in x]
+    pd.testing.assert_frame_equal(
+        agros.correlation(), data_df[columns].corr(), atol=1e-10
+    )
+    by_country = agros.correlation("spearman", by="Entity")
+    expected = data_df[data_df["Entity"] == "Chile"][columns].corr("spearman")
+    pd.testing.assert_frame_equal(by_country["Chile"], expected, atol=1e-10)
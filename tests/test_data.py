@@ -0,0 +1,129 @@
+""" Tests of the binary cache and the partitioned store of the agricultural data. """
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agros_class import Agros
+from agros_data import (
+    PartitionedStore,
+    compact_frame,
+    read_frame,
+    write_frame,
+    write_partitions,
+)
+from agros_instrument import Recorder
+from synthetic import generate_panel
+
+
+def _stages(agros):
+    recorder = Recorder()
+    agros.instrumentation.enable(recorder)
+    agros.download_data()
+    return {record["stage"] for record in recorder.records}
+
+
+def _panel_csv(tmp_path):
+    path = tmp_path / "download.csv"
+    generate_panel().to_csv(path, index=False)
+    return path
+
+
+def _is_mapped(array):
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array is not None
+
+
+def _country_frame(data_df):
+    data_df = data_df[~data_df["Entity"].isin(["World", "Asia"])]
+    return data_df.head(5 * 59).reset_index(drop=True)
+
+
+def test_cache_round_trip(tmp_path):
+    compact_df = compact_frame(_country_frame(pd.read_csv(_panel_csv(tmp_path))))
+    write_frame(compact_df, tmp_path / "cache", "old")
+    write_frame(compact_df, tmp_path / "cache", "new")
+    cached_df = read_frame(tmp_path / "cache", "new")
+
+    pd.testing.assert_frame_equal(cached_df, compact_df)
+    assert _is_mapped(cached_df["tfp"].to_numpy())
+    assert os.listdir(tmp_path / "cache") == ["new"]
+    assert read_frame(tmp_path / "cache", "old") is None
+
+
+def test_cached_load_matches_parse(data_folder):
+    parsed = Agros()
+    assert "parse csv" in _stages(parsed)
+    cached = Agros()
+    stages = _stages(cached)
+    assert "read cache" in stages and "parse csv" not in stages
+
+    plain = Agros()
+    plain.download_data(use_cache=False)
+    pd.testing.assert_frame_equal(cached.data_df, parsed.data_df)
+    pd.testing.assert_frame_equal(
+        cached.data_df.astype({"Entity": str}),
+        compact_frame(plain.data_df).astype({"Entity": str}),
+    )
+    assert cached.list_countries() == plain.list_countries()
+
+
+def test_cache_follows_the_csv(data_folder):
+    agros = Agros()
+    agros.download_data()
+    path = "downloads/download.csv"
+    data_df = pd.read_csv(path)
+    data_df.loc[data_df["Entity"] == "Chile", "tfp"] = 1.5
+    data_df.to_csv(path, index=False)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+
+    assert "parse csv" in _stages(agros)
+    assert (agros._country_df("Chile")["tfp"] == 1.5).all()
+
+
+def test_partitioned_store_reads(tmp_path):
+    compact_df = compact_frame(_country_frame(pd.read_csv(_panel_csv(tmp_path))))
+    chunks = (compact_df.iloc[x : x + 40] for x in range(0, len(compact_df), 40))
+    write_partitions(chunks, tmp_path / "store", "sig")
+    store = PartitionedStore.open(tmp_path / "store", "sig")
+    expected_df = compact_df.astype({"Entity": str})
+
+    entities = sorted(set(expected_df["Entity"]))[:2]
+    selected_df = store.read(entities=entities, years=[1970, 1971], columns=["tfp"])
+    expected = expected_df.loc[
+        expected_df["Entity"].isin(entities) & expected_df["Year"].isin([1970, 1971]),
+        ["Entity", "Year", "tfp"],
+    ].sort_values(["Entity", "Year"])
+    pd.testing.assert_frame_equal(
+        selected_df.astype({"Entity": str}),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+    assert len(store.read(entities=["Atlantis"])) == 0
+    assert sum(len(x) for x in store.iter_frames()) == len(compact_df)
+    assert store.years() == sorted(set(expected_df["Year"]))
+    with pytest.raises(ValueError):
+        write_partitions(iter([compact_df.iloc[:0]]), tmp_path / "empty", "sig")
+
+
+def test_store_matches_memory(data_folder):
+    memory = Agros()
+    memory.download_data()
+    stored = Agros()
+    stored.download_data(chunksize=500)
+
+    assert stored.store is not None
+    assert stored.list_countries() == memory.list_countries()
+    pd.testing.assert_frame_equal(
+        stored._country_df("Chile").reset_index(drop=True),
+        memory._country_df("Chile").reset_index(drop=True),
+        check_dtype=False,
+    )
+    pd.testing.assert_frame_equal(
+        stored.rolling_statistics("tfp"), memory.rolling_statistics("tfp")
+    )
+    with pytest.raises(ValueError):
+        stored.download_data(chunksize=0)
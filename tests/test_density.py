@@ -0,0 +1,84 @@
+""" Tests of the density rendering of gapminder and compare_output. """
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from agros_class import Agros
+from agros_density import density_raster
+
+
+@pytest.fixture(autouse=True)
+def no_show(monkeypatch):
+    """Closes the pyplot figures instead of showing them."""
+    monkeypatch.setattr(plt, "show", lambda: plt.close("all"))
+
+
+def test_density_raster_matches_histogram2d():
+    rng = np.random.default_rng(0)
+    x = 10 ** rng.uniform(0, 6, 10000)
+    y = 10 ** rng.uniform(2, 4, 10000)
+    x[:10] = np.nan
+    y[10:20] = -1.0
+
+    raster, extent = density_raster(x, y, bins=(40, 30))
+
+    keep = np.isfinite(x) & (y > 0)
+    expected, _, _ = np.histogram2d(
+        np.log10(y[keep]),
+        np.log10(x[keep]),
+        bins=(30, 40),
+        range=[extent[2:], extent[:2]],
+    )
+    assert raster.sum() == keep.sum()
+    np.testing.assert_array_equal(raster, expected)
+
+
+def test_density_raster_without_points():
+    raster, _ = density_raster([np.nan, -1.0], [1.0, 2.0], bins=(4, 3))
+    assert raster.shape == (3, 4)
+    assert raster.sum() == 0
+
+
+@pytest.mark.parametrize("aggregate", [False, True, None])
+def test_compare_output_pyplot(agros, aggregate):
+    agros.compare_output("Chile", "Spain", aggregate=aggregate)
+    agros.compare_output("Chile", "World", aggregate=aggregate)
+
+
+def test_compare_output_invalid_country(agros):
+    with pytest.raises(ValueError):
+        agros.compare_output("Chile", "Atlantis")
+    assert not plt.get_fignums()
+
+
+def test_render_compare_output_modes(agros):
+    lines = agros.render("compare_output", "Chile", "Spain")
+    density = agros.render("compare_output", "Chile", "Spain", aggregate=True)
+    assert lines == agros.render("compare_output", "Chile", "Spain", aggregate=False)
+    assert lines != density
+    assert len(agros.render_cache) == 3
+
+
+def test_compare_output_switches_to_density(agros, monkeypatch):
+    countries = agros.list_countries()
+    monkeypatch.setattr(agros, "_DENSITY_POINTS", 10)
+    assert agros.render("compare_output", *countries) == agros.render(
+        "compare_output", *countries, aggregate=True
+    )
+
+
+@pytest.mark.parametrize("aggregate", [False, True])
+def test_gapminder_modes(agros, aggregate):
+    agros.gapminder(2000, aggregate=aggregate)
+    assert agros.render("gapminder", 2000, aggregate=aggregate).startswith(b"\x89PNG")
+
+
+def test_density_over_a_store(agros):
+    countries = [*agros.list_countries(), "World"]
+    expected = agros.render("compare_output", *countries, aggregate=True)
+    stored = Agros()
+    stored.download_data(chunksize=500)
+    image = stored.render("compare_output", *countries, aggregate=True)
+    assert image == expected
+    assert stored._panel is None
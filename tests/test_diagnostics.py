@@ -0,0 +1,99 @@
+""" Tests of the batched time series diagnostics against pandas and statsmodels. """
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.tsa.stattools import adfuller, kpss
+
+from agros_diagnostics import adf_test, kpss_test, rolling_statistics
+
+# newer statsmodels announce a result object for adfuller
+pytestmark = pytest.mark.filterwarnings("ignore::FutureWarning")
+
+
+@pytest.fixture
+def matrix():
+    """Random walks, trends and noise of different lengths, some with gaps."""
+    generator = np.random.default_rng(11)
+    n_years = 59
+    rows = [
+        np.cumsum(generator.normal(size=n_years)),
+        generator.normal(size=n_years),
+        np.linspace(50, 120, n_years) + generator.normal(size=n_years),
+        100 + np.cumsum(generator.normal(0.5, 2, size=n_years)),
+    ]
+    matrix = np.array(rows * 3)
+    matrix[4:8, :15] = np.nan
+    matrix[8:, 30] = np.nan
+    return matrix
+
+
+def test_rolling_statistics_match_pandas(matrix):
+    mean, std = rolling_statistics(matrix, window=12)
+    frame = pd.DataFrame(matrix.T)
+    np.testing.assert_allclose(mean, frame.rolling(12).mean().to_numpy().T)
+    np.testing.assert_allclose(std, frame.rolling(12).std().to_numpy().T, atol=1e-9)
+
+
+def test_rolling_statistics_reject_short_windows(matrix):
+    with pytest.raises(ValueError):
+        rolling_statistics(matrix, window=1)
+
+
+def test_adf_matches_statsmodels(matrix):
+    result = adf_test(matrix)
+    for row, values in enumerate(matrix):
+        stat, pvalue, lags, nobs, *_ = adfuller(
+            values[~np.isnan(values)], regression="c", autolag="AIC"
+        )
+        assert result["stat"][row] == pytest.approx(stat, rel=1e-6)
+        assert result["pvalue"][row] == pytest.approx(pvalue, rel=1e-6)
+        assert result["lags"][row] == lags
+        assert result["nobs"][row] == nobs
+
+
+def test_kpss_matches_statsmodels(matrix):
+    result = kpss_test(matrix)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for row, values in enumerate(matrix):
+            stat, pvalue, lags, _ = kpss(
+                values[~np.isnan(values)], regression="c", nlags="auto"
+            )
+            assert result["stat"][row] == pytest.approx(stat, rel=1e-6)
+            assert result["pvalue"][row] == pytest.approx(pvalue)
+            assert result["lags"][row] == lags
+
+
+def test_short_rows_have_no_statistics():
+    matrix = np.full((2, 20), np.nan)
+    matrix[0] = np.arange(20.0) ** 1.5
+    matrix[1, -2:] = [1.0, 2.0]
+    assert np.isnan(adf_test(matrix)["stat"][1])
+    assert np.isnan(kpss_test(matrix)["stat"][1])
+    assert np.isfinite(kpss_test(matrix)["stat"][0])
+
+
+def test_agros_rolling_statistics(agros):
+    rolling_df = agros.rolling_statistics("tfp", window=12)
+    chile = agros.data_df[agros.data_df["Entity"] == "Chile"].sort_values("Year")
+    expected = chile["tfp"].rolling(12).mean().to_numpy()
+    actual = rolling_df.loc[rolling_df["Entity"] == "Chile", "rolling_mean"]
+    np.testing.assert_allclose(actual.to_numpy(), expected)
+    assert "World" not in set(rolling_df["Entity"])
+
+
+def test_agros_stationarity(agros):
+    stationarity_df = agros.stationarity("tfp")
+    stat = adfuller(
+        agros.data_df.loc[agros.data_df["Entity"] == "Chile"]
+        .sort_values("Year")["tfp"]
+        .to_numpy(),
+        autolag="AIC",
+    )[0]
+    assert stationarity_df.loc["Chile", "adf_stat"] == pytest.approx(stat, rel=1e-6)
+    assert stationarity_df["stationary"].dtype == bool
+    with pytest.raises(ValueError):
+        agros.stationarity("Year")
@@ -0,0 +1,157 @@
+""" Tests of the resumable download against a local HTTP server. """
+
+import http.server
+import json
+import threading
+
+import pytest
+
+from agros_download import fetch, make_session
+
+CONTENT = bytes(range(256)) * 400
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serves the file of the server with ETags, ranges and If-Range."""
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        server.requests.append(dict(self.headers))
+        content, etag = server.content, server.etag
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        byte_range = self.headers.get("Range")
+        if byte_range and self.headers.get("If-Range") == etag:
+            start = int(byte_range.split("=")[1].rstrip("-"))
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}"
+            )
+        else:
+            self.send_response(200)
+        body = content[start:]
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if server.truncate:
+            # send half of the body and drop the connection
+            server.truncate -= 1
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    """A local server of CONTENT, with its requests and options as attributes."""
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.content, httpd.etag, httpd.truncate, httpd.requests = CONTENT, '"v1"', 0, []
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/data.csv"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def session():
+    """A session without waiting between retries."""
+    return make_session(backoff_factor=0)
+
+
+def _write_part(path, content, etag):
+    (path.parent / (path.name + ".part")).write_bytes(content)
+    (path.parent / (path.name + ".part.json")).write_text(
+        json.dumps({"etag": etag, "last_modified": None})
+    )
+
+
+def test_download(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    assert fetch(server.url, str(path), session=session)
+    assert path.read_bytes() == CONTENT
+    assert not (tmp_path / "data.csv.part").exists()
+    assert not (tmp_path / "data.csv.part.json").exists()
+
+    # an existing file isn't requested again without refresh
+    assert not fetch(server.url, str(path), session=session)
+    assert len(server.requests) == 1
+
+
+def test_refresh_unchanged_is_not_modified(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    fetch(server.url, str(path), session=session)
+    assert not fetch(server.url, str(path), session=session, refresh=True)
+    assert server.requests[-1]["If-None-Match"] == '"v1"'
+    assert path.read_bytes() == CONTENT
+
+
+def test_refresh_changed(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    fetch(server.url, str(path), session=session)
+    server.content, server.etag = CONTENT[::-1], '"v2"'
+    assert fetch(server.url, str(path), session=session, refresh=True)
+    assert path.read_bytes() == CONTENT[::-1]
+
+
+def test_resume_partial_download(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    _write_part(path, CONTENT[:1000], '"v1"')
+    assert fetch(server.url, str(path), session=session)
+    assert server.requests[0]["Range"] == "bytes=1000-"
+    assert path.read_bytes() == CONTENT
+
+
+def test_resume_of_other_version_starts_over(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    _write_part(path, CONTENT[:1000], '"v0"')
+    assert fetch(server.url, str(path), session=session)
+    assert path.read_bytes() == CONTENT
+
+
+def test_resume_after_truncated_response(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    server.truncate = 1
+    assert fetch(server.url, str(path), session=session, chunk_size=1024)
+    assert "Range" in server.requests[1]
+    assert path.read_bytes() == CONTENT
+
+
+def test_truncated_responses_give_up(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    server.truncate = 3
+    with pytest.raises(Exception):
+        fetch(server.url, str(path), session=session, attempts=3)
+    assert not path.exists()
+
+
+def test_complete_part_is_renamed_after_416(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    _write_part(path, CONTENT, '"v1"')
+    assert fetch(server.url, str(path), session=session)
+    assert path.read_bytes() == CONTENT
+    assert not (tmp_path / "data.csv.part").exists()
+    assert len(server.requests) == 1
+
+
+def test_corrupt_part_is_downloaded_again(server, session, tmp_path):
+    path = tmp_path / "data.csv"
+    _write_part(path, CONTENT + b"garbage", '"v1"')
+    assert fetch(server.url, str(path), session=session)
+    assert path.read_bytes() == CONTENT
+    assert "Range" not in server.requests[-1]
@@ -0,0 +1,32 @@
+""" Tests of the ARIMA forecasts of the Agros class. """
+
+import numpy as np
+import pytest
+from pmdarima.arima import ARIMA
+
+
+def test_predictor_skips_summary(agros, monkeypatch):
+    def summary(_):
+        raise AssertionError("the summary of the fit is not used")
+
+    monkeypatch.setattr(ARIMA, "summary", summary)
+    countries, data_list, prediction_list = agros._predict(["Chile", "Atlantis"])
+    assert countries == ["Chile"]
+    assert len(data_list[0]) == agros.data_df["Year"].nunique()
+    assert len(prediction_list[0]) == 30
+
+
+def test_forecast_matches_predictor(agros):
+    _, _, (prediction,) = agros._predict(["Chile"])
+    forecast = agros.forecast(["Chile", "Spain"], workers=1)
+    chile = forecast[forecast["Entity"] == "Chile"]
+    assert set(forecast["Entity"]) == {"Chile", "Spain"}
+    assert chile["Year"].tolist() == list(range(2020, 2050))
+    np.testing.assert_allclose(chile["tfp"], prediction[0])
+    assert (chile["tfp_lower"] <= chile["tfp"]).all()
+    assert (chile["tfp"] <= chile["tfp_upper"]).all()
+
+
+def test_predictor_limits_countries(agros):
+    with pytest.raises(ValueError):
+        agros._predict(["Chile", "Spain", "Peru", "Kenya"])
@@ -0,0 +1,118 @@
+""" Tests of the geometry store of the country polygons. """
+
+import numpy as np
+import pytest
+import shapely
+
+from agros_geometry import (
+    CONTINENT_BOUNDS,
+    GeometryStore,
+    name_key,
+    read_geometry,
+    write_geometry,
+)
+
+
+@pytest.fixture
+def store():
+    """Countries as squares, France with French Guiana and Russia across 180 degrees."""
+    return GeometryStore(
+        ["France", "Spain", "Russia", "Dem. Rep. Congo", "United States of America"],
+        ["FRA", "ESP", "RUS", "COD", "USA"],
+        ["Europe", "Europe", "Europe", "Africa", "North America"],
+        [
+            shapely.union(shapely.box(-5, 42, 8, 51), shapely.box(-54, 2, -51, 6)),
+            shapely.box(-9, 36, 3, 43),
+            shapely.union(
+                shapely.box(27, 41, 180, 82), shapely.box(-180, 64, -169, 72)
+            ),
+            shapely.box(12, -13, 31, 5),
+            shapely.box(-125, 25, -67, 49),
+        ],
+        aliases={"United States of America": "United States"},
+    )
+
+
+def test_name_key():
+    assert name_key("Dem. Rep. Congo") == name_key("Democratic Republic of Congo")
+    assert name_key("Côte d'Ivoire") == name_key("Cote d Ivoire")
+    assert name_key("Bosnia and Herz.") == name_key("Bosnia and Herzegovina")
+
+
+def test_resolve_and_match(store):
+    assert store.resolve("USA") == "United States"
+    assert store.resolve("united states of america") == "United States"
+    assert store.resolve("Democratic Republic of Congo") == "Dem. Rep. Congo"
+    assert store.resolve("Atlantis") is None
+    matched = store.match(["Spain", "Democratic Republic of Congo", "United States"])
+    assert matched.tolist() == [
+        None,
+        "Spain",
+        None,
+        "Democratic Republic of Congo",
+        "United States",
+    ]
+
+
+def test_locate_and_query(store):
+    names = store.locate([0, -52, 20, 100], [45, 4, -5, -40])
+    assert names.tolist() == ["France", "France", "Dem. Rep. Congo", None]
+    assert store.query((-10, 35, 0, 40)).tolist() == [1]
+
+
+def test_country_bounds_are_the_mainland(store):
+    assert store.region_bounds("France") == (-5.0, 42.0, 8.0, 51.0)
+    assert store.region_bounds("FRA") == (-5.0, 42.0, 8.0, 51.0)
+    assert store.region_bounds("Russia") == (27.0, 41.0, 180.0, 82.0)
+    np.testing.assert_array_equal(store.bounds[0], [-54, 2, 8, 51])
+
+
+def test_continent_bounds(store):
+    assert store.region_bounds("Europe") == CONTINENT_BOUNDS["europe"]
+    assert store.region_bounds("north america") == CONTINENT_BOUNDS["north america"]
+    assert store.region_bounds((0, 1, 2, 3)) == (0.0, 1.0, 2.0, 3.0)
+    with pytest.raises(ValueError):
+        store.region_bounds("Atlantis")
+    with pytest.raises(ValueError):
+        store.region_bounds((0, 1, 2))
+
+
+def test_cache_roundtrip(store, tmp_path):
+    write_geometry(store, str(tmp_path), "abc")
+    assert read_geometry(str(tmp_path), "other") is None
+    cached = read_geometry(
+        str(tmp_path), "abc", aliases={"United States of America": "United States"}
+    )
+    assert cached.names.tolist() == store.names.tolist()
+    assert shapely.equals(cached.geometries, store.geometries).all()
+    assert read_geometry(str(tmp_path)).names.tolist()[:2] == ["France", "Spain"]
+
+
+def test_choropleth_crop(agros, store):
+    agros.geometry = store
+    # pylint: disable-next=protected-access
+    geometry_df = agros._choropleth_geometry(None, "Europe")
+    assert sorted(geometry_df["name"]) == ["France", "Spain"]
+    assert agros.render("choropleth", 2000, None, "Europe").startswith(b"\x89PNG")
+
+
+def test_choropleth_polygons_are_prepared_once(agros, store):
+    # pylint: disable=protected-access
+    agros.geometry = store
+    geometry_df = agros._choropleth_geometry()
+    assert sorted(geometry_df["name"]) == [
+        "Democratic Republic of Congo",
+        "France",
+        "Spain",
+        "United States",
+    ]
+    agros.render("choropleth", 2000)
+    agros.render("choropleth", 2001)
+    assert agros._choropleth_geometry() is geometry_df
+    simplified = agros._choropleth_geometry(0.5)
+    assert agros._choropleth_geometry(0.5) is simplified
+
+    agros.geometry = GeometryStore(
+        ["Spain"], ["ESP"], ["Europe"], [shapely.box(-9, 36, 3, 43)]
+    )
+    assert agros._choropleth_geometry()["name"].tolist() == ["Spain"]
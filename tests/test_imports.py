@@ -0,0 +1,49 @@
+""" Tests that the heavy dependencies are only imported when they are used. """
+
+import os
+import subprocess
+import sys
+
+PYTHON_FILES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python_files"
+)
+HEAVY_MODULES = ["geopandas", "seaborn", "matplotlib", "requests", "pmdarima"]
+
+
+def _imported(code: str):
+    """Runs code in a fresh interpreter and returns the heavy modules it imported."""
+    check = f"import sys\nprint(sorted(x for x in {HEAVY_MODULES} if x in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", f"{code}\n{check}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": PYTHON_FILES},
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_import_is_light():
+    assert _imported("import agros_class, agros_service, agros_report") == "[]"
+
+
+def test_queries_are_light(data_folder):
+    code = (
+        "from agros_class import Agros\n"
+        "agros = Agros()\n"
+        "agros.download_data()\n"
+        "agros.list_countries()\n"
+        "agros.region_aggregates(['World'])\n"
+        "agros.stationarity()"
+    )
+    assert _imported(code) == "[]"
+
+
+def test_rendering_imports_matplotlib_only(data_folder):
+    code = (
+        "from agros_class import Agros\n"
+        "agros = Agros()\n"
+        "agros.download_data()\n"
+        "agros.render('area_graph', 'World', False)"
+    )
+    assert _imported(code) == "['matplotlib']"
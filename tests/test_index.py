@@ -0,0 +1,30 @@
+""" Tests of the index of the rows of each country. """
+
+import pandas as pd
+
+from agros_class import Agros
+
+
+def _selected(data_df, country):
+    return data_df[data_df["Entity"] == country].sort_values("Year")
+
+
+def test_country_rows_match_a_scan(agros):
+    for country in ("Algeria", "Chile", "Vietnam"):
+        pd.testing.assert_frame_equal(
+            agros._country_df(country), _selected(agros.data_df, country)
+        )
+    assert agros.list_countries() == sorted(agros.list_countries())
+    assert not agros._is_country("World")
+
+
+def test_replaced_data_is_indexed_again(data_folder):
+    agros = Agros()
+    agros.download_data(use_cache=False)
+    shuffled = agros.data_df.sample(frac=1, random_state=5)
+    agros.data_df = shuffled[shuffled["Entity"] != "Chile"]
+
+    assert not agros._is_country("Chile")
+    pd.testing.assert_frame_equal(
+        agros._country_df("Peru"), _selected(shuffled, "Peru")
+    )
@@ -0,0 +1,96 @@
+""" Tests of the instrumentation of the Agros methods. """
+
+import logging
+
+import numpy as np
+
+import agros_class
+from agros_forecast import statespace_backtest
+from agros_instrument import CounterRegistry, LoggingHook, Recorder
+
+
+def _without_tfp(agros, country):
+    agros.data_df = agros.data_df.assign(
+        tfp=agros.data_df["tfp"].where(agros.data_df["Entity"] != country)
+    )
+
+
+def test_disabled_by_default(agros):
+    recorder = Recorder()
+    agros.list_countries()
+    assert not agros.instrumentation.enabled
+    agros.instrumentation.enable(recorder)
+    agros.instrumentation.disable()
+    agros.render("gapminder", 2000)
+    assert recorder.records == []
+
+
+def test_stages_are_recorded(agros):
+    recorder, counters = Recorder(), CounterRegistry()
+    agros.instrumentation.enable(recorder, counters)
+    agros.render("gapminder", 2000)
+    agros.render("gapminder", 2000)
+    stages = recorder.to_frame()
+    assert (stages["method"] == "gapminder").any()
+    assert stages["seconds"].ge(0).all()
+    assert counters.value("stage_calls_total", method="gapminder", stage="render") == 2
+
+
+def test_forecast_failures_are_notices(agros, capsys):
+    recorder = Recorder()
+    agros.instrumentation.enable(recorder)
+    _without_tfp(agros, "Chile")
+    forecast_df = agros.forecast(["Chile", "Spain"], engine="statespace")
+    assert set(forecast_df["Entity"]) == {"Spain"}
+    notices = [x for x in recorder.records if x["stage"] == "notice"]
+    assert notices == [
+        {
+            "method": "forecast",
+            "stage": "notice",
+            "message": "No forecast for countries: Chile",
+        }
+    ]
+    assert capsys.readouterr().out == ""
+
+
+def test_backtest_failures_are_notices(agros, capsys, monkeypatch):
+    def failing_backtest(series_dict, cutoffs, horizon=1, **_):
+        backtest_df, _ = statespace_backtest(series_dict, cutoffs, horizon=horizon)
+        return backtest_df, {"Chile": "ValueError: no fit"}
+
+    monkeypatch.setattr(agros_class, "backtest_countries", failing_backtest)
+    recorder = Recorder()
+    agros.instrumentation.enable(recorder)
+    agros.backtest(["Chile", "Spain"], start=2015, end=2016)
+    messages = [x["message"] for x in recorder.records if x["stage"] == "notice"]
+    assert messages == ["No backtest for countries: Chile"]
+    assert capsys.readouterr().out == ""
+
+
+def test_predictor_notice(agros):
+    recorder = Recorder()
+    agros.instrumentation.enable(recorder)
+    agros.model_store = None
+    agros.render("predictor", ["Spain", "Atlantis"])
+    messages = [x["message"] for x in recorder.records if x["stage"] == "notice"]
+    assert messages == ["Ignoring invalid countries: Atlantis"]
+    assert np.isfinite(agros.panel.take("tfp", ["Spain"], [2000])).all()
+
+
+def test_notices_are_logged_while_disabled(agros, caplog):
+    _without_tfp(agros, "Chile")
+    with caplog.at_level(logging.WARNING, logger="agros"):
+        agros.forecast(["Chile", "Spain"], engine="statespace")
+        agros.render("predictor", ["Spain", "Atlantis"])
+    assert [x.getMessage() for x in caplog.records] == [
+        "forecast: No forecast for countries: Chile",
+        "predictor: Ignoring invalid countries: Atlantis",
+    ]
+
+
+def test_logging_hook_logs_notices_once(agros, caplog):
+    agros.instrumentation.enable(LoggingHook())
+    with caplog.at_level(logging.WARNING, logger="agros"):
+        agros.render("predictor", ["Spain", "Atlantis"])
+    notices = [x for x in caplog.records if x.levelno == logging.WARNING]
+    assert len(notices) == 1
@@ -0,0 +1,98 @@
+""" Tests of the on-disk store of the fitted ARIMA models. """
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agros_model_store import ModelStore
+
+
+class _Model:
+    """A stand-in of a fitted ARIMA model with an order and parameters."""
+
+    def __init__(self, order=(1, 1, 0)):
+        self.order = order
+
+    def params(self):
+        return np.array([0.5, 1.0])
+
+
+def _series(shift=0.0):
+    return pd.Series(np.arange(10.0) + shift, index=range(2000, 2010))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ModelStore(str(tmp_path / "models"))
+
+
+def test_default_store_is_opt_in_under_downloads(agros):
+    assert agros.model_store is None
+    assert ModelStore().directory == os.path.join("downloads", "models")
+
+
+def test_fingerprint_depends_on_years_and_values():
+    fingerprint = ModelStore.fingerprint(_series())
+    assert fingerprint == ModelStore.fingerprint(_series())
+    assert fingerprint != ModelStore.fingerprint(_series(0.5))
+    shifted = pd.Series(np.arange(10.0), index=range(2001, 2011))
+    assert fingerprint != ModelStore.fingerprint(shifted)
+
+
+def test_save_and_load(store):
+    fingerprint = ModelStore.fingerprint(_series())
+    assert store.load("Niger", fingerprint) is None
+    store.save("Niger", fingerprint, _Model((2, 1, 0)))
+    assert store.load("Niger", fingerprint).order == (2, 1, 0)
+    assert store.load("Niger", ModelStore.fingerprint(_series(1))) is None
+    assert store.latest("Niger")["order"] == (2, 1, 0)
+
+
+def test_invalidate_matches_the_exact_country(store):
+    fingerprint = ModelStore.fingerprint(_series())
+    for country in ("Niger", "Nigeria", "Korea, Rep.", "Korea Rep"):
+        store.save(country, fingerprint, _Model())
+
+    assert store.invalidate("Niger") == 1
+    assert store.load("Nigeria", fingerprint) is not None
+    assert store.invalidate("Korea Rep") == 1
+    assert store.load("Korea, Rep.", fingerprint) is not None
+    assert store.latest("Korea Rep") is None
+    assert store.invalidate() == 2
+
+
+def test_latest_skips_evicted_entries(store, monkeypatch):
+    store.save("Chile", ModelStore.fingerprint(_series()), _Model((1, 1, 0)))
+    store.save("Chile", ModelStore.fingerprint(_series(1)), _Model((0, 1, 1)))
+    paths = store._entries("Chile")  # pylint: disable=protected-access
+    getmtime = os.path.getmtime
+
+    def evicting_getmtime(path):
+        # another process evicts the first entry between listing and sorting
+        if path == paths[0]:
+            os.remove(path)
+        return getmtime(path)
+
+    monkeypatch.setattr(os.path, "getmtime", evicting_getmtime)
+    assert store.latest("Chile") is not None
+
+
+def test_evict_by_number_and_age(store):
+    for shift in range(4):
+        store.save("Chile", ModelStore.fingerprint(_series(shift)), _Model())
+    store.max_entries = 2
+    assert store.evict() == 2
+    assert len(store._entries()) == 2  # pylint: disable=protected-access
+    store.max_age = -1
+    assert store.evict() == 2
+
+
+def test_forecast_reuses_stored_models(agros):
+    agros.model_store = ModelStore()
+    first_df = agros.forecast(["Spain"], workers=1)
+    entries = agros.model_store._entries("Spain")  # pylint: disable=protected-access
+    assert len(entries) == 1
+    assert entries[0].startswith(os.path.join("downloads", "models"))
+    pd.testing.assert_frame_equal(first_df, agros.forecast(["Spain"], workers=1))
@@ -0,0 +1,91 @@
+""" Tests of the compact entity by year panel. """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agros_panel import Panel
+
+DATA_DF = pd.DataFrame(
+    {
+        "Entity": ["Peru", "Chile", "Chile", "Peru", "Chile"],
+        "Year": [2001, 2000, 2001, 2000, 2003],
+        "tfp": [4.0, 1.0, 2.0, 3.0, 5.0],
+        "output_quantity": [40.0, 10.0, 20.0, 30.0, np.nan],
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "entity", [DATA_DF["Entity"], DATA_DF["Entity"].astype("category")]
+)
+def test_panel_matches_a_pivot(entity):
+    panel = Panel.from_frame(DATA_DF.assign(Entity=entity), dtype=np.float64)
+    pivot = DATA_DF.pivot(index="Entity", columns="Year", values="tfp")
+
+    assert panel.entities.tolist() == ["Chile", "Peru"]
+    assert panel.years.tolist() == [2000, 2001, 2003]
+    np.testing.assert_array_equal(panel.matrix("tfp"), pivot.to_numpy())
+    np.testing.assert_array_equal(panel.series("Peru", "tfp"), [3.0, 4.0, np.nan])
+    np.testing.assert_array_equal(panel.cross_section(2003, "tfp"), [5.0, np.nan])
+    assert panel.series("Chile").shape == (2, 3)
+
+
+def test_views_share_the_read_only_block():
+    panel = Panel.from_frame(DATA_DF)
+    assert panel.blocks.dtype == np.float32
+    assert np.shares_memory(panel.series("Chile", "tfp"), panel.blocks)
+    assert np.shares_memory(panel.cross_section(2000), panel.blocks)
+    with pytest.raises(ValueError):
+        panel.matrix("tfp")[0, 0] = 0
+    with pytest.raises(AttributeError):
+        panel.extra = 1
+
+
+def test_take_fills_missing_labels():
+    panel = Panel.from_frame(DATA_DF)
+    values = panel.take("output_quantity", ["Peru", "Atlantis"], [2001, 1999, 2003])
+    assert values.dtype == np.float64
+    np.testing.assert_array_equal(
+        values, [[40.0, np.nan, np.nan], [np.nan, np.nan, np.nan]]
+    )
+
+
+def test_from_frames_matches_from_frame():
+    panel = Panel.from_frame(DATA_DF)
+    chunks = Panel.from_frames(
+        [DATA_DF.iloc[:2], DATA_DF.iloc[2:]],
+        panel.entities,
+        panel.years,
+        panel.metrics,
+    )
+    np.testing.assert_array_equal(chunks.blocks, panel.blocks)
+
+
+def test_unknown_labels_raise():
+    panel = Panel.from_frame(DATA_DF)
+    for call in (
+        lambda: panel.series("Atlantis"),
+        lambda: panel.cross_section(1999),
+        lambda: panel.matrix("yield"),
+        lambda: Panel(["Chile"], [2000], ["tfp"], np.zeros((1, 2, 1))),
+    ):
+        with pytest.raises(ValueError):
+            call()
+
+
+def test_agros_panel_matches_the_data(agros):
+    panel = agros.panel
+    chile = agros.data_df[agros.data_df["Entity"] == "Chile"].sort_values("Year")
+    np.testing.assert_array_equal(panel.series("Chile", "tfp"), chile["tfp"])
+    assert panel.entities.tolist() == agros.list_countries()
+
+
+def test_agros_panel_is_built_on_first_use(agros):
+    assert agros._panel is None
+    agros.region_aggregates()
+    assert agros._panel is None
+    assert agros.panel.metrics == [
+        x for x in agros.data_df.columns if x not in ("Entity", "Year")
+    ]
+    assert agros.panel is agros.panel
@@ -0,0 +1,111 @@
+""" Tests of the regional aggregates computed from the membership table. """
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agros_class import Agros
+from agros_instrument import Recorder
+from agros_regions import WORLD, AggregateEngine, read_membership
+
+MEMBERSHIP_DF = pd.DataFrame(
+    {
+        "Entity": ["Chile", "Peru", "Cote d'Ivoire"],
+        "Group": ["South America", "South America", "West Africa"],
+        "Kind": ["region", "region", "region"],
+    }
+)
+
+
+def _engine(matrices):
+    engine = AggregateEngine(
+        MEMBERSHIP_DF,
+        ["Chile", "Côte d'Ivoire", "Peru"],
+        [2000, 2001],
+        totals=["output"],
+        means={"tfp": "output"},
+    )
+    engine.load(matrices)
+    return engine
+
+
+def _matrices(peru_tfp=np.nan):
+    return {
+        "output": np.array([[1.0, 2.0], [3.0, np.nan], [4.0, 4.0]]),
+        "tfp": np.array([[100.0, 110.0], [50.0, 60.0], [200.0, peru_tfp]]),
+    }
+
+
+def test_engine_totals_and_weighted_means():
+    engine = _engine(_matrices())
+    assert engine.groups == [WORLD, "South America", "West Africa"]
+    world = engine.frame(WORLD)
+    america = engine.frame("South America")
+
+    np.testing.assert_allclose(world["output"], [8.0, 6.0])
+    np.testing.assert_allclose(america["tfp"], [(100 + 4 * 200) / 5, 110.0])
+    np.testing.assert_allclose(world["tfp"], [(100 + 150 + 800) / 8, 110.0])
+    # the member spelled differently in the data is matched by its spelling key
+    np.testing.assert_allclose(engine.frame("West Africa")["output"], [3.0, 0.0])
+
+
+def test_engine_update_matches_a_fresh_load():
+    engine = _engine(_matrices())
+    assert engine.update(_matrices(peru_tfp=300.0)) == ["Peru"]
+    assert engine.update(_matrices(peru_tfp=300.0)) == []
+    pd.testing.assert_frame_equal(
+        engine.to_frame(), _engine(_matrices(peru_tfp=300.0)).to_frame()
+    )
+
+
+def test_membership_table_is_checked(tmp_path):
+    path = tmp_path / "regions.csv"
+    MEMBERSHIP_DF.drop(columns="Kind").to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        read_membership(path)
+    assert {"region", "income"} <= set(read_membership()["Kind"])
+
+
+def test_world_matches_the_countries(agros):
+    aggregate_df = agros.region_aggregates([WORLD]).set_index("Year")
+    data_df = agros.data_df.astype({"tfp": float, "output_quantity": float})
+    yearly = data_df.groupby("Year")
+    weighted = (data_df["tfp"] * data_df["output_quantity"]).groupby(
+        data_df["Year"]
+    ).sum() / yearly["output_quantity"].sum()
+
+    np.testing.assert_allclose(
+        aggregate_df["output_quantity"], yearly["output_quantity"].sum(), rtol=1e-6
+    )
+    np.testing.assert_allclose(aggregate_df["tfp"], weighted, rtol=1e-6)
+
+
+def test_regions_are_not_countries(agros):
+    regions = agros.list_regions()
+    assert regions[0] == WORLD
+    assert not set(regions) & set(agros.list_countries())
+    assert set(agros.list_regions("income")) <= set(regions)
+    with pytest.raises(ValueError):
+        agros.list_regions("planet")
+    with pytest.raises(ValueError):
+        agros.region_aggregates(["Chile"])
+
+
+def test_changed_countries_are_aggregated_again(agros):
+    path = "downloads/download.csv"
+    data_df = pd.read_csv(path)
+    data_df.loc[data_df["Entity"] == "Chile", "output_quantity"] *= 2
+    data_df.to_csv(path, index=False)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+
+    recorder = Recorder()
+    agros.instrumentation.enable(recorder)
+    agros.download_data()
+    changed = [x["info"] for x in recorder.records if x["stage"] == "aggregate"]
+    assert changed == [{"changed": 1}]
+
+    fresh = Agros()
+    fresh.download_data()
+    pd.testing.assert_frame_equal(agros.region_aggregates(), fresh.region_aggregates())
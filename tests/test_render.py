@@ -0,0 +1,56 @@
+""" Tests of the headless rendering and the LRU image cache. """
+
+import matplotlib.pyplot as plt
+import pytest
+
+from agros_render import RenderCache, freeze, render_figure
+
+
+def test_freeze_is_hashable_and_order_independent():
+    frozen = freeze({"b": [1, {2, 3}], "a": ("x", {"y": 1})})
+    assert hash(frozen) == hash(freeze({"a": ["x", {"y": 1}], "b": (1, {3, 2})}))
+    assert freeze(["Chile", "Peru"]) != freeze(["Peru", "Chile"])
+
+
+def test_cache_drops_least_recently_used():
+    cache = RenderCache(maxsize=2)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.put("c", b"3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+    assert (cache.hits, cache.misses, len(cache)) == (3, 1, 2)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_render_figure_formats():
+    def draw(figure, values, label=None):
+        figure.add_subplot().plot(values, label=label)
+
+    assert render_figure(draw, [1, 2], label="x").startswith(b"\x89PNG")
+    assert b"<svg" in render_figure(draw, [1, 2], fmt="svg")
+
+
+def test_render_is_cached_and_headless(agros):
+    figures = plt.get_fignums()
+    image = agros.render("gapminder", 2000)
+    assert image.startswith(b"\x89PNG")
+    assert agros.render("gapminder", 2000) is image
+    assert agros.render("gapminder", 2000, fmt="svg") is not image
+    assert agros.render_cache.hits == 1
+    assert plt.get_fignums() == figures
+
+
+def test_render_cache_follows_the_data(agros):
+    image = agros.render("area_graph", "Chile", True)
+    agros.download_data(use_cache=False)
+    assert agros.render("area_graph", "Chile", True) is not image
+    assert len(agros.render_cache) == 1
+
+
+def test_render_rejects_unknown_methods(agros):
+    with pytest.raises(ValueError):
+        agros.render("plot")
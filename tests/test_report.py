@@ -0,0 +1,112 @@
+""" Tests of the incremental report pipeline and its fingerprints. """
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from agros_class import Agros
+from agros_report import ReportPipeline, ReportStep
+
+STEPS = [
+    {"method": "area_graph", "args": ["Chile", True]},
+    {"method": "area_graph", "args": ["Spain", True]},
+    {"method": "area_graph", "args": ["World", False]},
+    {"method": "compare_output", "args": ["Peru", "Spain"], "name": "peru_spain"},
+    {"method": "gapminder", "args": [2000]},
+    {"method": "gapminder", "args": [2010], "fmt": "svg"},
+    {"method": "area_graph", "args": ["Atlantis", True]},
+]
+
+
+def _change_chile(year):
+    """Changes the data of Chile in one year and marks the csv as modified."""
+    path = "downloads/download.csv"
+    data_df = pd.read_csv(path)
+    chile = (data_df["Entity"] == "Chile") & (data_df["Year"] == year)
+    data_df.loc[chile, "output_quantity"] *= 3
+    data_df.to_csv(path, index=False)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+
+
+def test_rerun_only_renders_changed_data(agros):
+    summary = agros.report(STEPS, workers=1)
+    names = [ReportStep.from_spec(x).name for x in STEPS]
+    assert summary["ran"] == names[:-1]
+    assert list(summary["failed"]) == ["area_graph_Atlantis_True"]
+    assert os.path.isfile("report/gapminder_2010.svg")
+    with open("report/report.json", encoding="utf-8") as file:
+        assert sorted(json.load(file)) == sorted(names[:-1])
+
+    summary = agros.report(STEPS, workers=1)
+    assert summary["ran"] == [] and summary["skipped"] == names[:-1]
+
+    # the report covers the loaded data until the data is loaded again
+    _change_chile(2010)
+    assert agros.report(STEPS, workers=1)["ran"] == []
+    agros.download_data()
+    summary = agros.report(STEPS, workers=1)
+    assert summary["ran"] == [
+        "area_graph_Chile_True",
+        "area_graph_World_False",
+        "gapminder_2010",
+    ]
+    assert summary["skipped"] == [
+        "area_graph_Spain_True",
+        "peru_spain",
+        "gapminder_2000",
+    ]
+
+
+def test_report_over_a_store(data_folder):
+    agros = Agros()
+    agros.download_data(chunksize=500)
+    store = agros.store
+    steps = [STEPS[0], STEPS[1], STEPS[4]]
+    assert len(agros.report(steps, workers=1)["ran"]) == 3
+    assert agros.store is store and agros.data_df.empty
+    assert agros._panel is None
+
+    _change_chile(2000)
+    agros.download_data(chunksize=500)
+    assert agros.report(steps, workers=1)["ran"] == [
+        "area_graph_Chile_True",
+        "gapminder_2000",
+    ]
+    assert agros.report(steps, workers=1, force=True)["failed"] == {}
+    assert agros.store is not None and agros.data_df.empty
+
+
+def test_report_chunksize_loads_a_store(agros):
+    assert agros.report(STEPS[:1], workers=1, chunksize=700)["failed"] == {}
+    assert agros.store is not None and agros.data_df.empty
+    fresh = Agros()
+    assert fresh.report(STEPS[:1], output_dir="fresh", workers=1)["failed"] == {}
+    assert fresh.store is None and not fresh.data_df.empty
+
+
+def test_force_and_missing_files_rerun(agros):
+    steps = STEPS[:2]
+    agros.report(steps, workers=1)
+    os.remove("report/area_graph_Spain_True.png")
+    assert agros.report(steps, workers=1)["ran"] == ["area_graph_Spain_True"]
+    assert len(agros.report(steps, workers=1, force=True)["ran"]) == 2
+
+
+def test_report_from_json(agros, tmp_path):
+    path = tmp_path / "steps.json"
+    path.write_text(json.dumps([["gapminder", 2000], ["gapminder", 2001]]))
+    summary = agros.report(str(path), output_dir="charts", workers=2)
+    assert summary["ran"] == ["gapminder_2000", "gapminder_2001"]
+    assert os.path.isfile("charts/gapminder_2001.png")
+
+
+def test_invalid_steps(agros):
+    with pytest.raises(ValueError):
+        ReportStep("show")
+    with pytest.raises(ValueError):
+        ReportPipeline(agros, [["gapminder", 2000], ["gapminder", 2000]])
+    assert ReportStep("forecast", [["Chile", "Peru"]]).filename == (
+        "forecast_Chile_Peru.csv"
+    )
@@ -0,0 +1,69 @@
+""" Tests of the asyncio front end of the Agros class. """
+
+import asyncio
+
+import pytest
+
+from agros_service import AgrosService, ServiceBusy
+
+
+def _serve(requests, **options):
+    """Runs the requests of a service inside one event loop."""
+
+    async def run():
+        async with AgrosService(processes=1, **options) as service:
+            return service, await requests(service)
+
+    return asyncio.run(run())
+
+
+def test_identical_requests_are_coalesced(agros):
+    async def requests(service):
+        images = await asyncio.gather(
+            service.render("gapminder", 2000), service.render("gapminder", 2000)
+        )
+        cached = await service.render("gapminder", 2000)
+        return images, cached
+
+    service, (images, cached) = _serve(requests)
+    assert images[0] == images[1] == cached
+    assert images[0].startswith(b"\x89PNG")
+    assert service.stats["coalesced"] == 1 and service.stats["cached"] == 1
+
+
+def test_keyword_arguments_reach_the_worker(agros):
+    async def requests(service):
+        return [
+            await service.render("compare_output", "Chile", "Peru", aggregate=x)
+            for x in (False, True)
+        ]
+
+    _, images = _serve(requests)
+    assert images[0] != images[1]
+    assert images[1] == agros.render("compare_output", "Chile", "Peru", aggregate=True)
+
+
+def test_queries_and_forecasts(agros):
+    async def requests(service):
+        countries = await service.list_countries()
+        forecast_df = await service.forecast(
+            ["Chile"], n_periods=5, engine="statespace"
+        )
+        return countries, forecast_df
+
+    _, (countries, forecast_df) = _serve(requests)
+    assert countries == agros.list_countries()
+    assert forecast_df["Year"].tolist() == list(range(2020, 2025))
+
+
+def test_busy_and_invalid_requests(agros):
+    async def requests(service):
+        with pytest.raises(ValueError):
+            await service.render("plot")
+        with pytest.raises(ServiceBusy):
+            await asyncio.gather(
+                service.render("gapminder", 2001), service.render("gapminder", 2002)
+            )
+
+    service, _ = _serve(requests, max_pending=1)
+    assert service.stats["rejected"] == 1
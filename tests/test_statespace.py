@@ -0,0 +1,95 @@
+""" Tests of the batched state space forecaster against statsmodels. """
+
+import warnings
+
+import numpy as np
+import pytest
+from statsmodels.tsa.statespace.structural import UnobservedComponents
+
+from agros_statespace import fit_statespace
+
+SPECIFICATIONS = {"level": "llevel", "trend": "lltrend"}
+
+
+@pytest.fixture
+def matrix():
+    """Noisy random walks, one with a late start and a gap, and a smooth trend."""
+    generator = np.random.default_rng(3)
+    n_years = 59
+    rows = [
+        100 + np.cumsum(generator.normal(0.5, 1, n_years)),
+        50 + np.cumsum(generator.normal(0, 1, n_years)),
+        20 + np.cumsum(np.linspace(0.2, 1.5, n_years)),
+    ]
+    matrix = np.array(rows) + generator.normal(0, 0.5, (3, n_years))
+    matrix[1, :5] = np.nan
+    matrix[1, 10] = np.nan
+    return matrix
+
+
+def _reference(values, fit, row, model):
+    """Returns the statsmodels results at the fitted variances of a row."""
+    values = values[np.argmax(np.isfinite(values)) :]
+    sigma2 = fit.sigma2[row]
+    params = [sigma2, fit.q_level[row] * sigma2]
+    if model == "trend":
+        params.append(fit.q_slope[row] * sigma2)
+    reference = UnobservedComponents(values, SPECIFICATIONS[model])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return reference, reference.smooth(params)
+
+
+@pytest.mark.parametrize("model", ["level", "trend"])
+def test_likelihood_and_forecast_match_statsmodels(matrix, model):
+    fit = fit_statespace(matrix, model)
+    mean, lower, upper = fit.forecast(5, alpha=0.05)
+    for row, values in enumerate(matrix):
+        reference, result = _reference(values, fit, row, model)
+        forecast = result.get_forecast(5)
+        bounds = forecast.conf_int(alpha=0.05)
+
+        assert fit.loglik[row] == pytest.approx(result.llf, abs=1e-3)
+        np.testing.assert_allclose(mean[row], forecast.predicted_mean, rtol=1e-6)
+        np.testing.assert_allclose(lower[row], bounds[:, 0], rtol=1e-6)
+        np.testing.assert_allclose(upper[row], bounds[:, 1], rtol=1e-6)
+
+        # the grid search comes close to the maximum likelihood of statsmodels
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            best = reference.fit(disp=False).llf
+        assert fit.loglik[row] > best - 0.05
+
+
+def test_auto_picks_the_lower_aic(matrix):
+    fit = fit_statespace(matrix, "auto")
+    trend = fit_statespace(matrix, "trend")
+    assert fit.fitted.all()
+    assert set(fit.model) <= {"level", "trend"}
+    np.testing.assert_allclose(
+        fit.aic, 2 * np.where(fit.model == "trend", 3, 2) - 2 * fit.loglik
+    )
+    # the trend models of auto leave out the same observations as the trend model alone
+    chosen = fit.model == "trend"
+    assert chosen.any() and not chosen.all()
+    np.testing.assert_allclose(fit.loglik[chosen], trend.loglik[chosen])
+    assert np.all(fit.aic <= trend.aic + 1e-9)
+
+
+def test_rows_without_observations_are_not_fitted(matrix):
+    matrix = np.vstack([matrix, np.full(matrix.shape[1], np.nan)])
+    fit = fit_statespace(matrix, "trend")
+    assert fit.fitted.tolist() == [True, True, True, False]
+    assert np.isnan(fit.forecast(3)[0][-1]).all()
+    with pytest.raises(ValueError):
+        fit_statespace(matrix, "arma")
+    with pytest.raises(ValueError):
+        fit_statespace(matrix[0], "level")
+
+
+def test_agros_statespace_forecast(agros):
+    forecast_df = agros.forecast(["Chile", "Spain"], n_periods=10, engine="statespace")
+    assert forecast_df.groupby("Entity").size().to_dict() == {"Chile": 10, "Spain": 10}
+    assert forecast_df["Year"].min() == 2020
+    assert (forecast_df["tfp_lower"] < forecast_df["tfp"]).all()
+    assert (forecast_df["tfp"] < forecast_df["tfp_upper"]).all()